@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import csv
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.graph.checkpoint import open_checkpointer
+from src.graph.runner import make_run_id, run_audit
+from src.graph.workflow import create_graph
+from src.tools.container_pool import get_container_pool
+from src.tools.file_utils import RUNS_DIR
+from src.tools.telemetry import summarize_run, write_metrics_snapshot, METRICS_FILE
+
+RESULT_FIELDS = ["contract", "run_id", "status", "rounds", "duration_s", "llm_s", "compile_s", "execute_s",
+                 "llm_tokens", "stop_reason", "workspace", "resumed", "error"]
+
+
+def default_workers(num_contracts: int) -> int:
+    """并发度 = min(CPU 核数, 宿主机可同时运行的容器数, 合约数)"""
+    cores = os.cpu_count() or 1
+    max_containers = int(os.getenv("MAX_CONTAINERS", str(cores)))
+    return max(1, min(cores, max_containers, num_contracts))
+
+
+async def run_contract(path: str, app) -> dict:
+    """[Worker] 对单个合约跑完整的红蓝对抗，返回结果表中的一行"""
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    return await run_source(os.path.basename(path), source, make_run_id(path, source), app)
+
+
+async def run_source(contract: str, source: str, run_id: str, app, project_dir: str = "",
+                     target_file: str = "Target.sol", skip_finished: bool = True) -> dict:
+    """
+    [Worker] 对一份源码 (或多文件工程中的目标合约) 跑完整的红蓝对抗，返回结果表中的一行
+    skip_finished=False 时丢弃已完成的同名 run 重新运行
+    """
+    row = {"contract": contract, "run_id": run_id}
+    try:
+        # 重新运行同一批合约时，已完成的直接跳过，中断的从断点继续
+        final_state = await run_audit(source, run_id, app=app, skip_finished=skip_finished,
+                                      project_dir=project_dir, target_file=target_file)
+        breakdown = summarize_run(run_id)
+        row.update({
+            "status": final_state["execution_status"],
+            "rounds": final_state["round_count"],
+            "duration_s": round(final_state["duration"], 1),
+            "llm_s": round(breakdown["llm"], 1),
+            "compile_s": round(breakdown["compile"], 1),
+            "execute_s": round(breakdown["execute"], 1),
+            "llm_tokens": final_state.get("llm_tokens", 0),
+            "stop_reason": final_state.get("stop_reason", ""),
+            "workspace": final_state["workspace_dir"],
+            "resumed": final_state["resumed"],
+            "error": "",
+        })
+    except Exception as e:
+        row.update({"status": "crashed", "rounds": "", "duration_s": "", "llm_s": "", "compile_s": "",
+                    "execute_s": "", "llm_tokens": "", "stop_reason": "", "workspace": "", "resumed": "",
+                    "error": str(e)})
+    return row
+
+
+def write_results(rows: list, output_path: str):
+    """写出汇总结果 CSV，并在终端打印一份表格"""
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print("\n| Contract | Status | Rounds | Duration (s) |")
+    print("|---|---|---|---|")
+    for row in rows:
+        print(f"| {row['contract']} | {row['status']} | {row['rounds']} | {row['duration_s']} |")
+    print(f"\n📄 结果已写入: {output_path}")
+
+
+async def run_batch(contracts: list, workers: int) -> list:
+    """
+    [Batch] 所有 run 共享同一个事件循环 (以及同一个 LLM 连接池)，
+    用信号量把同时进行的 run 数限制在 workers 以内
+    """
+    async with open_checkpointer() as saver:
+        app = create_graph(checkpointer=saver)
+        return await _run_all(contracts, workers, app)
+
+
+async def _run_all(contracts: list, workers: int, app) -> list:
+    semaphore = asyncio.Semaphore(workers)
+
+    async def worker(path: str) -> dict:
+        async with semaphore:
+            row = await run_contract(path, app)
+        if row["resumed"] == "finished":
+            print(f"⏭️ [Batch] {row['contract']} 已完成，跳过: {row['status']}")
+        else:
+            print(f"✅ [Batch] {row['contract']} 完成: {row['status']}")
+        return row
+
+    # 编译/测试节点在线程池里执行，线程数与并发度保持一致
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers))
+
+    rows = await asyncio.gather(*(worker(path) for path in contracts))
+    return sorted(rows, key=lambda r: r["contract"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量运行红蓝对抗")
+    parser.add_argument("contracts_dir", help="包含待审计 .sol 合约的目录")
+    parser.add_argument("--workers", type=int, default=0, help="并发运行数 (默认按 CPU 和容器上限自动计算)")
+    parser.add_argument("--output", default=os.path.join(RUNS_DIR, "batch_results.csv"), help="汇总结果 CSV 路径")
+    args = parser.parse_args()
+
+    contracts = sorted(glob.glob(os.path.join(args.contracts_dir, "*.sol")))
+    if not contracts:
+        print(f"❌ 错误：{args.contracts_dir} 下没有 .sol 文件")
+        return
+
+    workers = args.workers or default_workers(len(contracts))
+    print(f"🚀 === 批量对抗启动: {len(contracts)} 个合约, 并发 {workers} === 🚀")
+
+    # 每个 worker 同一时刻最多占用一个容器，容器池按并发度扩容
+    get_container_pool().ensure_capacity(workers)
+
+    started = time.perf_counter()
+    rows = asyncio.run(run_batch(contracts, workers))
+    write_results(rows, args.output)
+    write_metrics_snapshot()
+    print(f"⏱️ 总耗时: {time.perf_counter() - started:.1f}s | Metrics: {METRICS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
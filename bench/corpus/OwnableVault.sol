@@ -0,0 +1,25 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.20;
+
+contract OwnableVault {
+    address public owner;
+
+    constructor() payable {
+        owner = msg.sender;
+    }
+
+    modifier onlyOwner() {
+        require(msg.sender == owner, "not owner");
+        _;
+    }
+
+    function deposit() external payable {}
+
+    function setOwner(address newOwner) external {
+        owner = newOwner;
+    }
+
+    function withdrawAll(address payable to) external onlyOwner {
+        to.transfer(address(this).balance);
+    }
+}
@@ -0,0 +1,19 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.20;
+
+contract TokenBank {
+    mapping(address => uint256) public credits;
+
+    receive() external payable {}
+
+    function depositToken(address token, uint256 amount) external {
+        token.call(abi.encodeWithSignature("transferFrom(address,address,uint256)", msg.sender, address(this), amount));
+        credits[msg.sender] += amount;
+    }
+
+    function redeem(uint256 amount) external {
+        require(credits[msg.sender] >= amount, "insufficient credit");
+        credits[msg.sender] -= amount;
+        payable(msg.sender).transfer(amount);
+    }
+}
@@ -0,0 +1,111 @@
+import glob
+import json
+import os
+import re
+import time
+
+import src.tools.forge_stream as forge_stream
+from src.tools.budget import charge_container
+
+# 纯 Python 的 forge 替身，不需要 Docker，按源码里的标记决定结果:
+# - 含 BENCH_COMPILE_ERROR 的行: 编译失败
+# - 攻击脚本中的 BENCH_EXPLOIT: <类别>: 目标合约中没有对应的 BENCH_PATCHED: <类别> 时攻击成功
+# - 没有 BENCH_EXPLOIT 标记的测试文件 (回归套件中的功能测试) 总是通过
+_EXPLOIT_MARK = re.compile(r"BENCH_EXPLOIT:\s*([\w-]+)")
+_PATCHED_MARK = re.compile(r"BENCH_PATCHED:\s*([\w-]+)")
+_MATCH_PATH = re.compile(r'--match-path "\$PWD/(?:\{([^}]*)\}|([^"]+))"')
+
+
+class FakeForge:
+    """[Bench] 记录调用次数，可模拟每次调用的耗时"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, command: str, workspace_dir: str, on_stdout=None, on_stderr=None, timeout=None,
+                 cancel=None) -> int:
+        self.calls += 1
+        time.sleep(self.latency)
+        charge_container(self.latency)
+        if command.startswith("forge build"):
+            output, code = self._build(workspace_dir)
+        elif command.startswith("forge test"):
+            output, code = self._test(command, workspace_dir)
+        else:
+            if on_stderr:
+                on_stderr(f"fake sandbox: unsupported command: {command}\n".encode())
+            return 127
+        if on_stdout:
+            on_stdout(output.encode("utf-8"))
+        return code
+
+    def _sources(self, workspace_dir: str) -> dict:
+        return {
+            os.path.basename(path): open(path, encoding="utf-8").read()
+            for path in glob.glob(os.path.join(workspace_dir, "*.sol"))
+        }
+
+    def _compile_errors(self, sources: dict) -> list:
+        errors = []
+        for name, source in sorted(sources.items()):
+            for line_no, line in enumerate(source.splitlines(), start=1):
+                if "BENCH_COMPILE_ERROR" in line:
+                    errors.append((name, line_no, line.strip()))
+        return errors
+
+    def _build(self, workspace_dir: str):
+        errors = [
+            {"severity": "error", "type": "TypeError", "message": "Member not found",
+             "formattedMessage": f"TypeError: Member not found.\n --> {name}:{line}:9:\n  | {text}",
+             "sourceLocation": {"file": name, "line": line}}
+            for name, line, text in self._compile_errors(self._sources(workspace_dir))
+        ]
+        return json.dumps({"errors": errors, "sources": {}, "contracts": {}}) + "\n", 1 if errors else 0
+
+    def _test(self, command: str, workspace_dir: str):
+        sources = self._sources(workspace_dir)
+        errors = self._compile_errors(sources)
+        if errors:
+            # forge test 编译失败时只输出 solc 的文本报错
+            text = "Compiler run failed:\n" + "".join(
+                f"Error (9582): Member not found.\n  --> {name}:{line}:9:\n   |\n   | {code}\n\n"
+                for name, line, code in errors
+            )
+            return text, 1
+
+        match = _MATCH_PATH.search(command)
+        if match is None:
+            files = []
+        elif match.group(1):
+            files = match.group(1).split(",")
+        else:
+            files = [match.group(2)]
+        patched = set(_PATCHED_MARK.findall(sources.get("Target.sol", "")))
+
+        suites = {}
+        for name in files:
+            exploit = _EXPLOIT_MARK.search(sources.get(name, ""))
+            success = exploit is None or exploit.group(1) not in patched
+            suites[f"{name}:ExploitTest"] = {
+                "duration": "1ms",
+                "test_results": {
+                    "testExploit()": {
+                        "status": "Success" if success else "Failure",
+                        "reason": None if success else "revert: patched",
+                        "kind": {"Unit": {"gas": 50000}},
+                        "decoded_logs": [],
+                        "traces": [],
+                        "labeled_addresses": {},
+                    }
+                },
+            }
+        failed = any(s["test_results"]["testExploit()"]["status"] != "Success" for s in suites.values())
+        return "Compiling...\n" + json.dumps(suites) + "\n", 1 if failed else 0
+
+
+def install_fake_sandbox(latency: float = 0.0) -> FakeForge:
+    """用 FakeForge 替换 forge 命令的流式执行入口"""
+    fake = FakeForge(latency)
+    forge_stream.stream_in_sandbox = fake
+    return fake
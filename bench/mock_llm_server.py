@@ -0,0 +1,174 @@
+"""
+[Bench] 本地 OpenAI 兼容的 LLM 模拟服务，用于测试 src/llm/router.py 的限流 / 重试 / 对冲
+    python -m bench.mock_llm_server --port 8901 --ttft 0.5 --error-rate 0.2 --slow-rate 0.1
+    LLM_ENDPOINTS='[{"name": "mock-a", "base_url": "http://127.0.0.1:8901/v1", "api_key_env": "MOCK_API_KEY"}]'
+回复内容: --recordings 时按 bench/recordings 回放 (与 stub_llm 相同的识别规则)，否则返回固定的代码块
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_REPLY = "```solidity\n// mock reply\ncontract Mock {}\n```"
+STREAM_CHUNK_CHARS = 64
+
+
+class MockBehavior:
+    """模拟端点的延迟 / 故障特征；计数器线程安全"""
+
+    def __init__(self, ttft: float = 0.0, chunk_delay: float = 0.0, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_factor: float = 10.0, max_concurrency: int = 0,
+                 retry_after: float = 1.0, responder=None, seed: int = None):
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.responder = responder or (lambda prompt: CANNED_REPLY)
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        self.stats = {"requests": 0, "rate_limited": 0, "slow": 0, "completed": 0}
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """返回 (是否放行, 本次的延迟倍数)；超出并发或随机注入错误时拒绝 (429)"""
+        with self._lock:
+            self.stats["requests"] += 1
+            over = self.max_concurrency and self.in_flight >= self.max_concurrency
+            if over or self.random.random() < self.error_rate:
+                self.stats["rate_limited"] += 1
+                return False, 1.0
+            self.in_flight += 1
+            slow = self.random.random() < self.slow_rate
+            if slow:
+                self.stats["slow"] += 1
+            return True, self.slow_factor if slow else 1.0
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["completed"] += 1
+
+
+def _make_handler(behavior: MockBehavior):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict, headers: dict = None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            admitted, factor = behavior.admit()
+            if not admitted:
+                self._send_json(429, {"error": {"message": "rate limited (mock)", "type": "rate_limit_error"}},
+                                {"Retry-After": str(behavior.retry_after)})
+                return
+            try:
+                prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+                text = behavior.responder(prompt)
+                usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4,
+                         "total_tokens": len(prompt) // 4 + len(text) // 4}
+                time.sleep(behavior.ttft * factor)
+                if request.get("stream"):
+                    self._stream(request, text, usage, factor)
+                else:
+                    self._send_json(200, {
+                        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion",
+                        "created": int(time.time()), "model": request.get("model", "mock"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                     "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端提前断开 (提前停止 / 对冲落败被取消)
+            finally:
+                behavior.release()
+
+        def _stream(self, request: dict, text: str, usage: dict, factor: float):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+                    "created": int(time.time()), "model": request.get("model", "mock")}
+
+            def send(payload):
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+            for n, chunk in enumerate(chunks):
+                if n:
+                    time.sleep(behavior.chunk_delay * factor)
+                delta = {"content": chunk} if n else {"role": "assistant", "content": chunk}
+                send(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+            send(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                send(dict(base, choices=[], usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_mock_server(behavior: MockBehavior, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程启动模拟服务 (port=0 时自动分配端口)，返回 server；base_url 为 http://host:port/v1"""
+    server = ThreadingHTTPServer((host, port), _make_handler(behavior))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"mock-llm-{server.server_address[1]}", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容的 LLM 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--ttft", type=float, default=0.2, help="首 token 延迟 (秒)")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="每个块之间的延迟 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 429 的比例")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="慢请求的比例 (延迟乘以 --slow-factor)")
+    parser.add_argument("--slow-factor", type=float, default=10.0)
+    parser.add_argument("--max-concurrency", type=int, default=0, help="超过该并发数返回 429 (0 不限制)")
+    parser.add_argument("--recordings", action="store_true", help="按 bench/recordings 回放红/蓝队回复")
+    args = parser.parse_args()
+
+    responder = None
+    if args.recordings:
+        from bench.stub_llm import Recordings
+        responder = Recordings().respond
+
+    behavior = MockBehavior(args.ttft, args.chunk_delay, args.error_rate, args.slow_rate, args.slow_factor,
+                            args.max_concurrency, responder=responder)
+    server = start_mock_server(behavior, args.host, args.port)
+    print(f"🧪 [Mock LLM] http://{args.host}:{server.server_address[1]}/v1 (Ctrl+C 退出)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"📊 [Mock LLM] {behavior.stats}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+[Bench] 离线端到端基准测试
+    python -m bench.run_bench --mode fake                      # 纯 Python 的 forge 替身，不需要 Docker
+    python -m bench.run_bench --mode docker                    # 真实的 foundry-box 镜像
+    python -m bench.run_bench --mode fake --update-baseline    # 把本次结果写成基线 (fake 模式的基线随仓库提交)
+    python -m bench.run_bench --llm mock --mock-endpoints 2    # LLM 走真实客户端 + router，请求发给本地模拟服务
+LLM 始终由 bench/recordings 中的录制回复代替，不需要 API Key
+"""
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# 以下配置在导入 src 之前设置：关闭会让结果随历史数据变化的功能，缓存放到临时目录
+os.environ.setdefault("LLM_CACHE", "off")
+os.environ.setdefault("EXPLOIT_KB", "0")
+os.environ.setdefault("SLITHER_ENABLED", "0")
+# 录制回复只覆盖 LLM 路径；fake forge 会让没有 BENCH_EXPLOIT 标记的模板攻击总是成功
+os.environ.setdefault("EXPLOIT_TEMPLATES", "0")
+os.environ.setdefault("RECON_CACHE_DIR", tempfile.mkdtemp(prefix="recon-bench-cache-"))
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault("TELEMETRY_DIR", os.path.join(BENCH_DIR, "out"))
+
+from bench.stub_llm import Recordings, install_stub_llm  # noqa: E402
+from bench.fake_sandbox import install_fake_sandbox  # noqa: E402
+from bench.mock_llm_server import MockBehavior, start_mock_server  # noqa: E402
+from src.llm.router import configure_router  # noqa: E402
+from src.graph.runner import run_audit  # noqa: E402
+from src.graph.workflow import create_graph  # noqa: E402
+from src.tools.docker_runner import get_compile_cache  # noqa: E402
+from src.tools.file_utils import RUNS_DIR  # noqa: E402
+from src.tools.telemetry import get_run_spans, TELEMETRY_DIR  # noqa: E402
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+SANDBOX_SPANS = ("sandbox.compile", "sandbox.test", "sandbox.slither")
+
+
+def percentile(values: list, pct: float) -> float:
+    """nearest-rank 百分位"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_metrics(run_id: str, final_state: dict) -> dict:
+    """从一次 run 的 span 中提取基准指标"""
+    spans = get_run_spans(run_id)
+    red_attempts = 0
+    rounds_to_exploit = None
+    for s in sorted(spans, key=lambda s: s["start"]):
+        if s["name"] == "node.red_agent" and rounds_to_exploit is None:
+            red_attempts += 1
+        if s["name"] == "node.sandbox" and s["attrs"].get("status") == "success" and rounds_to_exploit is None:
+            rounds_to_exploit = s.get("round")
+
+    return {
+        "status": final_state["execution_status"],
+        "rounds": final_state["round_count"],
+        "rounds_to_exploit": rounds_to_exploit,
+        "red_attempts_to_exploit": red_attempts if rounds_to_exploit is not None else None,
+        "container_calls": sum(1 for s in spans if s["name"] in SANDBOX_SPANS),
+        "llm_calls": sum(1 for s in spans if s["name"] == "llm.call"),
+        "llm_tokens": sum((s["attrs"].get("input_tokens") or 0) + (s["attrs"].get("output_tokens") or 0)
+                          for s in spans if s["name"] == "llm.call"),
+        "wall_s": final_state["duration"],
+        "nodes": {
+            name: [s["duration"] for s in spans if s["name"] == f"node.{name}"]
+            for name in {s["name"][5:] for s in spans if s["name"].startswith("node.")}
+        },
+    }
+
+
+async def run_corpus(contracts: list, recordings: Recordings, repeat: int) -> list:
+    app = create_graph()
+    samples = []
+    for i in range(repeat):
+        for path in contracts:
+            name = os.path.splitext(os.path.basename(path))[0]
+            with open(path, "r", encoding="utf-8") as f:
+                source = f.read()
+
+            # 每次都从冷状态开始：清空编译缓存和 run 目录，录制回复从头播放
+            run_id = f"bench-{name}-{i}"
+            shutil.rmtree(os.path.join(RUNS_DIR, run_id), ignore_errors=True)
+            get_compile_cache().clear()
+            recordings.reset()
+
+            final_state = await run_audit(source, run_id, app=app)
+            metrics = run_metrics(run_id, final_state)
+            metrics.update(contract=name, iteration=i)
+            samples.append(metrics)
+            print(f"🏁 [Bench] {name} #{i}: {metrics['status']} | 轮次 {metrics['rounds']} | "
+                  f"容器调用 {metrics['container_calls']} | {metrics['wall_s']:.2f}s")
+    return samples
+
+
+def aggregate(samples: list, mode: str) -> dict:
+    contracts = {}
+    nodes = {}
+    for sample in samples:
+        entry = contracts.setdefault(sample["contract"], {"wall_s": []})
+        for key in ("status", "rounds", "rounds_to_exploit", "red_attempts_to_exploit",
+                    "container_calls", "llm_calls", "llm_tokens"):
+            entry[key] = sample[key]  # 计数类指标在离线回放中是确定的
+        entry["wall_s"].append(sample["wall_s"])
+        for name, durations in sample["nodes"].items():
+            nodes.setdefault(name, []).extend(durations)
+
+    for entry in contracts.values():
+        entry["wall_p50"] = percentile(entry.pop("wall_s"), 50)
+
+    return {
+        "mode": mode,
+        "samples": len(samples),
+        "contracts": contracts,
+        "wall_p50_total": sum(e["wall_p50"] for e in contracts.values()),
+        "nodes": {
+            name: {"count": len(d), "p50": percentile(d, 50), "p95": percentile(d, 95)}
+            for name, d in sorted(nodes.items())
+        },
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float, slack: float) -> list:
+    """
+    返回所有超出基线的指标；计数类指标不允许变差，tokens 和耗时允许 tolerance 比例 (耗时再加 slack 秒) 的波动
+    调用过 LLM 却没有记到 tokens 说明 token 记账失效，直接判定失败
+    """
+    regressions = []
+
+    def slower(label: str, now: float, base: float):
+        limit = base * (1 + tolerance) + slack
+        if now > limit:
+            regressions.append(f"{label}: {now:.3f}s > 基线 {base:.3f}s (上限 {limit:.3f}s)")
+
+    for name, base in baseline["contracts"].items():
+        now = result["contracts"].get(name)
+        if now is None:
+            continue  # 本次没有运行该合约 (--contracts 过滤)
+        if now["status"] != base["status"]:
+            regressions.append(f"{name}.status: {now['status']} != 基线 {base['status']}")
+        for key in ("rounds_to_exploit", "red_attempts_to_exploit", "container_calls", "llm_calls"):
+            if base.get(key) is None:
+                continue
+            if now.get(key) is None or now[key] > base[key]:
+                regressions.append(f"{name}.{key}: {now.get(key)} > 基线 {base[key]}")
+        if now["llm_calls"] and not now["llm_tokens"]:
+            regressions.append(f"{name}.llm_tokens: {now['llm_calls']} 次 LLM 调用却没有记到 tokens")
+        if base.get("llm_tokens") and now["llm_tokens"] > base["llm_tokens"] * (1 + tolerance):
+            regressions.append(f"{name}.llm_tokens: {now['llm_tokens']} > 基线 {base['llm_tokens']} "
+                               f"(上限 {base['llm_tokens'] * (1 + tolerance):.0f})")
+        slower(f"{name}.wall_p50", now["wall_p50"], base["wall_p50"])
+
+    for name, base in baseline["nodes"].items():
+        now = result["nodes"].get(name)
+        if now is None:
+            continue
+        slower(f"node.{name}.p50", now["p50"], base["p50"])
+        slower(f"node.{name}.p95", now["p95"], base["p95"])
+    return regressions
+
+
+def print_report(result: dict):
+    print("\n| Contract | Status | Rounds | Rounds to exploit | Container calls | LLM calls | LLM tokens | Wall p50 (s) |")
+    print("|---|---|---|---|---|---|---|---|")
+    for name, c in sorted(result["contracts"].items()):
+        print(f"| {name} | {c['status']} | {c['rounds']} | {c['rounds_to_exploit']} | "
+              f"{c['container_calls']} | {c['llm_calls']} | {c['llm_tokens']} | {c['wall_p50']:.3f} |")
+    print("\n| Node | Count | p50 (s) | p95 (s) |")
+    print("|---|---|---|---|")
+    for name, n in result["nodes"].items():
+        print(f"| {name} | {n['count']} | {n['p50']:.4f} | {n['p95']:.4f} |")
+
+
+def start_mock_endpoints(recordings: Recordings, count: int, ttft: float, chunk_delay: float,
+                         error_rate: float, slow_rate: float) -> list:
+    """启动 count 个本地模拟服务，并把 router 指向它们"""
+    os.environ.setdefault("MOCK_API_KEY", "mock")
+    entries = []
+    for i in range(count):
+        behavior = MockBehavior(ttft, chunk_delay, error_rate, slow_rate, responder=recordings.respond, seed=i)
+        server = start_mock_server(behavior)
+        entries.append({"name": f"mock-{i}", "base_url": f"http://127.0.0.1:{server.server_address[1]}/v1",
+                        "api_key_env": "MOCK_API_KEY", "model": "bench-mock"})
+    configure_router(entries)
+    return entries
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="离线端到端基准测试")
+    parser.add_argument("--mode", choices=["fake", "docker"], default="fake",
+                        help="fake: 纯 Python 的 forge 替身; docker: 真实的 foundry-box 镜像")
+    parser.add_argument("--repeat", type=int, default=3, help="每个合约重复运行的次数")
+    parser.add_argument("--contracts", nargs="*", help="只运行指定的合约 (文件名去掉 .sol)")
+    parser.add_argument("--llm-ttft", type=float, default=0.0, help="桩 LLM 的首 token 延迟 (秒)")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.0, help="桩 LLM 每个块之间的延迟 (秒)")
+    parser.add_argument("--sandbox-latency", type=float, default=0.0, help="fake 模式下每次 forge 调用的耗时 (秒)")
+    parser.add_argument("--llm", choices=["stub", "mock"], default="stub",
+                        help="stub: 直接替换 get_llm(); mock: 经过 router 和 HTTP 请求本地模拟服务 (不要同时开启 LLM_HEDGE，"
+                             "对冲请求会多消耗录制回复)")
+    parser.add_argument("--mock-endpoints", type=int, default=2, help="mock 模式下的模拟端点个数")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="mock 模式下随机返回 429 的比例")
+    parser.add_argument("--mock-slow-rate", type=float, default=0.0, help="mock 模式下慢请求的比例")
+    parser.add_argument("--baseline", help="基线文件 (默认 bench/baselines/<mode>.json)")
+    parser.add_argument("--update-baseline", action="store_true", help="把本次结果写成新的基线")
+    parser.add_argument("--allow-missing-baseline", action="store_true",
+                        help="基线文件不存在时只输出结果，不判定失败 (例如首次在新环境运行 docker 模式)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="耗时指标允许的相对波动")
+    parser.add_argument("--slack", type=float, default=0.05, help="耗时指标允许的绝对波动 (秒)")
+    args = parser.parse_args()
+
+    contracts = sorted(glob.glob(os.path.join(CORPUS_DIR, "*.sol")))
+    if args.contracts:
+        contracts = [p for p in contracts if os.path.splitext(os.path.basename(p))[0] in args.contracts]
+    if not contracts:
+        print("❌ 错误：没有可运行的合约")
+        return 1
+
+    recordings = Recordings()
+    if args.llm == "mock":
+        start_mock_endpoints(recordings, args.mock_endpoints, args.llm_ttft, args.llm_chunk_delay,
+                             args.mock_error_rate, args.mock_slow_rate)
+    else:
+        install_stub_llm(recordings, args.llm_ttft, args.llm_chunk_delay)
+    if args.mode == "fake":
+        install_fake_sandbox(args.sandbox_latency)
+
+    print(f"🚀 === Bench ({args.mode}): {len(contracts)} 个合约 x {args.repeat} 次 === 🚀")
+    started = time.perf_counter()
+    samples = asyncio.run(run_corpus(contracts, recordings, args.repeat))
+    result = aggregate(samples, args.mode)
+    print_report(result)
+    print(f"\n⏱️ 总耗时: {time.perf_counter() - started:.1f}s")
+
+    os.makedirs(TELEMETRY_DIR, exist_ok=True)
+    result_path = os.path.join(TELEMETRY_DIR, f"bench-{args.mode}.json")
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"📄 结果已写入: {result_path}")
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{args.mode}.json")
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"💾 基线已更新: {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        if args.allow_missing_baseline:
+            print(f"⚠️ 没有基线文件 {baseline_path}，跳过对比 (--allow-missing-baseline)")
+            return 0
+        print(f"❌ 没有基线文件 {baseline_path}，使用 --update-baseline 生成")
+        return 1
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(result, baseline, args.tolerance, args.slack)
+    if regressions:
+        print("❌ 性能回退:")
+        for line in regressions:
+            print(f"   - {line}")
+        return 1
+    print("✅ 未超出基线")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import asyncio
+import glob
+import os
+import re
+from types import SimpleNamespace
+
+import src.llm.client as llm_client
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+STREAM_CHUNK_CHARS = 64
+
+
+class Recordings:
+    """
+    [Bench] 录制好的红/蓝队回复: recordings/<合约名>/red_<n>.md, blue_<n>.md
+    每个合约每个角色按调用顺序依次返回，用完后重复最后一条
+    """
+
+    def __init__(self, root: str = RECORDINGS_DIR):
+        self.responses = {}
+        for contract_dir in sorted(glob.glob(os.path.join(root, "*"))):
+            contract = os.path.basename(contract_dir)
+            for role in ("red", "blue"):
+                files = sorted(glob.glob(os.path.join(contract_dir, f"{role}_*.md")),
+                               key=lambda p: int(re.search(r"_(\d+)\.md$", p).group(1)))
+                self.responses[(contract, role)] = [open(f, encoding="utf-8").read() for f in files]
+        self._counters = {}
+
+    def contracts(self) -> list:
+        return sorted({contract for contract, _ in self.responses})
+
+    def reset(self):
+        self._counters = {}
+
+    def respond(self, prompt_text: str) -> str:
+        if "智能合约黑客" in prompt_text:
+            role = "red"
+        elif "安全专家" in prompt_text:
+            role = "blue"
+        else:
+            raise ValueError("❌ [Bench] 无法识别的 prompt (既不是红队也不是蓝队)")
+
+        contract = next((c for c in self.contracts() if re.search(rf"\bcontract\s+{c}\b", prompt_text)), None)
+        responses = self.responses.get((contract, role))
+        if not responses:
+            raise KeyError(f"❌ [Bench] 没有 {contract} 的 {role} 录制回复")
+
+        index = self._counters.get((contract, role), 0)
+        self._counters[(contract, role)] = index + 1
+        return responses[min(index, len(responses) - 1)]
+
+
+class RecordedLLM:
+    """[Bench] 替代 ChatOpenAI 的桩：按块流式返回录制的回复，可模拟首 token 延迟和生成速度"""
+
+    model_name = "bench-stub"
+
+    def __init__(self, recordings: Recordings, ttft: float = 0.0, chunk_delay: float = 0.0):
+        self.recordings = recordings
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+
+    async def astream(self, messages):
+        prompt_text = "\n".join(str(m.content) for m in messages)
+        text = self.recordings.respond(prompt_text)
+
+        await asyncio.sleep(self.ttft)
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        for n, chunk in enumerate(chunks):
+            if n:
+                await asyncio.sleep(self.chunk_delay)
+            yield SimpleNamespace(content=chunk, usage_metadata=None)
+        # 和真实的流一样 usage 只在最后一块：提前停止的调用收不到它，客户端按字符数估算 tokens
+        yield SimpleNamespace(content="", usage_metadata={"input_tokens": len(prompt_text) // 4,
+                                                          "output_tokens": len(text) // 4})
+
+
+def install_stub_llm(recordings: Recordings, ttft: float = 0.0, chunk_delay: float = 0.0) -> RecordedLLM:
+    """用录制回复替换 get_llm()，不再需要 API Key 和网络"""
+    stub = RecordedLLM(recordings, ttft, chunk_delay)
+    llm_client.get_llm = lambda temperature=0.1, endpoint=None: stub
+    return stub
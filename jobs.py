@@ -0,0 +1,213 @@
+"""
+[Queue] 基于 SQLite 任务表的分布式批量运行
+    python jobs.py submit contracts/ --priority 5                  # 提交目录下所有 .sol (或单个文件)
+    python jobs.py submit --project ./audit --target Vault         # 提交多文件工程中的目标合约
+    python jobs.py submit contracts/Bank.sol --resubmit            # 已结束的合约重新排队，丢弃上次的结果重新运行
+    python jobs.py worker --concurrency 4                          # 领取任务运行红蓝对抗，写回结果
+    python jobs.py status                                          # 各状态任务数 / 平均耗时 / 吞吐量
+    python jobs.py export --output results.csv                     # 导出结果和每个任务的计时
+多台机器共享同一个队列时，用 --db (或 JOB_QUEUE_DB) 指向共享目录上的数据库；工程目录也需要在各机器上路径一致
+"""
+import argparse
+import asyncio
+import csv
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import RESULT_FIELDS, default_workers, run_source
+from src.graph.checkpoint import open_checkpointer
+from src.graph.runner import make_run_id
+from src.graph.workflow import create_graph
+from src.tools.container_pool import get_container_pool
+from src.tools.file_utils import RUNS_DIR, read_from_workspace
+from src.tools.job_queue import JobQueue, JOB_QUEUE_DB, JOB_HEARTBEAT, JOB_MAX_ATTEMPTS, DONE, FAILED, worker_name
+from src.tools.project_loader import resolve_target
+from src.tools.telemetry import write_metrics_snapshot, METRICS_FILE
+
+JOB_FIELDS = ["job_id", "priority", "attempts", "worker", "wait_s", "run_s"] + RESULT_FIELDS
+# worker 空闲时轮询队列的间隔 (秒)
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+
+
+def submit(args) -> int:
+    queue = JobQueue(args.db)
+    jobs = []
+    if args.project:
+        if not args.target:
+            print("❌ 错误：--project 需要同时指定 --target")
+            return 1
+        project_dir = os.path.abspath(args.project)
+        target_file = resolve_target(project_dir, args.target)
+        if not target_file:
+            print(f"❌ 错误：工程中没有找到 {args.target}")
+            return 1
+        source = read_from_workspace(target_file, project_dir)
+        jobs.append((os.path.basename(target_file), source, make_run_id(target_file, source),
+                     project_dir, target_file))
+    for path in args.paths:
+        files = sorted(glob.glob(os.path.join(path, "*.sol"))) if os.path.isdir(path) else [path]
+        for file in files:
+            with open(file, "r", encoding="utf-8") as f:
+                source = f.read()
+            jobs.append((os.path.basename(file), source, make_run_id(file, source), "", "Target.sol"))
+    if not jobs:
+        print("❌ 错误：没有可提交的合约")
+        return 1
+
+    added = 0
+    for contract, source, run_id, project_dir, target_file in jobs:
+        added += queue.submit(contract, source, run_id, args.priority, project_dir, target_file,
+                              args.max_attempts, args.resubmit)
+    print(f"📥 [Queue] 提交 {added} 个任务 ({len(jobs) - added} 个已在队列中) -> {args.db}")
+    return 0
+
+
+async def run_job(queue: JobQueue, job: dict, worker: str, app):
+    """运行一个任务；运行期间后台续约，结束后写回结果 (崩溃的任务按重试策略重新排队)"""
+    stop = asyncio.Event()
+
+    async def keep_alive():
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), JOB_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if not await asyncio.to_thread(queue.heartbeat, job["id"], worker):
+                    print(f"⚠️ [Queue] 任务 {job['id']} 的租约已被其他 worker 接手，本次结果不会写回")
+                    return
+
+    heartbeat = asyncio.create_task(keep_alive())
+    try:
+        # 同一个 run_id 已完成的 checkpoint 默认直接复用；--resubmit 重新排队的任务要求重新运行
+        row = await run_source(job["contract"], job["source"], job["run_id"], app,
+                               job["project_dir"], job["target_file"], skip_finished=not job["rerun"])
+    finally:
+        stop.set()
+        await heartbeat
+
+    if row["status"] == "crashed":
+        status = await asyncio.to_thread(queue.fail, job["id"], worker, row["error"])
+        print(f"💥 [Queue] 任务 {job['id']} ({job['contract']}) 第 {job['attempts']} 次运行崩溃: "
+              f"{row['error']} -> {status}")
+    elif await asyncio.to_thread(queue.complete, job["id"], worker, row):
+        print(f"✅ [Queue] 任务 {job['id']} ({job['contract']}) 完成: {row['status']}")
+
+
+async def run_worker(queue: JobQueue, concurrency: int, exit_when_idle: bool) -> int:
+    """
+    [Worker] 同一进程内 concurrency 个槽位各自领取任务，共享事件循环、LLM 连接池和 checkpointer
+    多台机器 / 多个进程各自运行 worker 即可横向扩展；exit_when_idle 时队列中没有未结束的任务后退出
+    """
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    name = worker_name()
+
+    async with open_checkpointer() as saver:
+        app = create_graph(checkpointer=saver)
+
+        async def slot(index: int) -> int:
+            worker = f"{name}#{index}"
+            finished = 0
+            while True:
+                job = await asyncio.to_thread(queue.claim, worker)
+                if job is None:
+                    # 其他 worker 上仍在运行的任务可能失败后重新排队，队列完全结束才退出
+                    if exit_when_idle and await asyncio.to_thread(queue.pending) == 0:
+                        return finished
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+                print(f"🏗️ [Queue] {worker} 领取任务 {job['id']} ({job['contract']}, 优先级 {job['priority']}, "
+                      f"第 {job['attempts']} 次)")
+                await run_job(queue, job, worker, app)
+                finished += 1
+
+        return sum(await asyncio.gather(*(slot(i) for i in range(concurrency))))
+
+
+def worker(args) -> int:
+    concurrency = args.concurrency or default_workers(os.cpu_count() or 1)
+    print(f"🚀 === Worker {worker_name()} 启动: 并发 {concurrency}, 队列 {args.db} === 🚀")
+    # 每个槽位同一时刻最多占用一个容器，容器池按并发度扩容
+    get_container_pool().ensure_capacity(concurrency)
+
+    started = time.perf_counter()
+    finished = asyncio.run(run_worker(JobQueue(args.db), concurrency, args.exit_when_idle))
+    write_metrics_snapshot()
+    print(f"⏱️ [Queue] 完成 {finished} 个任务, 总耗时 {time.perf_counter() - started:.1f}s | Metrics: {METRICS_FILE}")
+    return 0
+
+
+def status(args) -> int:
+    queue = JobQueue(args.db)
+    stats = queue.stats()
+    counts = stats["counts"]
+    print(f"📊 [Queue] 排队 {counts['queued']} / 运行 {counts['running']} / 完成 {counts['done']} / "
+          f"失败 {counts['failed']}")
+    print(f"⏱️ 平均排队 {stats['avg_wait_s']:.1f}s, 平均运行 {stats['avg_run_s']:.1f}s, "
+          f"最近一小时吞吐 {stats['throughput_per_hour']} 个/小时")
+    for name, count in sorted(stats["per_worker"].items()):
+        print(f"   - {name}: {count}")
+    if args.jobs:
+        print("\n| ID | Contract | Status | Priority | Attempts | Worker | Run (s) |")
+        print("|---|---|---|---|---|---|---|")
+        for job in queue.jobs():
+            run_s = f"{job['run_s']:.1f}" if job["run_s"] is not None else ""
+            print(f"| {job['id']} | {job['contract']} | {job['result'].get('status') or job['status']} | "
+                  f"{job['priority']} | {job['attempts']} | {job['worker']} | {run_s} |")
+    return 0
+
+
+def export(args) -> int:
+    """导出所有已结束任务的结果表，附带排队 / 运行时间"""
+    rows = []
+    for job in JobQueue(args.db).jobs():
+        if job["status"] not in (DONE, FAILED):
+            continue
+        row = {field: "" for field in JOB_FIELDS}
+        row.update(job["result"])
+        row.update({"job_id": job["id"], "priority": job["priority"], "attempts": job["attempts"],
+                    "worker": job["worker"], "contract": job["contract"], "run_id": job["run_id"],
+                    "wait_s": round(job["wait_s"] or 0, 1), "run_s": round(job["run_s"] or 0, 1)})
+        if job["status"] == FAILED:
+            row.update(status="crashed", error=job["error"])
+        rows.append(row)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=JOB_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"📄 [Queue] {len(rows)} 条结果已写入: {args.output}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="红蓝对抗任务队列")
+    parser.add_argument("--db", default=JOB_QUEUE_DB, help="队列数据库路径 (多台机器共享时放在共享目录)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = sub.add_parser("submit", help="提交合约")
+    submit_parser.add_argument("paths", nargs="*", help=".sol 文件或包含 .sol 的目录")
+    submit_parser.add_argument("--project", metavar="DIR", help="多文件 Foundry / Hardhat 工程的根目录")
+    submit_parser.add_argument("--target", help="与 --project 一起使用：目标合约的相对路径或合约名")
+    submit_parser.add_argument("--priority", type=int, default=0, help="数值越大越先运行")
+    submit_parser.add_argument("--max-attempts", type=int, default=JOB_MAX_ATTEMPTS, help="崩溃后最多重试到第几次")
+    submit_parser.add_argument("--resubmit", action="store_true", help="已结束的同一合约重新排队并重新运行 (不复用上次的结果)")
+
+    worker_parser = sub.add_parser("worker", help="领取并运行任务")
+    worker_parser.add_argument("--concurrency", type=int, default=0, help="同时运行的任务数 (默认按 CPU 和容器上限)")
+    worker_parser.add_argument("--exit-when-idle", action="store_true", help="队列中所有任务结束后退出")
+
+    status_parser = sub.add_parser("status", help="查看队列状态")
+    status_parser.add_argument("--jobs", action="store_true", help="同时列出所有任务")
+
+    export_parser = sub.add_parser("export", help="导出结果 CSV")
+    export_parser.add_argument("--output", default=os.path.join(RUNS_DIR, "job_results.csv"))
+
+    args = parser.parse_args()
+    return {"submit": submit, "worker": worker, "status": status, "export": export}[args.command](args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
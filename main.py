@@ -1,33 +1,72 @@
+import argparse
+import asyncio
+import os
+
+from src.graph.checkpoint import open_checkpointer
+from src.graph.history import get_history
+from src.graph.runner import make_run_id, run_audit
 from src.graph.workflow import create_graph
 from src.tools.file_utils import read_from_workspace
+from src.tools.project_loader import resolve_target
+from src.tools.docker_runner import get_compile_cache
+from src.llm.client import get_llm_call_log
+from src.llm.router import get_router
+from src.llm.cache import get_llm_cache_stats
+from src.tools.budget import BUDGET_EXHAUSTED, format_usage
+from src.tools.telemetry import summarize_run, format_breakdown, write_metrics_snapshot, TRACE_FILE, METRICS_FILE
 
 
-def main():
-    print("🚀 === 区块链红蓝对抗系统启动 === 🚀")
+async def run_with_checkpoints(target_source: str, run_id: str, project_dir: str = "",
+                               target_file: str = "Target.sol") -> dict:
+    """打开 checkpointer 后运行；同一 run_id 有未完成的记录时从断点继续"""
+    async with open_checkpointer() as saver:
+        app = create_graph(checkpointer=saver)
+        return await run_audit(target_source, run_id, app=app, project_dir=project_dir, target_file=target_file)
 
-    # 1. 读取初始目标合约
-    initial_contract = read_from_workspace("Target.sol")
-    if not initial_contract:
-        print("❌ 错误：未找到 workspace/Target.sol")
-        return
 
-    # 2. 初始化状态 (适配新的 AgentState 定义)
-    initial_state = {
-        "target_source": initial_contract,
-        "exploit_source": "",
-        "test_logs": "",
-        "execution_status": "unknown",  # === 修改点：初始状态 ===
-        "round_count": 1
-    }
+def main():
+    parser = argparse.ArgumentParser(description="区块链红蓝对抗")
+    parser.add_argument("--resume", metavar="RUN_ID", help="从 checkpoint 恢复指定的 run (不读取 workspace/Target.sol)")
+    parser.add_argument("--project", metavar="DIR", help="多文件 Foundry / Hardhat 工程的根目录")
+    parser.add_argument("--target", help="与 --project 一起使用：目标合约的相对路径或合约名")
+    args = parser.parse_args()
+
+    print("🚀 === 区块链红蓝对抗系统启动 === 🚀")
 
-    # 3. 创建并运行图
-    app = create_graph()
+    project_dir, target_file = "", "Target.sol"
+    if args.resume:
+        initial_contract = None
+        run_id = args.resume
+    elif args.project:
+        if not args.target:
+            print("❌ 错误：--project 需要同时指定 --target")
+            return
+        project_dir = os.path.abspath(args.project)
+        target_file = resolve_target(project_dir, args.target)
+        if not target_file:
+            print(f"❌ 错误：工程中没有找到 {args.target}")
+            return
+        initial_contract = read_from_workspace(target_file, project_dir)
+        run_id = make_run_id(target_file, initial_contract)
+    else:
+        # 1. 读取初始目标合约
+        initial_contract = read_from_workspace("Target.sol")
+        if not initial_contract:
+            print("❌ 错误：未找到 workspace/Target.sol")
+            return
+        run_id = make_run_id("Target.sol", initial_contract)
 
-    # 运行流
-    final_state = app.invoke(initial_state, config={"recursion_limit": 15})
+    # 2. 在独立的 run workspace 中创建并运行图
+    print(f"📁 Run ID: {run_id}")
+    try:
+        final_state = asyncio.run(run_with_checkpoints(initial_contract, run_id, project_dir, target_file))
+    except ValueError as e:
+        print(e)
+        return
 
     print("\n🏁 === 对抗结束 ===")
     print(f"最终轮次: {final_state['round_count']}")
+    print(f"资源消耗: {format_usage(final_state)}")
 
     # === 修改点：根据字符串状态打印结果 ===
     status = final_state['execution_status']
@@ -36,11 +75,42 @@ def main():
         print("🏆 最终结果: 合约安全 (红队攻击失败)")
     elif status == "success":
         print("❌ 最终结果: 合约仍不安全 (红队攻击成功)")
+    elif status == BUDGET_EXHAUSTED:
+        print(f"⏹️ 最终结果: 预算耗尽，提前结束 (原因: {final_state['stop_reason']})")
     else:
         print(f"⚠️ 最终结果: 异常结束 (状态: {status})")
 
+    calls = get_llm_call_log()
+    if calls:
+        total = sum(c["latency"] for c in calls)
+        print(f"🤖 LLM 调用 {len(calls)} 次, 总耗时 {total:.1f}s, "
+              f"提前停止 {sum(1 for c in calls if c['early_stopped'])} 次")
+        endpoints = get_router().stats()
+        if len(endpoints) > 1:
+            for name, st in endpoints.items():
+                print(f"   - {name}: 成功 {st['calls']} / 出错 {st['errors']} / 对冲 {st['hedges']} "
+                      f"(胜出 {st['hedge_wins']})")
+
+    llm_stats = get_llm_cache_stats()
+    if llm_stats:
+        print(f"🗄️ LLM 响应缓存: 命中 {llm_stats['hits']} / 未命中 {llm_stats['misses']} "
+              f"(命中率 {llm_stats['hit_rate']:.0%})")
+
+    stats = get_compile_cache().stats()
+    print(f"🗄️ 编译缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} (命中率 {stats['hit_rate']:.0%})")
+
+    history = get_history().stats(run_id)
+    if history["objects"]:
+        print(f"📚 轮次历史: {history['objects']} 个版本, 原始 {history['size'] / 1024:.1f} KB, "
+              f"实际存储 {history['stored'] / 1024:.1f} KB")
+
+    print("\n" + format_breakdown(summarize_run(run_id), final_state["duration"]))
+    write_metrics_snapshot()
+    print(f"📈 Trace: {TRACE_FILE} | Metrics: {METRICS_FILE}")
+
     if status == "failed":
-        print("\n💾 最终安全的合约代码已保留在 workspace/Target.sol (内存中)")
+        print(f"\n💾 最终安全的合约代码已保留在 {final_state['workspace_dir']}/"
+              f"{final_state.get('target_file') or 'Target.sol'}")
 
 
 if __name__ == "__main__":
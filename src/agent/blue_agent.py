@@ -1,18 +1,28 @@
+import os
 from langchain_core.prompts import ChatPromptTemplate
-from src.llm.client import get_llm
+from src.llm.client import astream_completion
 from src.agent.red_agent import extract_code
+from src.agent.context_builder import build_target_context
+from src.tools.patch_utils import apply_unified_diff, PatchApplyError
+from src.tools.trace_summary import truncate_logs
 
 CODE_MARK = "```"
 
+# diff: 只发送与攻击相关的合约片段，要求输出 unified diff，本地应用；失败时退回 full
+# full: 发送完整合约，要求输出完整的修复后合约
+BLUE_PATCH_FORMAT = os.getenv("BLUE_PATCH_FORMAT", "diff")
+MAX_LOG_CHARS = int(os.getenv("BLUE_MAX_LOG_CHARS", "3000"))
 
-def blue_team_patch(original_code: str, exploit_code: str, test_logs: str, feedback: str = "") -> str:
-    llm = get_llm()
+
+def _build_prompt(patch_format: str, has_feedback: bool, has_slither: bool,
+                  has_examples: bool = False) -> ChatPromptTemplate:
+    code_title = "=== 原始合约 (仅包含与攻击路径相关的部分) ===\n" if patch_format == "diff" else "=== 原始合约 ===\n"
 
     # 1. 基础模板
     template = (
             "你是一个资深的区块链安全专家。\n"
-            "刚才红队成功攻破了你的合约，你需要立即修复它。\n\n"
-            "=== 原始合约 ===\n" +
+            "刚才红队成功攻破了你的合约，你需要立即修复它。\n\n" +
+            code_title +
             CODE_MARK + "solidity\n"
                         "{original_code}\n" +
             CODE_MARK + "\n\n"
@@ -20,12 +30,20 @@ def blue_team_patch(original_code: str, exploit_code: str, test_logs: str, feedb
             CODE_MARK + "solidity\n"
                         "{exploit_code}\n" +
             CODE_MARK + "\n\n"
-                        "=== 攻击执行日志 (Foundry Output) ===\n"
+                        "=== 攻击执行摘要 (Foundry Output) ===\n"
                         "{test_logs}\n\n"
     )
 
+    # 静态分析报告 (后台 Slither 扫描完成时才有)
+    if has_slither:
+        template += "=== 静态分析报告 (Slither) ===\n{slither_report}\n\n"
+
+    # 知识库中相似漏洞的历史修复 (few-shot)
+    if has_examples:
+        template += "=== 相似漏洞的历史修复补丁 (仅供参考) ===\n{kb_examples}\n"
+
     # 2. 如果有编译器反馈（Checker 报错）
-    if feedback:
+    if has_feedback:
         template += (
             "⚠️ 注意：你上一次生成的修复代码无法通过编译！报错如下：\n"
             "{compiler_feedback}\n"
@@ -38,28 +56,51 @@ def blue_team_patch(original_code: str, exploit_code: str, test_logs: str, feedb
         "1. **核心原则**：只修复漏洞，绝对不要破坏原有的业务逻辑（存款/取款功能必须保留且可用）。\n"
         "2. 分析攻击脚本是利用了什么漏洞（如 Reentrancy, Overflow, Access Control）。\n"
         "3. 应用最佳实践进行修复（如使用 Check-Effects-Interactions 模式，或添加 `ReentrancyGuard`）。\n"
-        "4. 直接输出完整的、修复后的合约代码。\n"
-        "5. **只输出 Solidity 代码，不要包含任何解释。**"
     )
+    if patch_format == "diff":
+        template += (
+            "4. 以 unified diff 格式输出修改，放在一个 ```diff 代码块中。\n"
+            "   - 每个 hunk 以 `@@` 开头，保留至少 2 行未修改的上下文（以空格开头）。\n"
+            "   - 上下文行必须与上面给出的原始合约逐字一致，不要修改省略掉的部分。\n"
+            "5. **只输出 diff，不要包含任何解释。**"
+        )
+    else:
+        template += (
+            "4. 直接输出完整的、修复后的合约代码。\n"
+            "5. **只输出 Solidity 代码，不要包含任何解释。**"
+        )
 
-    prompt = ChatPromptTemplate.from_template(template)
+    return ChatPromptTemplate.from_template(template)
 
-    print("🔵 [Blue Team] 正在分析攻击路径并进行代码修复...")
 
-    # 防止 Log 太长
-    short_logs = test_logs[-2000:] if len(test_logs) > 2000 else test_logs
+async def blue_team_patch(original_code: str, exploit_code: str, test_logs: str, feedback: str = "",
+                          slither_report: str = "", examples: str = "") -> str:
+    print("🔵 [Blue Team] 正在分析攻击路径并进行代码修复...")
 
-    # 4. 准备变量
+    # 4. 准备变量 (执行摘要按整行截断，保留开头的状态与原因)
     input_vars = {
-        "original_code": original_code,
         "exploit_code": exploit_code,
-        "test_logs": short_logs
+        "test_logs": truncate_logs(test_logs, MAX_LOG_CHARS)
     }
     if feedback:
         input_vars["compiler_feedback"] = feedback
+    if slither_report:
+        input_vars["slither_report"] = slither_report
+    if examples:
+        input_vars["kb_examples"] = examples
+
+    # 5. 执行 (流式接收，代码块结束即停止)
+    if BLUE_PATCH_FORMAT == "diff":
+        prompt = _build_prompt("diff", bool(feedback), bool(slither_report), bool(examples))
+        input_vars["original_code"] = build_target_context(original_code, exploit_code)
+        response = await astream_completion(prompt, input_vars, tag="blue_team_diff")
+        try:
+            return apply_unified_diff(original_code, extract_code(response, "diff"))
+        except PatchApplyError as e:
+            print(f"⚠️ [Blue Team] diff 无法应用 ({e})，改为请求完整合约...")
 
-    # 5. 执行
-    chain = prompt | llm
-    response = chain.invoke(input_vars)
+    prompt = _build_prompt("full", bool(feedback), bool(slither_report), bool(examples))
+    input_vars["original_code"] = original_code
+    response = await astream_completion(prompt, input_vars, tag="blue_team")
 
-    return extract_code(response.content)
\ No newline at end of file
+    return extract_code(response)
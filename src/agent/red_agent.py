@@ -1,22 +1,70 @@
+import asyncio
+import os
 import re
 from langchain_core.prompts import ChatPromptTemplate
-from src.llm.client import get_llm
+from src.llm.client import astream_completion
 
 # 定义 Markdown 代码块标记
 CODE_MARK = "```"
 
+# exploit: 具体的 testExploit() 攻击; fuzz: fuzz / invariant 性质测试，由分片 campaign 寻找违反性质的输入
+RED_TEST_MODE = os.getenv("RED_TEST_MODE", "exploit")
 
-def extract_code(text: str) -> str:
-    pattern = r"```(?:solidity)?\n(.*?)```"
+EXPLOIT_REQUIREMENTS = (
+    "请编写一个 Foundry 测试脚本 (`ExploitTest`) 来复现漏洞并窃取资金。\n"
+    "**严格遵守以下要求：**\n"
+    "1. 必须导入 `forge-std/Test.sol`。\n"
+    "2. 合约名必须是 `ExploitTest` 并且继承自 `Test`。\n"
+    "3. 必须包含 `setUp()` 函数：\n"
+    "   - 部署目标合约。\n"
+    "   - 给目标合约转入初始资金（例如 10 ether）。\n"
+    "4. 必须包含 `testExploit()` 函数：\n"
+    "   - 编写具体的攻击逻辑（如重入、权限绕过）。\n"
+    "   - 使用 `vm.prank(attacker)` 或 `vm.deal` 模拟攻击者环境。\n"
+    "   - 最终必须断言攻击成功（例如 `assertGt(attacker.balance, 0)`）。\n"
+    "5. 如果需要辅助合约（如恶意重入合约），请将辅助合约代码也写在同一个文件里。\n"
+    "6. **必须在文件开头加上 `import \"./Target.sol\";` 以引入目标合约定义。**\n"
+    "7. **只输出 Solidity 代码，不要包含任何解释或注释。**"
+)
+
+PROPERTY_REQUIREMENTS = (
+    "请编写 Foundry 性质测试 (`ExploitTest`)：用 fuzz / invariant 测试描述目标合约应当满足的安全性质，"
+    "由 fuzzer 寻找违反性质的输入。**测试失败 (性质被违反) 即表示攻击成功。**\n"
+    "**严格遵守以下要求：**\n"
+    "1. 必须导入 `forge-std/Test.sol`。\n"
+    "2. 合约名必须是 `ExploitTest` 并且继承自 `Test`。\n"
+    "3. 必须包含 `setUp()` 函数：部署目标合约，让其他用户存入初始资金（例如 10 ether），部署攻击者合约。\n"
+    "4. 至少编写一个带参数的 fuzz 测试 `testFuzz_xxx(uint256 amount, ...)`：\n"
+    "   - 用 `bound()` 把输入限制在合理范围内，以攻击者身份执行一系列操作。\n"
+    "   - 断言安全性质，例如“攻击者的余额不会增加”：`assertLe(attacker.balance, initialBalance)`。\n"
+    "5. 可以再编写 `invariant_xxx()` 不变量测试（例如“合约余额 >= 所有用户存款之和”），"
+    "用 `targetContract(address(handler))` 指定由 fuzzer 调用的 handler 合约。\n"
+    "6. 不要在测试里断言攻击成功，只断言性质成立。\n"
+    "7. 辅助合约（攻击者 / handler）写在同一个文件里。\n"
+    "8. **必须在文件开头加上 `import \"./Target.sol\";` 以引入目标合约定义。**\n"
+    "9. **只输出 Solidity 代码，不要包含任何解释或注释。**"
+)
+
+# 多候选模式下，每个候选分配不同的漏洞方向和温度，增加攻击思路的多样性
+VULNERABILITY_HINTS = [
+    "",
+    "Reentrancy (重入)",
+    "Access Control (权限缺失 / tx.origin)",
+    "Unchecked External Call (未检查的外部调用返回值)",
+    "Integer Overflow / Precision (算术溢出或精度问题)",
+]
+
+
+def extract_code(text: str, lang: str = "solidity") -> str:
+    pattern = rf"```(?:{lang})?\n(.*?)```"
     match = re.search(pattern, text, re.DOTALL)
     if match:
         return match.group(1).strip()
     return text.strip()
 
 
-def red_team_attack(contract_code: str, feedback: str = "") -> str:
-    llm = get_llm()
-
+async def red_team_attack(contract_code: str, feedback: str = "", temperature: float = 0.1, hint: str = "",
+                          slither_report: str = "", examples: str = "", test_mode: str = RED_TEST_MODE) -> str:
     # 1. 基础模板 (注意：这里用 {contract_code} 占位，不要把真实代码拼进来)
     template = (
             "你是一个世界顶级的智能合约黑客。你的任务是攻破以下目标合约。\n\n"
@@ -26,6 +74,14 @@ def red_team_attack(contract_code: str, feedback: str = "") -> str:
             CODE_MARK + "\n\n"
     )
 
+    # 静态分析报告 (后台 Slither 扫描完成时才有)
+    if slither_report:
+        template += "=== 静态分析报告 (Slither) ===\n{slither_report}\n\n"
+
+    # 知识库中相似合约的历史成功攻击 (few-shot)
+    if examples:
+        template += "=== 针对相似合约的历史成功攻击 (仅供参考，需适配当前合约) ===\n{kb_examples}\n"
+
     # 2. 如果有反馈，动态添加反馈部分的模板
     if feedback:
         template += (
@@ -34,23 +90,12 @@ def red_team_attack(contract_code: str, feedback: str = "") -> str:
             "请根据报错修正你的代码。不要重复同样的错误。\n\n"
         )
 
+    # 可选：指定优先尝试的漏洞方向
+    if hint:
+        template += "💡 提示：优先考虑 {vulnerability_hint} 类漏洞。\n\n"
+
     # 3. 添加任务要求
-    template += (
-        "请编写一个 Foundry 测试脚本 (`ExploitTest`) 来复现漏洞并窃取资金。\n"
-        "**严格遵守以下要求：**\n"
-        "1. 必须导入 `forge-std/Test.sol`。\n"
-        "2. 合约名必须是 `ExploitTest` 并且继承自 `Test`。\n"
-        "3. 必须包含 `setUp()` 函数：\n"
-        "   - 部署目标合约。\n"
-        "   - 给目标合约转入初始资金（例如 10 ether）。\n"
-        "4. 必须包含 `testExploit()` 函数：\n"
-        "   - 编写具体的攻击逻辑（如重入、权限绕过）。\n"
-        "   - 使用 `vm.prank(attacker)` 或 `vm.deal` 模拟攻击者环境。\n"
-        "   - 最终必须断言攻击成功（例如 `assertGt(attacker.balance, 0)`）。\n"
-        "5. 如果需要辅助合约（如恶意重入合约），请将辅助合约代码也写在同一个文件里。\n"
-        "6. **必须在文件开头加上 `import \"./Target.sol\";` 以引入目标合约定义。**\n"
-        "7. **只输出 Solidity 代码，不要包含任何解释或注释。**"
-    )
+    template += PROPERTY_REQUIREMENTS if test_mode == "fuzz" else EXPLOIT_REQUIREMENTS
 
     # 4. 创建 Prompt 模板
     prompt = ChatPromptTemplate.from_template(template)
@@ -59,11 +104,43 @@ def red_team_attack(contract_code: str, feedback: str = "") -> str:
     input_variables = {"contract_code": contract_code}
     if feedback:
         input_variables["compiler_feedback"] = feedback
+    if hint:
+        input_variables["vulnerability_hint"] = hint
+    if slither_report:
+        input_variables["slither_report"] = slither_report
+    if examples:
+        input_variables["kb_examples"] = examples
 
     print("🔴 [Red Team] 正在分析漏洞并编写攻击脚本...")
 
-    # 6. 安全执行 (LangChain 会自动处理转义)
-    chain = prompt | llm
-    response = chain.invoke(input_variables)
+    # 6. 安全执行 (LangChain 会自动处理转义)，流式接收，代码块结束即停止
+    tag = "red_team_fuzz" if test_mode == "fuzz" else "red_team"
+    response = await astream_completion(prompt, input_variables, tag=tag, temperature=temperature)
+
+    return extract_code(response)
+
+
+async def generate_exploit_candidates(contract_code: str, count: int, feedback: str = "",
+                                      slither_report: str = "", examples: str = "") -> list:
+    """
+    [Speculative] 并发生成 count 个攻击脚本候选
+    第 i 个候选使用不同的漏洞提示，温度随 i 递增
+    """
+    tasks = [
+        red_team_attack(
+            contract_code,
+            feedback,
+            temperature=min(0.1 + 0.2 * i, 1.0),
+            hint=VULNERABILITY_HINTS[i % len(VULNERABILITY_HINTS)],
+            slither_report=slither_report,
+            examples=examples,
+        )
+        for i in range(count)
+    ]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
 
-    return extract_code(response.content)
\ No newline at end of file
+    candidates = [code for code in results if isinstance(code, str) and code]
+    if not candidates:
+        # 所有候选都失败时把第一个异常抛出去
+        raise next(r for r in results if isinstance(r, BaseException))
+    return candidates
\ No newline at end of file
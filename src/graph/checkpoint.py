@@ -0,0 +1,40 @@
+import contextlib
+import os
+
+from src.tools.file_utils import WORKSPACE_DIR
+
+try:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+except ImportError:  # 未安装 langgraph-checkpoint-sqlite 时不做持久化
+    AsyncSqliteSaver = None
+
+# 每个节点执行完都会写一个 checkpoint；进程被杀后用同一个 run_id 可以从断点继续
+# 合约源码 / 攻击脚本 / 日志存放在 src/graph/history.py 中，checkpoint 里的状态只保存引用
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT", "1") == "1"
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(WORKSPACE_DIR, ".checkpoints"))
+CHECKPOINT_DB = os.path.join(CHECKPOINT_DIR, "checkpoints.sqlite")
+
+
+def checkpoint_available() -> bool:
+    return CHECKPOINT_ENABLED and AsyncSqliteSaver is not None
+
+
+@contextlib.asynccontextmanager
+async def open_checkpointer(path: str = CHECKPOINT_DB):
+    """
+    [Checkpoint] 打开 SQLite checkpointer (绑定当前事件循环)；未启用或依赖缺失时返回 None
+        async with open_checkpointer() as saver:
+            app = create_graph(checkpointer=saver)
+    """
+    if not checkpoint_available():
+        if CHECKPOINT_ENABLED:
+            print("⚠️ [Checkpoint] 未安装 langgraph-checkpoint-sqlite，本次运行不做持久化")
+        yield None
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    async with aiosqlite.connect(path) as conn:
+        saver = AsyncSqliteSaver(conn)
+        await saver.setup()
+        yield saver
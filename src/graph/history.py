@@ -0,0 +1,163 @@
+import collections
+import difflib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from src.graph.checkpoint import CHECKPOINT_DIR
+
+# 每轮的合约版本 / 攻击脚本 / 测试日志都存放在图状态之外，状态里只保存内容的哈希引用
+HISTORY_DB = os.getenv("HISTORY_DB", os.path.join(CHECKPOINT_DIR, "history.sqlite"))
+# 增量链的最大长度：超过后存一份完整内容，读取时最多回放这么多次增量
+HISTORY_MAX_CHAIN = int(os.getenv("HISTORY_MAX_CHAIN", "16"))
+HISTORY_CACHE_ENTRIES = int(os.getenv("HISTORY_CACHE_ENTRIES", "256"))
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _delta(base: str, text: str) -> list:
+    """按行计算 text 相对 base 的增量: [起始行, 结束行] 表示复制 base 中的行，字符串表示新增的内容"""
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, base_lines, lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return ops
+
+
+def _apply(base: str, ops: list) -> str:
+    base_lines = base.splitlines(keepends=True)
+    return "".join("".join(base_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+class HistoryStore:
+    """
+    [History] 按内容寻址的轮次历史 (sha256 -> 文本)
+    - 合约的每个版本相对上一个版本存成按行的增量 (zlib 压缩)，增量不比完整内容小时存完整内容
+    - 攻击脚本 / 测试日志压缩存储，内容相同的只存一份
+    - events 表按 run 记录每轮产生了哪些版本，供 Agent 和报告回看历史
+    """
+
+    def __init__(self, path: str = HISTORY_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            "hash TEXT PRIMARY KEY, base TEXT, depth INTEGER NOT NULL, size INTEGER NOT NULL, data BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, round INTEGER NOT NULL, "
+            "kind TEXT NOT NULL, hash TEXT NOT NULL, status TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS events_run ON events (run_id, kind, id)")
+        self._conn.commit()
+        # 最近读取的内容 (hash -> 文本)，增量链回放时的基础版本通常都在这里
+        self._cache = collections.OrderedDict()
+
+    def _remember(self, digest: str, text: str):
+        self._cache[digest] = text
+        self._cache.move_to_end(digest)
+        while len(self._cache) > HISTORY_CACHE_ENTRIES:
+            self._cache.popitem(last=False)
+
+    def put(self, text: str, base: str = "") -> str:
+        """保存 text，返回引用；base 为上一个版本的引用时尝试存成增量"""
+        if not text:
+            return ""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if digest in self._cache or self._conn.execute(
+                    "SELECT 1 FROM objects WHERE hash = ?", (digest,)).fetchone():
+                return digest
+
+        data = zlib.compress(text.encode("utf-8"))
+        depth = 0
+        row = None
+        if base and base != digest:
+            with self._lock:
+                row = self._conn.execute("SELECT depth FROM objects WHERE hash = ?", (base,)).fetchone()
+        if row is not None and row[0] < HISTORY_MAX_CHAIN:
+            delta = zlib.compress(json.dumps(_delta(self.get(base), text)).encode("utf-8"))
+            if len(delta) < len(data):
+                data, depth = delta, row[0] + 1
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO objects (hash, base, depth, size, data) VALUES (?, ?, ?, ?, ?)",
+                               (digest, base if depth else None, depth, len(text), data))
+            self._conn.commit()
+            self._remember(digest, text)
+        return digest
+
+    def get(self, digest: str) -> str:
+        """按引用取回完整内容 (增量会沿基础版本回放)"""
+        if not digest:
+            return ""
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+            row = self._conn.execute("SELECT base, data FROM objects WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(f"❌ [History] {digest[:12]} 不存在")
+        base, data = row
+        raw = zlib.decompress(data).decode("utf-8")
+        text = _apply(self.get(base), json.loads(raw)) if base else raw
+        with self._lock:
+            self._remember(digest, text)
+        return text
+
+    def record(self, run_id: str, round_count: int, kind: str, digest: str, status: str = ""):
+        """记录一条历史：某个 run 的第几轮产生了哪个版本 (target / exploit / logs)"""
+        if not digest:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO events (run_id, round, kind, hash, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, round_count, kind, digest, status, time.time()))
+            self._conn.commit()
+
+    def events(self, run_id: str, kind: str = None) -> list:
+        """[回看] 按时间顺序返回历史 [{"round", "kind", "hash", "status"}]，内容用 get(hash) 按需读取"""
+        query = "SELECT round, kind, hash, status FROM events WHERE run_id = ?"
+        params = [run_id]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        return [{"round": r[0], "kind": r[1], "hash": r[2], "status": r[3]} for r in rows]
+
+    def stats(self, run_id: str) -> dict:
+        """某个 run 引用到的内容：条数、原始大小、实际存储大小 (字节)"""
+        with self._lock:
+            count, size, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM objects "
+                "WHERE hash IN (SELECT DISTINCT hash FROM events WHERE run_id = ?)", (run_id,)).fetchone()
+        return {"objects": count, "size": size, "stored": stored}
+
+
+def get_history() -> HistoryStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+
+def store_text(text: str, base: str = "") -> str:
+    """[History] 保存内容并返回引用 (空内容为空引用)"""
+    return get_history().put(text, base)
+
+
+def load_text(digest: str) -> str:
+    """[History] 引用 -> 内容 (空引用为空字符串)"""
+    return get_history().get(digest)
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import time
+
+from src.graph.history import load_text
+from src.graph.state import create_initial_state
+from src.graph.workflow import create_graph
+from src.tools.file_utils import create_run_workspace, save_to_workspace, remove_from_workspace
+from src.tools.project_loader import link_project
+from src.tools.telemetry import run_context, span
+
+# LangGraph 的最大步数：最后一道保险，正常情况下由 src/tools/budget.py 中的预算和重试上限先结束 run
+RECURSION_LIMIT = int(os.getenv("RECURSION_LIMIT", "100"))
+
+
+def make_run_id(contract_name: str, source: str) -> str:
+    """根据合约名 + 源码指纹生成稳定的 run_id，同一份合约重复运行得到同一个 ID"""
+    stem = os.path.splitext(os.path.basename(contract_name))[0]
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:10]
+    return f"{stem}-{digest}"
+
+
+def _restore_workspace(state: dict):
+    """断点续跑前按 checkpoint 中的状态恢复 workspace 里的文件 (候选攻击脚本仍在 run 目录中，不需要恢复)"""
+    workspace = state["workspace_dir"]
+    create_run_workspace(state["run_id"])
+    target_file = state.get("target_file") or "Target.sol"
+    if state.get("project_dir"):
+        link_project(state["project_dir"], workspace, target_file)
+    save_to_workspace(target_file, load_text(state["target_ref"]), workspace)
+    # 多候选模式下 Exploit.t.sol 不能参与候选的全量编译
+    if state.get("exploit_ref") and not state.get("exploit_candidates"):
+        save_to_workspace("Exploit.t.sol", load_text(state["exploit_ref"]), workspace)
+    elif state.get("exploit_candidates"):
+        remove_from_workspace("Exploit.t.sol", workspace)
+
+
+async def run_audit(target_source: str, run_id: str, app=None, skip_finished: bool = False,
+                    project_dir: str = "", target_file: str = "Target.sol") -> dict:
+    """
+    [Runner] 在独立 workspace 中跑完一次完整的红蓝对抗
+    返回最终状态 (额外附带 duration 秒数，以及 resumed: new / resumed / finished)
+    project_dir 非空时把多文件工程链接进 workspace，target_file 为目标合约在工程中的相对路径
+    app 带 checkpointer 时以 run_id 作为 thread_id：
+    - 未完成的 run 从上次中断的节点继续
+    - 已完成的 run: skip_finished=True 直接返回保存的最终状态，否则丢弃旧记录重新运行
+    target_source 为 None 时只能恢复已有的 run
+    """
+    if app is None:
+        app = create_graph()
+
+    config = {"recursion_limit": RECURSION_LIMIT, "configurable": {"thread_id": run_id}}
+    inputs = None
+    resumed = "new"
+    snapshot = await app.aget_state(config) if app.checkpointer is not None else None
+
+    if snapshot is not None and snapshot.values and snapshot.next:
+        print(f"♻️ [Runner] 从断点继续 {run_id} (下一个节点: {', '.join(snapshot.next)})")
+        _restore_workspace(snapshot.values)
+        resumed = "resumed"
+    elif snapshot is not None and snapshot.values and skip_finished:
+        print(f"⏭️ [Runner] {run_id} 已完成，跳过")
+        return {**snapshot.values, "duration": 0.0, "resumed": "finished"}
+    else:
+        if target_source is None:
+            raise ValueError(f"❌ 没有找到 run {run_id} 的 checkpoint，无法恢复")
+        if snapshot is not None and snapshot.values:
+            await app.checkpointer.adelete_thread(run_id)
+        workspace = create_run_workspace(run_id)
+        if project_dir:
+            link_project(project_dir, workspace, target_file)
+        save_to_workspace(target_file, target_source, workspace)
+        inputs = create_initial_state(target_source, run_id, workspace, project_dir, target_file)
+
+    started = time.perf_counter()
+    # 红/蓝 Agent 节点是异步的 (流式 LLM)，编译/测试节点由 LangGraph 放到线程池执行
+    # inputs 为 None 时 LangGraph 从 checkpoint 中保存的下一个节点继续执行
+    with run_context(run_id=run_id), span("run", resumed=resumed) as s:
+        final_state = await app.ainvoke(inputs, config=config)
+        s.set(status=final_state["execution_status"], rounds=final_state["round_count"],
+              stop_reason=final_state.get("stop_reason", ""))
+    final_state["duration"] = time.perf_counter() - started
+    final_state["resumed"] = resumed
+    return final_state
@@ -1,9 +1,12 @@
 from typing import TypedDict
 
+from src.graph.history import store_text
+
 class AgentState(TypedDict):
-    target_source: str      # 目标合约
-    exploit_source: str     # 攻击脚本
-    test_logs: str          # 测试运行日志
+    # 合约 / 攻击脚本 / 日志存放在 src/graph/history.py 的历史库中，状态里只保存引用 (用 load_text 读取)
+    target_ref: str         # 目标合约 (当前版本)
+    exploit_ref: str        # 攻击脚本
+    logs_ref: str           # 测试运行日志
 
     # === 新增 ===
     compiler_feedback: str  # 编译器报错信息
@@ -12,3 +15,51 @@ class AgentState(TypedDict):
 
     execution_status: str   # success, failed, error...
     round_count: int
+
+    exploit_candidates: list  # 多候选模式下本轮待验证的攻击脚本文件名
+    patched_from_ref: str   # 蓝队修复前的合约，补丁经红队验证后收录进知识库
+    exploit_template: str   # 当前攻击脚本来自哪个本地模板 (空表示 LLM 生成)
+    templates_tried: list   # 针对当前合约已经尝试过的模板
+
+    # === 预算 (见 src/tools/budget.py) ===
+    elapsed_s: float          # 各节点累计执行时间
+    llm_tokens: int           # 累计消耗的 LLM tokens
+    container_seconds: float  # 累计占用容器的时间
+    exploit_retries: int      # 本轮攻击脚本连续打回重写的次数
+    patch_retries: int        # 本轮补丁连续打回重写的次数
+    stop_reason: str          # execution_status 为 budget_exhausted 时耗尽的预算
+    error_fingerprints: list  # 本轮连续编译错误的指纹，用于发现原地打转
+
+    run_id: str             # 本次运行的 ID
+    workspace_dir: str      # 本次运行独立的 workspace 目录
+    project_dir: str        # 多文件工程的根目录 (单文件模式为空)
+    target_file: str        # 目标合约在 workspace 中的相对路径 (单文件模式为 Target.sol)
+
+
+def create_initial_state(target_source: str, run_id: str, workspace_dir: str,
+                         project_dir: str = "", target_file: str = "Target.sol") -> AgentState:
+    """构造一次对抗运行的初始状态"""
+    return {
+        "target_ref": store_text(target_source),
+        "exploit_ref": "",
+        "logs_ref": "",
+        "compiler_feedback": "",
+        "slither_report": "",
+        "execution_status": "unknown",
+        "round_count": 1,
+        "exploit_candidates": [],
+        "patched_from_ref": "",
+        "exploit_template": "",
+        "templates_tried": [],
+        "elapsed_s": 0.0,
+        "llm_tokens": 0,
+        "container_seconds": 0.0,
+        "exploit_retries": 0,
+        "patch_retries": 0,
+        "stop_reason": "",
+        "error_fingerprints": [],
+        "run_id": run_id,
+        "workspace_dir": workspace_dir,
+        "project_dir": project_dir,
+        "target_file": target_file,
+    }
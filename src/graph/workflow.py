@@ -1,105 +1,379 @@
+import asyncio
+import os
 from langgraph.graph import StateGraph, END
 from src.graph.state import AgentState
-from src.agent.red_agent import red_team_attack
+from src.graph.history import get_history, store_text, load_text
+from src.agent.red_agent import red_team_attack, generate_exploit_candidates, RED_TEST_MODE
 from src.agent.blue_agent import blue_team_patch
-from src.tools.file_utils import save_to_workspace
-from src.tools.docker_runner import run_forge_test, check_compilation
+from src.agent.exploit_templates import next_template
+from src.tools.file_utils import save_to_workspace, read_from_workspace, remove_from_workspace, WORKSPACE_DIR
+from src.tools.docker_runner import check_compilation, check_compilation_batch, run_exploit_check
+from src.tools.project_loader import affected_files
+from src.tools.fuzz_runner import run_fuzz_campaign
+from src.tools.slither_runner import start_slither_scan, await_slither_report, peek_slither_result
+from src.tools.telemetry import traced_node
+from src.tools.regression import prepare_archive, archive_exploit, run_regression_suite
+from src.tools.auto_repair import repair_source, error_fingerprint, AUTO_REPAIR_ATTEMPTS
+from src.tools.budget import (metered_node, exceeded_budget, format_usage, BUDGET_EXHAUSTED,
+                              MAX_EXPLOIT_RETRIES, MAX_PATCH_RETRIES, MAX_REPEATED_ERRORS, RUN_MAX_ROUNDS)
+from src.knowledge.exploit_kb import (record_exploit, record_patch, retrieve_exploit_examples,
+                                      retrieve_patch_examples)
+
+# 每轮并发生成的攻击脚本候选数；1 表示传统的单脚本模式
+EXPLOIT_CANDIDATES = int(os.getenv("EXPLOIT_CANDIDATES", "1"))
+
+
+def _workspace(state: AgentState) -> str:
+    """本次运行的独立 workspace (兼容未设置 workspace_dir 的旧状态)"""
+    return state.get("workspace_dir") or WORKSPACE_DIR
+
+
+def _target_file(state: AgentState) -> str:
+    """目标合约在 workspace 中的相对路径 (多文件工程中不一定是 Target.sol)"""
+    return state.get("target_file") or "Target.sol"
+
+
+def _record(state: AgentState, kind: str, ref: str, status: str = ""):
+    """把本轮产生的版本记进轮次历史 (状态里只保存引用)"""
+    get_history().record(state.get("run_id", ""), state["round_count"], kind, ref, status)
 
 
 # === 1. 初始化检查节点 ===
+@traced_node("check_target")
+@metered_node
 def node_check_target(state: AgentState):
     """【Checker】入口检查：原始合约是否合法"""
-    save_to_workspace("Target.sol", state["target_source"])
-    is_valid, error = check_compilation("Target.sol")
+    workspace = _workspace(state)
+    target = _target_file(state)
+    source = load_text(state["target_ref"])
+    save_to_workspace(target, source, workspace)
+    is_valid, error = check_compilation(target, workspace)
 
     if not is_valid:
         print(f"❌ [Checker] 原始合约编译失败！终止流程。\n{error}")
         return {"execution_status": "fatal_error", "compiler_feedback": error}
 
     print("✅ [Checker] 原始合约编译通过。")
+    _record(state, "target", state["target_ref"], "original")
+    # 新 run 从空的回归归档开始；功能测试按原始合约生成
+    prepare_archive(state.get("run_id", ""), source)
+    # Slither 在后台扫描，与红队的 LLM 调用并行
+    start_slither_scan(source)
     return {"execution_status": "target_valid"}
 
 
+def _slither_findings(source: str) -> list:
+    """已完成的 Slither 扫描的结构化结果，用作知识库的检索特征；未完成返回空列表"""
+    result = peek_slither_result(source)
+    return result["findings"] if result and result.get("ok") else []
+
+
+def _candidate_name(index: int) -> str:
+    return f"Exploit_{index}.t.sol"
+
+
+def _fingerprints(state: AgentState, feedback: str) -> list:
+    """记录本次编译错误的指纹"""
+    return (state.get("error_fingerprints") or []) + [error_fingerprint(feedback)]
+
+
+def _clear_candidates(state: AgentState):
+    """删除上一轮遗留的候选文件，避免它们参与本轮的全量编译"""
+    workspace = _workspace(state)
+    for name in state.get("exploit_candidates") or []:
+        remove_from_workspace(name, workspace)
+
+
 # === 2. 红队工作流 ===
-def node_red_agent(state: AgentState):
+@traced_node("red_agent")
+@metered_node
+async def node_red_agent(state: AgentState):
     print(f"🔴 [Red Team] Generating Exploit... (Retry: {bool(state.get('compiler_feedback'))})")
-    code = red_team_attack(state["target_source"], state.get("compiler_feedback", ""))
-    save_to_workspace("Exploit.t.sol", code)
+    try:
+        return await _generate_exploit(state)
+    except TimeoutError:
+        # LLM 超时同样算一次重写，保留上一次的反馈
+        return {"execution_status": "llm_timeout", "exploit_retries": state.get("exploit_retries", 0) + 1}
+
+
+async def _generate_exploit(state: AgentState):
+    workspace = _workspace(state)
+    feedback = state.get("compiler_feedback", "")
+    target_source = load_text(state["target_ref"])
+
+    # 快速通道：本地检测器命中常见漏洞时直接实例化模板攻击，不调用 LLM (性质测试模式下不适用)
+    if RED_TEST_MODE == "exploit" and not feedback:
+        tried = state.get("templates_tried") or []
+        template = next_template(target_source, _slither_findings(target_source), tried)
+        if template is not None:
+            _clear_candidates(state)
+            save_to_workspace("Exploit.t.sol", template["code"], workspace)
+            print(f"⚡ [Red Team] 命中本地模板 {template['key']}，跳过 LLM")
+            return {"exploit_ref": store_text(template["code"]), "exploit_candidates": [], "compiler_feedback": "",
+                    "exploit_template": template["key"], "templates_tried": tried + [template["key"]],
+                    "execution_status": "exploit_ready"}
+    # 后台扫描已完成时才注入报告，不阻塞 LLM 调用
+    slither_report = await await_slither_report(target_source) or state.get("slither_report", "")
+    # 知识库中相似合约的历史攻击作为 few-shot
+    examples = await asyncio.to_thread(retrieve_exploit_examples, target_source, _slither_findings(target_source))
+
+    if EXPLOIT_CANDIDATES > 1:
+        # 多候选模式：并发生成，各自写成独立的测试文件
+        _clear_candidates(state)
+        remove_from_workspace("Exploit.t.sol", workspace)
+        codes = await generate_exploit_candidates(target_source, EXPLOIT_CANDIDATES, feedback,
+                                                  slither_report=slither_report, examples=examples)
+        names = []
+        for i, code in enumerate(codes):
+            save_to_workspace(_candidate_name(i), code, workspace)
+            names.append(_candidate_name(i))
+        print(f"🔴 [Red Team] 生成了 {len(names)} 个候选攻击脚本")
+        return {"exploit_ref": store_text(codes[0]), "exploit_candidates": names, "compiler_feedback": "",
+                "exploit_template": "", "slither_report": slither_report, "execution_status": "exploit_ready"}
+
+    code = await red_team_attack(target_source, feedback, slither_report=slither_report,
+                                 examples=examples)
+    save_to_workspace("Exploit.t.sol", code, workspace)
     # 生成完清除旧的反馈
-    return {"exploit_source": code, "compiler_feedback": ""}
+    return {"exploit_ref": store_text(code), "exploit_candidates": [], "compiler_feedback": "",
+            "exploit_template": "", "slither_report": slither_report, "execution_status": "exploit_ready"}
 
 
-def node_check_exploit(state: AgentState):
-    """【Checker】红队代码检查"""
-    is_valid, error = check_compilation("Exploit.t.sol")
-    if not is_valid:
-        print(f"⚠️ [Checker] 攻击脚本编译失败，打回红队重写。")
-        return {"execution_status": "compile_error", "compiler_feedback": error}
-    return {"execution_status": "compile_pass"}
+# === 3. 编译 + 执行节点 ===
+def _run_tests(files: list, workspace: str) -> dict:
+    if RED_TEST_MODE == "fuzz":
+        return run_fuzz_campaign(files, workspace)
+    return run_exploit_check(files, workspace)
 
 
-# === 3. 执行节点 ===
+@traced_node("sandbox")
+@metered_node
 def node_sandbox(state: AgentState):
-    """【Executor】只负责跑逻辑，不管语法"""
-    # 此时可以确信 Target 和 Exploit 都是符合语法规范的
-    status, logs = run_forge_test("Exploit.t.sol")
-    print(f"🐳 [Sandbox] Execution Status: {status}")
-    return {"execution_status": status, "test_logs": logs}
+    """【Checker + Executor】一次 forge test 同时完成编译检查和执行；性质测试模式下执行分片 fuzz campaign"""
+    workspace = _workspace(state)
+    candidates = state.get("exploit_candidates") or []
+    files = candidates or ["Exploit.t.sol"]
+
+    outcome = _run_tests(files, workspace)
+    # 单脚本模式下，机械性的编译错误先在本地修复再重跑，修不好才打回红队
+    target_source = load_text(state["target_ref"])
+    code = load_text(state["exploit_ref"])
+    for _ in range(AUTO_REPAIR_ATTEMPTS if not candidates else 0):
+        if outcome["status"] != "compile_error":
+            break
+        fixed, rules = repair_source(code, outcome["compiler_feedback"], "Exploit.t.sol", target_source)
+        if not rules:
+            break
+        print(f"🔧 [AutoRepair] 本地修复攻击脚本: {', '.join(rules)}")
+        code = fixed
+        save_to_workspace("Exploit.t.sol", code, workspace)
+        outcome = _run_tests(files, workspace)
+    status = outcome["status"]
+
+    if state.get("exploit_template") and status != "success":
+        # 模板攻击没有成功 (编译失败 / 未攻破 / 超时) 不算红队的重写次数，报错也不交给 LLM：换下一个模板或由 LLM 生成
+        print(f"⚡ [Sandbox] 模板攻击 {state['exploit_template']} 未成功 ({status})，交给 LLM")
+        return {"execution_status": "template_failed", "compiler_feedback": "", "exploit_template": ""}
+
+    if status in ("compile_error", "timeout"):
+        if status == "compile_error":
+            print(f"⚠️ [Checker] 攻击脚本编译失败，打回红队重写。")
+        else:
+            print(f"⏱️ [Executor] 攻击脚本执行超时，打回红队重写。")
+        update = {"execution_status": status, "compiler_feedback": outcome["compiler_feedback"],
+                  "exploit_candidates": [], "exploit_retries": state.get("exploit_retries", 0) + 1}
+        if status == "compile_error":
+            update["error_fingerprints"] = _fingerprints(state, outcome["compiler_feedback"])
+        return update
+
+    if candidates:
+        # 多候选：任一成功即结束本轮，胜出的候选作为本轮的 Exploit.t.sol，供蓝队分析
+        survivors = [name for name in candidates if name not in outcome["compile_errors"]]
+        chosen = outcome["winner"] or survivors[0]
+        code = read_from_workspace(chosen, workspace)
+        save_to_workspace("Exploit.t.sol", code, workspace)
+        _clear_candidates(state)
+        print(f"🐳 [Sandbox] Execution Status: {status} (候选: {chosen})")
+    else:
+        print(f"🐳 [Sandbox] Execution Status: {status}")
+
+    # 一轮结束后不再需要蓝队修复前的合约
+    exploit_ref = store_text(code)
+    logs_ref = store_text(outcome["test_logs"])
+    _record(state, "exploit", exploit_ref, status)
+    _record(state, "logs", logs_ref, status)
+    update = {"execution_status": status, "exploit_ref": exploit_ref, "logs_ref": logs_ref, "patched_from_ref": "",
+              "exploit_candidates": [], "exploit_retries": 0, "error_fingerprints": []}
+
+    # 知识库增量收录：成功的攻击；以及经本轮攻击验证有效的上一轮补丁
+    if status == "success":
+        archive_exploit(state.get("run_id", ""), code, state["round_count"],
+                        kind="property" if RED_TEST_MODE == "fuzz" else "exploit")
+        record_exploit(target_source, code, _slither_findings(target_source), state.get("run_id", ""))
+    elif status == "failed" and state.get("patched_from_ref"):
+        patched_from = load_text(state["patched_from_ref"])
+        record_patch(patched_from, target_source, _slither_findings(patched_from), state.get("run_id", ""))
+    return update
 
 
 # === 4. 蓝队工作流 ===
-def node_blue_agent(state: AgentState):
+@traced_node("blue_agent")
+@metered_node
+async def node_blue_agent(state: AgentState):
     print(f"🔵 [Blue Team] Patching... (Retry: {bool(state.get('compiler_feedback'))})")
-    # 这里的 blue_team_patch 也要记得改，接收 feedback
-    code = blue_team_patch(state["target_source"], state["exploit_source"], state["test_logs"])  # 这里简化，实际要加 feedback
-    return {"target_source": code, "round_count": state["round_count"] + 1, "compiler_feedback": ""}
+    target_source = load_text(state["target_ref"])
+    slither_report = await await_slither_report(target_source) or state.get("slither_report", "")
+    # 补丁编译失败重试时 target_ref 已是上一次的补丁，修复前的合约以第一次进入时为准
+    patched_from_ref = state.get("patched_from_ref") or state["target_ref"]
+    patched_from = load_text(patched_from_ref)
+    examples = await asyncio.to_thread(retrieve_patch_examples, patched_from, _slither_findings(patched_from))
+    try:
+        # 补丁编译失败打回时带上报错，让蓝队针对报错修改上一次的补丁
+        code = await blue_team_patch(target_source, load_text(state["exploit_ref"]), load_text(state["logs_ref"]),
+                                     feedback=state.get("compiler_feedback", ""),
+                                     slither_report=slither_report, examples=examples)
+    except TimeoutError:
+        return {"execution_status": "llm_timeout", "patch_retries": state.get("patch_retries", 0) + 1}
+    # round_count 只在本轮第一次修复时递增，补丁编译失败的重写不算新的一轮
+    round_count = state["round_count"] if state.get("patched_from_ref") else state["round_count"] + 1
+    # 补丁相对当前版本存成增量
+    return {"target_ref": store_text(code, state["target_ref"]), "round_count": round_count, "compiler_feedback": "",
+            "patched_from_ref": patched_from_ref, "execution_status": "patch_ready"}
+
 
+def _check_patch_compiles(target: str, workspace: str):
+    """补丁 + 依赖它的工程文件 (多文件工程中只重新编译受影响的编译单元) 一次编译，返回第一个错误"""
+    files = affected_files(workspace, [target])
+    verdicts = check_compilation_batch(files, workspace)
+    return next((verdicts[name] for name in files if not verdicts[name][0]), verdicts[target])
 
+
+@traced_node("check_patch")
+@metered_node
 def node_check_patch(state: AgentState):
     """【Checker】蓝队代码检查"""
-    save_to_workspace("Target.sol", state["target_source"])
-    is_valid, error = check_compilation("Target.sol")
+    workspace = _workspace(state)
+    target = _target_file(state)
+    target_ref = state["target_ref"]
+    code = load_text(target_ref)
+    save_to_workspace(target, code, workspace)
+    is_valid, error = _check_patch_compiles(target, workspace)
+    for _ in range(AUTO_REPAIR_ATTEMPTS):
+        if is_valid:
+            break
+        fixed, rules = repair_source(code, error, target)
+        if not rules:
+            break
+        print(f"🔧 [AutoRepair] 本地修复补丁: {', '.join(rules)}")
+        code = fixed
+        save_to_workspace(target, code, workspace)
+        is_valid, error = _check_patch_compiles(target, workspace)
+    repaired = {}
+    if code != load_text(target_ref):
+        target_ref = store_text(code, target_ref)
+        repaired = {"target_ref": target_ref}
+
     if not is_valid:
         print(f"⚠️ [Checker] 修复后的合约编译失败，打回蓝队重写。")
         # 注意：这里可能需要回滚 Target.sol，或者让蓝队基于错误继续改
-        return {"execution_status": "patch_error", "compiler_feedback": error}
-    return {"execution_status": "patch_pass"}
+        return {"execution_status": "patch_error", "compiler_feedback": error,
+                "patch_retries": state.get("patch_retries", 0) + 1,
+                "error_fingerprints": _fingerprints(state, error), **repaired}
+
+    # 历史攻击 + 功能测试一次性重跑：补丁没有堵住旧漏洞或破坏了存取款功能时直接打回蓝队，不再消耗一轮红队 LLM
+    regression = run_regression_suite(state.get("run_id", ""), workspace)
+    if regression["status"] in ("regression", "broken"):
+        if regression["status"] == "regression":
+            print(f"⚠️ [Regression] 历史攻击 {regression['file']} 在补丁上再次成功，打回蓝队重写。")
+        else:
+            print(f"⚠️ [Regression] 补丁破坏了存取款功能，打回蓝队重写。")
+        # 蓝队针对复现的攻击 (或失败的功能测试) 重新修复
+        return {"execution_status": "patch_regression", "exploit_ref": store_text(regression["source"]),
+                "logs_ref": store_text(regression["test_logs"]), "compiler_feedback": "",
+                "patch_retries": state.get("patch_retries", 0) + 1, "error_fingerprints": [], **repaired}
+    _record(state, "target", target_ref, "patch")
+    # 修复后的合约同样在后台重新扫描，供下一轮红队使用；旧报告已不再对应当前源码
+    start_slither_scan(code)
+    return {"execution_status": "patch_pass", "slither_report": "", "patch_retries": 0, "templates_tried": [],
+            "error_fingerprints": [], **repaired}
+
+
+# === 5. 预算耗尽 ===
+def stop_reason(state: AgentState) -> str:
+    """需要提前结束时返回原因 (预算 / 重试上限 / 轮次上限)，否则返回空字符串"""
+    reason = exceeded_budget(state)
+    if reason:
+        return reason
+    if MAX_EXPLOIT_RETRIES > 0 and state.get("exploit_retries", 0) > MAX_EXPLOIT_RETRIES:
+        return "exploit_retries"
+    if MAX_PATCH_RETRIES > 0 and state.get("patch_retries", 0) > MAX_PATCH_RETRIES:
+        return "patch_retries"
+    fingerprints = state.get("error_fingerprints") or []
+    if MAX_REPEATED_ERRORS > 0 and len(fingerprints) >= MAX_REPEATED_ERRORS \
+            and len(set(fingerprints[-MAX_REPEATED_ERRORS:])) == 1:
+        return "repeated_error"
+    return ""
+
+
+@traced_node(BUDGET_EXHAUSTED)
+def node_budget_exhausted(state: AgentState):
+    """【终止】预算或重试次数耗尽，以独立的终止状态结束，保留当前的合约和日志"""
+    reason = stop_reason(state) or "max_rounds"
+    print(f"⏹️ [Budget] 预算耗尽 ({reason})，提前结束: {format_usage(state)}")
+    return {"execution_status": BUDGET_EXHAUSTED, "stop_reason": reason}
 
 
 # === 路由逻辑 ===
+# 只有在继续执行时才检查预算：已经得出结论 (END) 的 run 按结论结束
 def router_check_target(state: AgentState):
     if state["execution_status"] == "fatal_error": return END
+    if stop_reason(state): return BUDGET_EXHAUSTED
     return "red_agent"
 
 
-def router_check_exploit(state: AgentState):
-    if state["execution_status"] == "compile_error": return "red_agent"  # 重写
-    return "sandbox"  # 通过，去执行
+def router_red_agent(state: AgentState):
+    if stop_reason(state): return BUDGET_EXHAUSTED
+    if state["execution_status"] == "llm_timeout": return "red_agent"  # LLM 超时，重试
+    return "sandbox"
 
 
 def router_sandbox(state: AgentState):
     status = state["execution_status"]
-    if status == "success": return "blue_agent"  # 攻破了，修
+    if status in ("success", "compile_error", "timeout", "template_failed") and stop_reason(state):
+        return BUDGET_EXHAUSTED
+    if status in ("compile_error", "timeout"): return "red_agent"  # 编译失败 / 执行超时，重写
+    if status == "template_failed": return "red_agent"  # 模板攻击无效，换下一个模板或交给 LLM
+    if status == "success":
+        if RUN_MAX_ROUNDS > 0 and state["round_count"] >= RUN_MAX_ROUNDS: return BUDGET_EXHAUSTED
+        return "blue_agent"  # 攻破了，修
     if status == "failed": return END  # 没攻破，安全
     return END  # 出错了
 
 
+def router_blue_agent(state: AgentState):
+    if stop_reason(state): return BUDGET_EXHAUSTED
+    if state["execution_status"] == "llm_timeout": return "blue_agent"  # LLM 超时，重试
+    return "check_patch"
+
+
 def router_check_patch(state: AgentState):
-    if state["execution_status"] == "patch_error": return "blue_agent"  # 重写
+    if stop_reason(state): return BUDGET_EXHAUSTED
+    if state["execution_status"] in ("patch_error", "patch_regression"): return "blue_agent"  # 重写
     return "red_agent"  # 通过，下一轮红队攻击
 
 
 # === 建图 ===
-def create_graph():
+def create_graph(checkpointer=None):
+    """checkpointer 非空时每个节点执行完都会持久化状态，可按 run_id (thread_id) 断点续跑"""
     workflow = StateGraph(AgentState)
 
     # Add Nodes
     workflow.add_node("check_target", node_check_target)
     workflow.add_node("red_agent", node_red_agent)
-    workflow.add_node("check_exploit", node_check_exploit)
     workflow.add_node("sandbox", node_sandbox)
     workflow.add_node("blue_agent", node_blue_agent)
     workflow.add_node("check_patch", node_check_patch)
+    workflow.add_node(BUDGET_EXHAUSTED, node_budget_exhausted)
 
     # Entry
     workflow.set_entry_point("check_target")
@@ -107,12 +381,12 @@ def create_graph():
     # Edges
     workflow.add_conditional_edges("check_target", router_check_target)
 
-    workflow.add_edge("red_agent", "check_exploit")
-    workflow.add_conditional_edges("check_exploit", router_check_exploit)
-
+    workflow.add_conditional_edges("red_agent", router_red_agent)
     workflow.add_conditional_edges("sandbox", router_sandbox)
 
-    workflow.add_edge("blue_agent", "check_patch")
+    workflow.add_conditional_edges("blue_agent", router_blue_agent)
     workflow.add_conditional_edges("check_patch", router_check_patch)
 
-    return workflow.compile()
\ No newline at end of file
+    workflow.add_edge(BUDGET_EXHAUSTED, END)
+
+    return workflow.compile(checkpointer=checkpointer)
\ No newline at end of file
@@ -0,0 +1,228 @@
+import difflib
+import hashlib
+import math
+import os
+import re
+import threading
+
+from src.tools.file_utils import CACHE_DIR
+from src.agent.context_builder import parse_contracts
+
+try:
+    import chromadb
+    from chromadb.config import Settings
+except ImportError:  # 未安装 chromadb 时知识库自动关闭
+    chromadb = None
+
+# 本地嵌入式向量库：保存历史上成功的攻击脚本和通过验证的修复补丁，检索相似案例作为 few-shot
+EXPLOIT_KB_ENABLED = os.getenv("EXPLOIT_KB", "1") == "1"
+EXPLOIT_KB_DIR = os.getenv("EXPLOIT_KB_DIR", os.path.join(CACHE_DIR, "exploit_kb"))
+EXPLOIT_KB_TOP_K = int(os.getenv("EXPLOIT_KB_TOP_K", "2"))
+# 余弦距离超过该值的案例视为不相似，不放进 prompt
+EXPLOIT_KB_MAX_DISTANCE = float(os.getenv("EXPLOIT_KB_MAX_DISTANCE", "0.6"))
+EXPLOIT_KB_MAX_CHARS = int(os.getenv("EXPLOIT_KB_MAX_CHARS", "2500"))
+
+EMBEDDING_DIM = 256
+
+# Slither 检测器 -> 漏洞类别
+_DETECTOR_CLASSES = [
+    ("reentrancy", "reentrancy"),
+    ("tx-origin", "access-control"),
+    ("suicidal", "access-control"),
+    ("arbitrary-send", "access-control"),
+    ("unprotected", "access-control"),
+    ("delegatecall", "delegatecall"),
+    ("unchecked", "unchecked-call"),
+    ("divide-before-multiply", "arithmetic"),
+    ("incorrect-equality", "arithmetic"),
+    ("weak-prng", "randomness"),
+    ("timestamp", "randomness"),
+]
+
+# 没有 Slither 结果时退回源码中的关键模式
+_SOURCE_PATTERNS = [
+    ("call-value", re.compile(r"\.call\s*\{\s*value"), "reentrancy"),
+    ("tx-origin", re.compile(r"\btx\.origin\b"), "access-control"),
+    ("delegatecall", re.compile(r"\.delegatecall\s*\("), "delegatecall"),
+    ("selfdestruct", re.compile(r"\bselfdestruct\s*\("), "access-control"),
+    ("unchecked-block", re.compile(r"\bunchecked\s*\{"), "arithmetic"),
+    ("block-timestamp", re.compile(r"\bblock\.(timestamp|prevrandao|difficulty)\b"), "randomness"),
+]
+
+# 各类特征在向量中的权重：检测器和漏洞类别比函数名更能说明“相似”
+_FEATURE_WEIGHTS = {"class": 3.0, "detector": 3.0, "pattern": 2.0, "function": 1.0}
+
+_client = None
+_collections = {}
+_lock = threading.Lock()
+
+
+def kb_enabled() -> bool:
+    return EXPLOIT_KB_ENABLED and chromadb is not None
+
+
+def _function_signatures(source: str) -> list:
+    """从源码中提取 name(types) 形式的函数签名"""
+    try:
+        contracts = parse_contracts(source)
+    except ValueError:
+        return []
+    signatures = set()
+    for contract in contracts:
+        for member in contract["members"]:
+            if member["kind"] != "function" or not member["name"]:
+                continue
+            match = re.match(r"function\s+\w+\s*\(([^)]*)\)", member["text"])
+            params = match.group(1) if match else ""
+            types = [p.split()[0] for p in params.split(",") if p.strip()]
+            signatures.add(f"{member['name']}({','.join(types)})")
+    return sorted(signatures)
+
+
+def extract_features(source: str, findings: list = None) -> dict:
+    """
+    [特征] 合约特征: Slither 检测器 / 函数签名 / 源码模式 / 漏洞类别
+    """
+    detectors = sorted({f["check"] for f in findings or [] if f.get("impact") not in ("Informational", "Optimization")})
+    patterns = sorted(name for name, regex, _ in _SOURCE_PATTERNS if regex.search(source))
+
+    classes = set()
+    for check in detectors:
+        for key, vuln_class in _DETECTOR_CLASSES:
+            if key in check:
+                classes.add(vuln_class)
+    if not classes:
+        classes = {vuln_class for name, _, vuln_class in _SOURCE_PATTERNS if name in patterns}
+
+    return {
+        "vuln_class": sorted(classes) or ["unknown"],
+        "detectors": detectors,
+        "patterns": patterns,
+        "functions": _function_signatures(source),
+    }
+
+
+def embed_features(features: dict) -> list:
+    """
+    [向量] 特征哈希 (feature hashing) 生成固定维度的向量，不依赖需要联网下载的嵌入模型
+    """
+    vector = [0.0] * EMBEDDING_DIM
+    tokens = [("class", c) for c in features["vuln_class"]]
+    tokens += [("detector", d) for d in features["detectors"]]
+    tokens += [("pattern", p) for p in features["patterns"]]
+    tokens += [("function", f) for f in features["functions"]]
+    for kind, value in tokens:
+        digest = hashlib.sha1(f"{kind}:{value}".encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "big") % EMBEDDING_DIM
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[index] += sign * _FEATURE_WEIGHTS[kind]
+
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        return vector
+    return [v / norm for v in vector]
+
+
+def _get_collection(name: str):
+    global _client
+    with _lock:
+        if _client is None:
+            os.makedirs(EXPLOIT_KB_DIR, exist_ok=True)
+            _client = chromadb.PersistentClient(path=EXPLOIT_KB_DIR, settings=Settings(anonymized_telemetry=False))
+        if name not in _collections:
+            _collections[name] = _client.get_or_create_collection(
+                name, metadata={"hnsw:space": "cosine"}, embedding_function=None
+            )
+        return _collections[name]
+
+
+def _metadata(features: dict, run_id: str) -> dict:
+    # chromadb 的 metadata 只支持标量，列表拼成字符串
+    return {
+        "vuln_class": ",".join(features["vuln_class"]),
+        "detectors": ",".join(features["detectors"]),
+        "functions": ",".join(features["functions"])[:1000],
+        "run_id": run_id,
+    }
+
+
+def _insert(collection: str, document: str, features: dict, run_id: str):
+    if not kb_enabled() or not document.strip():
+        return
+    doc_id = hashlib.sha256(document.encode("utf-8")).hexdigest()
+    try:
+        # 相同内容的案例用 upsert 覆盖，不会重复累积
+        _get_collection(collection).upsert(
+            ids=[doc_id],
+            embeddings=[embed_features(features)],
+            documents=[document],
+            metadatas=[_metadata(features, run_id)],
+        )
+        print(f"📚 [KB] 已收录 {collection} 案例 ({_metadata(features, run_id)['vuln_class']})")
+    except Exception as e:
+        print(f"⚠️ [KB] 写入知识库失败: {e}")
+
+
+def record_exploit(target_source: str, exploit_source: str, findings: list = None, run_id: str = ""):
+    """[写入] 收录一次成功的攻击"""
+    _insert("exploits", exploit_source, extract_features(target_source, findings), run_id)
+
+
+def record_patch(original_source: str, patched_source: str, findings: list = None, run_id: str = ""):
+    """[写入] 收录一次通过验证 (打补丁后红队攻击失败) 的修复，以 unified diff 保存"""
+    diff = "\n".join(difflib.unified_diff(
+        original_source.splitlines(), patched_source.splitlines(),
+        "Target.sol", "Target.sol", lineterm="", n=2,
+    ))
+    _insert("patches", diff, extract_features(original_source, findings), run_id)
+
+
+def _query(collection: str, source: str, findings: list) -> list:
+    if not kb_enabled() or EXPLOIT_KB_TOP_K <= 0:
+        return []
+    try:
+        coll = _get_collection(collection)
+        count = coll.count()
+        if count == 0:
+            return []
+        result = coll.query(
+            query_embeddings=[embed_features(extract_features(source, findings))],
+            n_results=min(EXPLOIT_KB_TOP_K, count),
+            include=["documents", "metadatas", "distances"],
+        )
+    except Exception as e:
+        print(f"⚠️ [KB] 检索知识库失败: {e}")
+        return []
+
+    return [
+        {"document": doc, "metadata": meta, "distance": dist}
+        for doc, meta, dist in zip(result["documents"][0], result["metadatas"][0], result["distances"][0])
+        if dist <= EXPLOIT_KB_MAX_DISTANCE
+    ]
+
+
+def _format_examples(examples: list, lang: str) -> str:
+    text = ""
+    for n, example in enumerate(examples, start=1):
+        doc = example["document"]
+        if len(doc) > EXPLOIT_KB_MAX_CHARS:
+            doc = doc[:EXPLOIT_KB_MAX_CHARS] + "\n// ... (截断)"
+        text += (f"案例 {n} (漏洞类型: {example['metadata'].get('vuln_class', 'unknown')}, "
+                 f"相似度 {1 - example['distance']:.2f}):\n```{lang}\n{doc}\n```\n")
+    return text
+
+
+def retrieve_exploit_examples(target_source: str, findings: list = None) -> str:
+    """[检索] 返回与目标合约相似的历史攻击脚本，可以直接放入红队 prompt；没有相似案例返回空字符串"""
+    examples = _query("exploits", target_source, findings)
+    if examples:
+        print(f"📚 [KB] 检索到 {len(examples)} 个相似的历史攻击")
+    return _format_examples(examples, "solidity")
+
+
+def retrieve_patch_examples(target_source: str, findings: list = None) -> str:
+    """[检索] 返回相似漏洞的历史修复补丁 (diff)，可以直接放入蓝队 prompt"""
+    examples = _query("patches", target_source, findings)
+    if examples:
+        print(f"📚 [KB] 检索到 {len(examples)} 个相似的历史修复")
+    return _format_examples(examples, "diff")
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import threading
+
+from src.tools.disk_cache import DiskCache
+from src.tools.file_utils import CACHE_DIR
+
+# off: 不使用缓存 (默认); on: 命中直接返回，未命中调用 LLM 并写入;
+# replay: 只读回放，未命中直接报错 (用于确定性的回归测试)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE", "off")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+
+class LLMCacheMiss(RuntimeError):
+    """replay 模式下缓存未命中"""
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def cache_enabled() -> bool:
+    return LLM_CACHE_MODE in ("on", "replay")
+
+
+def get_llm_cache() -> DiskCache:
+    global _cache
+    with _lock:
+        if _cache is None:
+            # replay 模式下不应让条目过期，否则回放结果会随时间变化
+            ttl = None if LLM_CACHE_MODE == "replay" else LLM_CACHE_TTL
+            _cache = DiskCache(
+                os.path.join(CACHE_DIR, "llm_cache.sqlite"),
+                max_entries=LLM_CACHE_MAX_ENTRIES,
+                ttl=ttl,
+            )
+        return _cache
+
+
+def compute_prompt_key(model: str, temperature: float, messages: list, stop_at_code_fence: bool) -> str:
+    """[指纹] 模型 + 温度 + 渲染后的完整 prompt (+ 是否在代码块结束时截断)"""
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "stop_at_code_fence": stop_at_code_fence,
+        "messages": [[m.type, m.content] for m in messages],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def lookup(keys: list, tag: str):
+    """按顺序查询多个 key，返回 (命中的 key, 回复)，都未命中返回 (None, None)；replay 模式未命中时抛出 LLMCacheMiss"""
+    cache = get_llm_cache()
+    for key in keys:
+        text = cache.get(key)
+        if text is not None:
+            return key, text
+    if LLM_CACHE_MODE == "replay":
+        raise LLMCacheMiss(f"❌ [LLM Cache] replay 模式下缓存未命中 ({tag}, key={keys[0][:12]})")
+    return None, None
+
+
+def store(key: str, text: str):
+    if LLM_CACHE_MODE == "on":
+        get_llm_cache().put(key, text)
+
+
+def get_llm_cache_stats() -> dict:
+    if not cache_enabled():
+        return {}
+    return get_llm_cache().stats()
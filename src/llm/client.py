@@ -1,21 +1,240 @@
+import asyncio
 import os
+import threading
+import time
+import weakref
+
+import httpx
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
+from src.llm import cache as llm_cache
+from src.llm.router import get_router, Endpoint
+from src.tools.telemetry import span
+from src.tools.budget import charge_tokens, stage_timeout
 
 # 自动加载 .env 文件
 load_dotenv()
 
+# 共享 HTTP 连接池的大小 (批量模式下多个 run 并发请求 LLM)；端点 / 模型 / 限流配置见 src/llm/router.py
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# 单次调用 (含整个流式输出) 的截止时间；LLM_TIMEOUT 只限制单次网络读取，流一直在吐字时不会触发
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "300"))
+
+CODE_FENCE = "```"
+
+_lock = threading.Lock()
+_sync_http_client = None
+_sync_llms = {}
+# httpx.AsyncClient 的连接绑定在创建它的事件循环上，所以异步客户端按事件循环缓存
+_loop_llms = weakref.WeakKeyDictionary()
+
+# 每次 LLM 调用的耗时统计
+_call_log = []
+
 
-def get_llm():
-    """获取配置好的 Qwen (通义千问) 客户端"""
-    api_key = os.getenv("DASHSCOPE_API_KEY")
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+
+
+def _build_llm(endpoint: Endpoint, temperature: float, http_client=None, http_async_client=None) -> ChatOpenAI:
+    api_key = endpoint.api_key()
     if not api_key:
-        raise ValueError("❌ 未找到 DASHSCOPE_API_KEY，请检查 .env 文件")
+        raise ValueError(f"❌ 未找到 {endpoint.api_key_env}，请检查 .env 文件")
 
     return ChatOpenAI(
         # 推荐用 qwen-plus 或 qwen-max，写代码能力更强
-        model=os.getenv("LLM_MODEL", "qwen-plus"),
+        model=endpoint.model,
         api_key=api_key,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-        temperature=0.1  # 低温模式，保证代码生成的准确性
+        base_url=endpoint.base_url,
+        # 重试由 router 负责 (换端点 + 退避)，SDK 内部不再重试
+        max_retries=0,
+        temperature=temperature,  # 默认低温模式，保证代码生成的准确性
+        timeout=LLM_TIMEOUT,
+        stream_usage=True,
+        http_client=http_client,
+        http_async_client=http_async_client,
     )
+
+
+def get_model_names() -> list:
+    """router 中各端点的模型名 (去重，按配置顺序)；响应缓存按实际回答的模型分别存放"""
+    return list(dict.fromkeys(e.model for e in get_router().endpoints))
+
+
+def get_llm(temperature: float = 0.1, endpoint: Endpoint = None):
+    """
+    获取配置好的 Qwen (通义千问) 客户端；endpoint 为空时使用 router 中的第一个端点
+    同一进程内复用同一个实例和 HTTP 连接池；在事件循环中调用时返回绑定到该循环的异步连接池
+    """
+    global _sync_http_client
+    endpoint = endpoint or get_router().endpoints[0]
+    key = (endpoint.name, temperature)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    with _lock:
+        if loop is None:
+            if key not in _sync_llms:
+                if _sync_http_client is None:
+                    _sync_http_client = httpx.Client(limits=_http_limits(), timeout=LLM_TIMEOUT)
+                _sync_llms[key] = _build_llm(endpoint, temperature, http_client=_sync_http_client)
+            return _sync_llms[key]
+
+        llms = _loop_llms.setdefault(loop, {})
+        if key not in llms:
+            async_client = llms.get("__http__")
+            if async_client is None:
+                async_client = httpx.AsyncClient(limits=_http_limits(), timeout=LLM_TIMEOUT)
+                llms["__http__"] = async_client
+            llms[key] = _build_llm(endpoint, temperature, http_async_client=async_client)
+        return llms[key]
+
+
+def find_code_fence_end(text: str, start: int = 0) -> int:
+    """
+    [流式] 查找第一个完整的 ```solidity ... ``` 代码块的结束位置
+    返回闭合 fence 之后的下标；代码块尚未闭合返回 -1
+    """
+    open_pos = text.find(CODE_FENCE)
+    if open_pos == -1:
+        return -1
+    body_start = text.find("\n", open_pos)
+    if body_start == -1:
+        return -1
+    close_pos = text.find("\n" + CODE_FENCE, max(body_start, start))
+    if close_pos == -1:
+        return -1
+    return close_pos + 1 + len(CODE_FENCE)
+
+
+async def astream_completion(prompt, input_vars: dict, tag: str = "llm",
+                             temperature: float = 0.1, stop_at_code_fence: bool = True) -> str:
+    """
+    [LLM] 流式调用 LLM
+    - stop_at_code_fence: 收到第一个代码块的闭合 fence 后立即停止接收，不再为后面的解释文字付费
+    - 记录首 token 延迟 (TTFT) 和总耗时
+    - LLM_CACHE=on/replay 时，相同的渲染后 prompt 直接返回缓存的回复
+    - 超过 LLM_DEADLINE (或 run 剩余的墙钟预算) 时取消请求，抛出 TimeoutError
+    """
+    timeout = stage_timeout(LLM_DEADLINE)
+    with span("llm.call", tag=tag, timeout=timeout) as s:
+        try:
+            text, record = await asyncio.wait_for(
+                _astream(prompt.format_messages(**input_vars), tag, temperature, stop_at_code_fence),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            print(f"⏱️ [LLM] {tag}: 超过 {timeout:.0f}s 未完成，已取消")
+            raise
+        s.set(**{k: v for k, v in record.items() if k != "tag"})
+    return text
+
+
+async def _astream(messages: list, tag: str, temperature: float, stop_at_code_fence: bool):
+    if llm_cache.cache_enabled():
+        # 事先不知道 router 会选哪个端点：按配置顺序查找各模型缓存的回复
+        keys = {llm_cache.compute_prompt_key(model, temperature, messages, stop_at_code_fence): model
+                for model in get_model_names()}
+        key, cached = llm_cache.lookup(list(keys), tag)
+        if cached is not None:
+            record = {"tag": tag, "model": keys[key], "ttft": 0.0, "latency": 0.0,
+                      "output_chars": len(cached), "input_tokens": None, "output_tokens": None,
+                      "early_stopped": False, "cached": True}
+            _record_call(record)
+            print(f"⚡ [LLM] {tag}: 命中响应缓存")
+            return cached, record
+
+    started = time.perf_counter()
+
+    async def attempt(endpoint: Endpoint):
+        return await _stream_once(get_llm(temperature, endpoint), messages, stop_at_code_fence)
+
+    # router 负责选择端点、限流、重试和对冲；每次尝试都是一次完整的流式请求
+    estimated = sum(len(str(m.content)) for m in messages) // 4
+
+    def count_tokens(result) -> int:
+        return sum(_token_counts(result[0], result[1], estimated))
+
+    (text, usage, ttft, early_stopped), endpoint, routing = await get_router().call(
+        attempt, estimated_tokens=estimated, count_tokens=count_tokens)
+
+    input_tokens, output_tokens = _token_counts(text, usage, estimated)
+    record = {
+        "tag": tag,
+        "model": endpoint.model,
+        "endpoint": endpoint.name,
+        "retries": routing["retries"],
+        "hedged": routing["hedged"],
+        "ttft": round(ttft, 3) if ttft is not None else None,
+        "latency": round(time.perf_counter() - started, 3),
+        "output_chars": len(text),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "tokens_estimated": not usage,
+        "early_stopped": early_stopped,
+        "cached": False,
+    }
+    _record_call(record)
+    charge_tokens(input_tokens + output_tokens)
+    print(f"⏱️ [LLM] {tag}: TTFT {record['ttft']}s, 总耗时 {record['latency']}s"
+          f"{' (代码块结束，提前停止)' if early_stopped else ''}"
+          f"{f' [{endpoint.name}]' if len(get_router().endpoints) > 1 else ''}")
+
+    if llm_cache.cache_enabled() and text:
+        # 以实际回答的模型作为 key，多个端点使用不同模型时各自的回复互不混用
+        llm_cache.store(llm_cache.compute_prompt_key(endpoint.model, temperature, messages, stop_at_code_fence), text)
+    return text, record
+
+
+def _token_counts(text: str, usage, estimated_input: int) -> tuple:
+    """
+    (输入, 输出) tokens；usage 块总是流的最后一块，提前停止时收不到它，只能按字符数估算
+    否则提前停止的调用不计入 run 的 token 预算
+    """
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    return estimated_input, len(text) // 4
+
+
+async def _stream_once(llm, messages: list, stop_at_code_fence: bool):
+    """一次完整的流式请求，返回 (文本, usage, TTFT, 是否提前停止)"""
+    started = time.perf_counter()
+    ttft = None
+    text = ""
+    scan_from = 0
+    usage = None
+    early_stopped = False
+
+    async for chunk in llm.astream(messages):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+        if chunk.content:
+            text += chunk.content
+        if chunk.usage_metadata:
+            usage = chunk.usage_metadata
+
+        if stop_at_code_fence:
+            end = find_code_fence_end(text, scan_from)
+            if end != -1:
+                text = text[:end]
+                early_stopped = True
+                break
+            # 下次只需从尾部附近继续查找闭合 fence
+            scan_from = max(0, len(text) - len(CODE_FENCE) - 1)
+
+    return text, usage, ttft, early_stopped
+
+
+def _record_call(record: dict):
+    with _lock:
+        _call_log.append(record)
+
+
+def get_llm_call_log() -> list:
+    """返回本进程内所有 LLM 调用的耗时记录"""
+    with _lock:
+        return list(_call_log)
@@ -0,0 +1,295 @@
+import asyncio
+import collections
+import json
+import math
+import os
+import random
+import threading
+import time
+import weakref
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# 多个 OpenAI 兼容端点：JSON 列表，或指向 JSON 文件的路径；未设置时只使用 DashScope 一个端点
+#   [{"name": "qwen", "base_url": "...", "api_key_env": "DASHSCOPE_API_KEY", "model": "qwen-plus",
+#     "max_concurrency": 8, "rpm": 60, "tpm": 100000}, ...]
+# rpm / tpm 为每分钟请求数 / tokens 上限 (令牌桶)，0 表示不限制
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+# 可重试错误 (限流 / 5xx / 网络) 的最大重试次数与指数退避
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# 对冲请求：调用超过端点历史 p95 延迟仍未完成时，向另一个端点发出相同的请求，先完成者胜出
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "10"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2.0"))
+# 令牌桶按 输入 tokens + 该值 预扣，调用结束后按实际用量多退少补
+LLM_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "1024"))
+
+LATENCY_WINDOW = 50
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# 不同 SDK 的网络类异常 (openai / httpx)，按类名匹配，避免在这里引入依赖
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+                    "TransportError", "TimeoutException"}
+
+
+class TokenBucket:
+    """[限流] 每分钟 per_minute 个令牌的令牌桶；允许欠账 (settle 时实际用量超出预扣)，欠账还清前阻塞"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float) -> float:
+        """够用时扣除并返回 0，否则返回还需等待的秒数；超过桶容量的请求在桶满时放行"""
+        with self._lock:
+            self._refill()
+            needed = min(amount, self.capacity)
+            if self.tokens >= needed:
+                self.tokens -= amount
+                return 0.0
+            return (needed - self.tokens) / self.rate
+
+    def settle(self, delta: float):
+        with self._lock:
+            self.tokens -= delta
+
+    async def take(self, amount: float):
+        while True:
+            wait = self.try_take(amount)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+
+class Endpoint:
+    """一个 OpenAI 兼容端点上的一个模型：并发上限 + 请求 / token 令牌桶 + 延迟统计"""
+
+    def __init__(self, name: str, base_url: str, model: str, api_key_env: str = "DASHSCOPE_API_KEY",
+                 max_concurrency: int = 8, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key_env = api_key_env
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"calls": 0, "errors": 0, "hedges": 0, "hedge_wins": 0}
+        # asyncio.Semaphore 绑定事件循环，按循环分别创建
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def api_key(self) -> str:
+        return os.getenv(self.api_key_env, "")
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._semaphores[loop]
+
+    def load(self) -> float:
+        """选择端点用的负载：冷却中的端点排到最后"""
+        penalty = 1e6 if time.monotonic() < self.cooldown_until else 0.0
+        return penalty + self.in_flight / self.max_concurrency
+
+    def p95(self):
+        """历史 p95 延迟；样本不足时返回 None (不对冲)"""
+        with self._lock:
+            if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def record(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+            self.stats["calls"] += 1
+
+    def cool_down(self, seconds: float):
+        with self._lock:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+    async def acquire(self, estimated_tokens: int):
+        # 冷却 (收到 429) 期间不发出新请求
+        wait = self.cooldown_until - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        if self.requests is not None:
+            await self.requests.take(1)
+        if self.tokens is not None:
+            await self.tokens.take(estimated_tokens)
+
+
+def _load_config() -> list:
+    if not LLM_ENDPOINTS:
+        return [{"name": "default", "base_url": DEFAULT_BASE_URL, "model": os.getenv("LLM_MODEL", "qwen-plus"),
+                 "max_concurrency": int(os.getenv("LLM_MAX_CONNECTIONS", "20"))}]
+    text = LLM_ENDPOINTS
+    if not text.lstrip().startswith("["):
+        with open(text, "r", encoding="utf-8") as f:
+            text = f.read()
+    entries = json.loads(text)
+    if not entries:
+        raise ValueError("❌ LLM_ENDPOINTS 为空")
+    for i, entry in enumerate(entries):
+        entry.setdefault("name", f"{entry.get('model', 'llm')}@{i}")
+    return entries
+
+
+def is_retryable(error: BaseException) -> bool:
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def _retry_after(error: BaseException):
+    """429 响应中的 Retry-After (秒)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMRouter:
+    """
+    [Router] 在多个端点之间分发 LLM 调用
+    - 每个端点独立的并发上限、请求 / token 令牌桶；选择当前负载最低的端点
+    - 可重试的错误换端点重试，指数退避 (带抖动)；429 时该端点按 Retry-After 冷却
+    - LLM_HEDGE=1 时，调用超过端点 p95 延迟仍未完成，向另一个端点发出对冲请求，先完成者胜出，另一个取消
+    """
+
+    def __init__(self, endpoints: list):
+        self.endpoints = endpoints
+
+    def pick(self, exclude: Endpoint = None) -> Endpoint:
+        candidates = [e for e in self.endpoints if e is not exclude] or self.endpoints
+        # 负载相同时按配置顺序 (靠前的优先)
+        return min(candidates, key=lambda e: (e.load(), self.endpoints.index(e)))
+
+    def _start(self, endpoint: Endpoint, attempt, estimated_tokens: int, count_tokens) -> asyncio.Future:
+        # 选中即计入负载 (包括排队等待限流 / 并发槽位的请求)，同时发起的调用才会分散到不同端点
+        # 在任务结束的回调里释放：任务在第一次执行前就被取消时，协程里的 finally 不会运行
+        endpoint.in_flight += 1
+        task = asyncio.ensure_future(self._run(endpoint, attempt, estimated_tokens, count_tokens))
+        task.add_done_callback(lambda _: setattr(endpoint, "in_flight", endpoint.in_flight - 1))
+        return task
+
+    async def _run(self, endpoint: Endpoint, attempt, estimated_tokens: int, count_tokens):
+        await endpoint.acquire(estimated_tokens)
+        async with endpoint._semaphore():
+            started = time.perf_counter()
+            try:
+                result = await attempt(endpoint)
+            except Exception as e:
+                endpoint.stats["errors"] += 1
+                if getattr(e, "status_code", None) == 429:
+                    endpoint.cool_down(_retry_after(e) or LLM_BACKOFF_BASE)
+                raise
+            endpoint.record(time.perf_counter() - started)
+        if endpoint.tokens is not None and count_tokens is not None:
+            used = count_tokens(result)
+            if used:
+                endpoint.tokens.settle(used - estimated_tokens)
+        return result
+
+    async def _hedged(self, primary: Endpoint, attempt, estimated_tokens: int, count_tokens):
+        tasks = {self._start(primary, attempt, estimated_tokens, count_tokens): primary}
+        try:
+            delay = primary.p95() if LLM_HEDGE else None
+            if delay is not None:
+                done, _ = await asyncio.wait(list(tasks), timeout=max(delay, LLM_HEDGE_MIN_DELAY))
+                if not done:
+                    backup = self.pick(exclude=primary)
+                    backup.stats["hedges"] += 1
+                    print(f"🪁 [Router] {primary.name} 超过 p95 ({delay:.1f}s) 未完成，向 {backup.name} 发出对冲请求")
+                    tasks[self._start(backup, attempt, estimated_tokens, count_tokens)] = backup
+
+            first_error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        endpoint = tasks[task]
+                        if len(tasks) > 1 and endpoint is not primary:
+                            endpoint.stats["hedge_wins"] += 1
+                        return task.result(), endpoint, len(tasks) > 1
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, attempt, estimated_tokens: int = 0, count_tokens=None):
+        """
+        执行一次 LLM 调用: attempt(endpoint) 是一次完整请求的协程函数
+        返回 (结果, 胜出的端点, {"retries", "hedged"})；count_tokens(结果) 返回实际 tokens，用于令牌桶结算
+        """
+        estimated_tokens = estimated_tokens + LLM_OUTPUT_TOKENS_ESTIMATE
+        failed = None
+        for retry in range(LLM_MAX_RETRIES + 1):
+            # 重试时避开上一次出错的端点；只有一个端点时仍然重试它 (429 的 Retry-After 由端点冷却保证)
+            primary = self.pick(exclude=failed)
+            try:
+                result, endpoint, hedged = await self._hedged(primary, attempt, estimated_tokens, count_tokens)
+                return result, endpoint, {"retries": retry, "hedged": hedged}
+            except Exception as e:
+                if retry >= LLM_MAX_RETRIES or not is_retryable(e):
+                    raise
+                failed = primary
+                delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** retry) * random.uniform(0.5, 1.0)
+                print(f"🔁 [Router] {type(e).__name__}: {str(e)[:120]}，{delay:.1f}s 后重试 "
+                      f"({retry + 1}/{LLM_MAX_RETRIES})")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {e.name: dict(e.stats, p95=e.p95(), in_flight=e.in_flight) for e in self.endpoints}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def configure_router(entries: list) -> LLMRouter:
+    """[Router] 按配置项 (格式同 LLM_ENDPOINTS) 重建进程内共享的路由器"""
+    global _router
+    endpoints = [
+        Endpoint(
+            name=entry["name"],
+            base_url=entry.get("base_url", DEFAULT_BASE_URL),
+            model=entry.get("model", os.getenv("LLM_MODEL", "qwen-plus")),
+            api_key_env=entry.get("api_key_env", "DASHSCOPE_API_KEY"),
+            max_concurrency=int(entry.get("max_concurrency", 8)),
+            rpm=float(entry.get("rpm", 0)),
+            tpm=float(entry.get("tpm", 0)),
+        )
+        for entry in entries
+    ]
+    with _router_lock:
+        _router = LLMRouter(endpoints)
+    if len(endpoints) > 1:
+        print(f"🔀 [Router] {len(endpoints)} 个 LLM 端点: {', '.join(e.name for e in endpoints)}")
+    return _router
+
+
+def get_router() -> LLMRouter:
+    """[Router] 进程内共享的路由器 (首次调用时读取 LLM_ENDPOINTS)"""
+    with _router_lock:
+        router = _router
+    return router or configure_router(_load_config())
@@ -0,0 +1,147 @@
+import difflib
+import hashlib
+import os
+import re
+
+from src.tools.solc_resolver import resolve_version
+from src.agent.context_builder import parse_contracts
+
+# 编译失败时先在本地按规则修复 (缺失的 import / pragma / 合约名拼错 / 残留的说明文字)，最多修复几次；0 表示关闭
+AUTO_REPAIR_ATTEMPTS = int(os.getenv("AUTO_REPAIR_ATTEMPTS", "2"))
+
+TARGET_IMPORT = 'import "./Target.sol";'
+FORGE_STD_IMPORT = 'import "forge-std/Test.sol";'
+# 来自 forge-std/Test.sol 的标识符
+FORGE_STD_NAMES = {"Test", "vm", "console", "console2", "stdError", "StdCheats", "StdUtils"}
+
+# check_compilation / run_exploit_check 的报错形如:
+#   Line 15: DeclarationError: Undeclared identifier.
+#     --> Exploit.t.sol:15:9:
+#      |
+#   15 |         bank.withdrawAll();
+_ERROR_HEADER = re.compile(r"^(?:Line \S+: )?(?:Error: )?(\w*Error)(?: \((\d+)\))?: (.+)$")
+_ERROR_LOCATION = re.compile(r"-->\s*(\S+?):(\d+):(\d+)")
+_SNIPPET = re.compile(r"^\s*\d+\s*\|\s?(.*)$")
+_CODE_START = re.compile(r"^\s*(//|/\*|pragma\b|import\b|(abstract\s+)?contract\b|interface\b|library\b)")
+_PRAGMA_RE = re.compile(r"^\s*pragma\s+solidity\s+[^;]*;", re.MULTILINE)
+_IMPORT_RE = re.compile(r"^\s*import\s[^;]*;", re.MULTILINE)
+
+
+def parse_compile_errors(feedback: str) -> list:
+    """
+    [解析] 把 filter_file_errors 格式的报错文本还原成错误列表
+    每项: {"type", "code", "message", "file", "line", "column", "snippet"}
+    """
+    errors = []
+    current = None
+    for line in feedback.splitlines():
+        header = _ERROR_HEADER.match(line.strip())
+        if header:
+            current = {"type": header.group(1), "code": header.group(2), "message": header.group(3).strip(),
+                       "file": "", "line": 0, "column": 0, "snippet": ""}
+            errors.append(current)
+            continue
+        if current is None:
+            continue
+        location = _ERROR_LOCATION.search(line)
+        if location and not current["file"]:
+            current.update(file=location.group(1), line=int(location.group(2)), column=int(location.group(3)))
+            continue
+        snippet = _SNIPPET.match(line)
+        if snippet and not current["snippet"] and snippet.group(1).strip():
+            current["snippet"] = snippet.group(1).strip()
+    return errors
+
+
+def error_fingerprint(feedback: str) -> str:
+    """[指纹] 同一个错误的指纹与行号无关：错误类型 + 信息 + 出错的那行代码"""
+    errors = parse_compile_errors(feedback)
+    if errors:
+        parts = sorted(f"{e['type']}:{e['message']}:{e['snippet']}" for e in errors)
+    else:
+        parts = [re.sub(r"\d+", "N", feedback.strip())]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _identifier_at(source: str, line: int, column: int) -> str:
+    lines = source.splitlines()
+    if not 0 < line <= len(lines):
+        return ""
+    match = re.match(r"[A-Za-z_]\w*", lines[line - 1][max(column - 1, 0):])
+    return match.group(0) if match else ""
+
+
+def _add_import(source: str, statement: str) -> str:
+    """把 import 插到最后一个 import (或 pragma) 之后"""
+    anchors = list(_IMPORT_RE.finditer(source)) or list(_PRAGMA_RE.finditer(source))
+    if not anchors:
+        return statement + "\n" + source
+    end = anchors[-1].end()
+    return source[:end] + "\n" + statement + source[end:]
+
+
+def _strip_prose(source: str) -> str:
+    """去掉代码前后残留的说明文字和 Markdown 围栏"""
+    lines = [line for line in source.splitlines() if not line.strip().startswith("```")]
+    start = next((i for i, line in enumerate(lines) if _CODE_START.match(line)), 0)
+    end = max((i for i, line in enumerate(lines) if line.strip().endswith("}")), default=len(lines) - 1)
+    return "\n".join(lines[start:end + 1]) + "\n"
+
+
+def _target_contracts(target_source: str) -> list:
+    try:
+        return [c["name"] for c in parse_contracts(target_source)]
+    except ValueError:
+        return []
+
+
+def repair_source(source: str, feedback: str, filename: str, target_source: str = ""):
+    """
+    [AutoRepair] 按报错对 filename 做机械性修复，返回 (修复后的源码, 应用的规则列表)
+    没有规则适用时规则列表为空；不保证修复后一定能编译，由调用方重新编译验证
+    target_source 非空时 (修复攻击脚本) 会补全 Target.sol 的 import 并纠正拼错的合约名
+    """
+    errors = [e for e in parse_compile_errors(feedback) if not e["file"] or e["file"].endswith(filename)]
+    fixed = source
+    rules = []
+
+    if any(e["type"] == "ParserError" for e in errors) and _strip_prose(fixed).strip() != fixed.strip():
+        fixed = _strip_prose(fixed)
+        rules.append("strip_prose")
+
+    if any("requires different compiler version" in e["message"] for e in errors):
+        # 攻击脚本跟随目标合约选定的编译器；补丁去掉 pragma 约束后按镜像 / 仓库中的最高版本
+        pragma = f"pragma solidity ^{resolve_version([target_source])};"
+        replaced = _PRAGMA_RE.sub(pragma, fixed, count=1)
+        fixed = replaced if replaced != fixed else pragma + "\n" + fixed
+        rules.append("pragma")
+
+    target_names = _target_contracts(target_source) if target_source else []
+    renames = {}
+    for e in errors:
+        if not re.search(r"Undeclared identifier|Identifier not found", e["message"]):
+            continue
+        ident = _identifier_at(source, e["line"], e["column"])
+        if not ident:
+            continue
+        if ident in FORGE_STD_NAMES and "forge-std/" not in fixed:
+            fixed = _add_import(fixed, FORGE_STD_IMPORT)
+            rules.append("forge_std_import")
+        elif ident in target_names and "Target.sol" not in fixed:
+            fixed = _add_import(fixed, TARGET_IMPORT)
+            rules.append("target_import")
+        elif target_names and ident not in target_names and ident[:1].isupper():
+            close = difflib.get_close_matches(ident, target_names, n=1, cutoff=0.6)
+            if close and not re.search(rf"\b(contract|interface|library)\s+{ident}\b", fixed):
+                renames[ident] = close[0]
+
+    for wrong, right in renames.items():
+        fixed = re.sub(rf"\b{wrong}\b", right, fixed)
+        rules.append(f"rename:{wrong}->{right}")
+    if renames and "Target.sol" not in fixed:
+        fixed = _add_import(fixed, TARGET_IMPORT)
+        rules.append("target_import")
+
+    if fixed == source:
+        return source, []
+    return fixed, list(dict.fromkeys(rules))
@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+
+# === 单次 run 的资源预算 (0 表示不限制) ===
+# 墙钟时间按各节点的执行时间累加，进程中断的时间不计入，断点续跑后继续累计
+RUN_BUDGET_SECONDS = float(os.getenv("RUN_BUDGET_SECONDS", "1800"))
+RUN_BUDGET_TOKENS = int(os.getenv("RUN_BUDGET_TOKENS", "200000"))
+# 所有沙盒命令 (含等待空闲容器) 的耗时之和
+RUN_BUDGET_CONTAINER_SECONDS = float(os.getenv("RUN_BUDGET_CONTAINER_SECONDS", "1200"))
+# 红队最多攻击几轮 (每轮攻击成功后蓝队修复一次)
+RUN_MAX_ROUNDS = int(os.getenv("RUN_MAX_ROUNDS", "4"))
+
+# === 重试上限：同一轮内连续打回重写的次数 ===
+MAX_EXPLOIT_RETRIES = int(os.getenv("MAX_EXPLOIT_RETRIES", "3"))  # 攻击脚本编译失败 / 执行超时 / LLM 超时
+MAX_PATCH_RETRIES = int(os.getenv("MAX_PATCH_RETRIES", "3"))  # 补丁编译失败 / 回归测试失败 / LLM 超时
+# 同一个编译错误 (指纹相同) 连续出现这么多次即结束 run：LLM 已经在原地打转
+MAX_REPEATED_ERRORS = int(os.getenv("MAX_REPEATED_ERRORS", "2"))
+
+# 预算所剩无几时，阶段超时至少保留这么多秒，避免刚启动就被杀掉
+MIN_STAGE_TIMEOUT = 1.0
+
+BUDGET_EXHAUSTED = "budget_exhausted"
+
+_meter = contextvars.ContextVar("budget_meter", default=None)
+
+
+class Usage:
+    """一个图节点执行期间消耗的资源；LLM 客户端和沙盒通过 charge_* 记账 (线程安全)"""
+
+    def __init__(self, remaining_seconds: float = None):
+        self.tokens = 0
+        self.container_seconds = 0.0
+        # 本节点必须结束的时间点 (perf_counter)，None 表示不限制
+        self.deadline = time.perf_counter() + remaining_seconds if remaining_seconds is not None else None
+        self._lock = threading.Lock()
+
+    def add(self, tokens: int = 0, container_seconds: float = 0.0):
+        with self._lock:
+            self.tokens += tokens
+            self.container_seconds += container_seconds
+
+
+def charge_tokens(tokens: int):
+    """[记账] LLM 调用消耗的 tokens (输入 + 输出)"""
+    usage = _meter.get()
+    if usage is not None and tokens:
+        usage.add(tokens=tokens)
+
+
+def charge_container(seconds: float):
+    """[记账] 一次沙盒命令占用容器的秒数"""
+    usage = _meter.get()
+    if usage is not None:
+        usage.add(container_seconds=seconds)
+
+
+def stage_timeout(seconds: float) -> float:
+    """
+    [超时] 阶段超时：取配置值与本 run 剩余墙钟预算中较小的一个
+    seconds <= 0 且没有墙钟预算时返回 None (不限制)
+    """
+    usage = _meter.get()
+    limit = seconds if seconds > 0 else None
+    if usage is not None and usage.deadline is not None:
+        remaining = max(usage.deadline - time.perf_counter(), MIN_STAGE_TIMEOUT)
+        limit = remaining if limit is None else min(limit, remaining)
+    return limit
+
+
+@contextlib.contextmanager
+def metering(remaining_seconds: float = None):
+    usage = Usage(remaining_seconds)
+    token = _meter.set(usage)
+    try:
+        yield usage
+    finally:
+        _meter.reset(token)
+
+
+def _remaining_seconds(state: dict):
+    if RUN_BUDGET_SECONDS <= 0:
+        return None
+    return RUN_BUDGET_SECONDS - state.get("elapsed_s", 0.0)
+
+
+def _charged(state: dict, update: dict, usage: Usage, started: float) -> dict:
+    """把本节点的消耗累加进状态更新"""
+    update = dict(update or {})
+    update["elapsed_s"] = state.get("elapsed_s", 0.0) + time.perf_counter() - started
+    update["llm_tokens"] = state.get("llm_tokens", 0) + usage.tokens
+    update["container_seconds"] = state.get("container_seconds", 0.0) + usage.container_seconds
+    return update
+
+
+def metered_node(fn):
+    """[Budget] 图节点装饰器：统计节点的耗时 / tokens / 容器时间，累加到 elapsed_s / llm_tokens / container_seconds"""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state):
+            started = time.perf_counter()
+            with metering(_remaining_seconds(state)) as usage:
+                update = await fn(state)
+            return _charged(state, update, usage, started)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        started = time.perf_counter()
+        with metering(_remaining_seconds(state)) as usage:
+            update = fn(state)
+        return _charged(state, update, usage, started)
+
+    return wrapper
+
+
+def exceeded_budget(state: dict) -> str:
+    """[Budget] 返回已耗尽的预算名称，全部未耗尽返回空字符串"""
+    if RUN_BUDGET_SECONDS > 0 and state.get("elapsed_s", 0.0) >= RUN_BUDGET_SECONDS:
+        return "wall_clock"
+    if RUN_BUDGET_TOKENS > 0 and state.get("llm_tokens", 0) >= RUN_BUDGET_TOKENS:
+        return "llm_tokens"
+    if RUN_BUDGET_CONTAINER_SECONDS > 0 and state.get("container_seconds", 0.0) >= RUN_BUDGET_CONTAINER_SECONDS:
+        return "container_seconds"
+    return ""
+
+
+def format_usage(state: dict) -> str:
+    return (f"耗时 {state.get('elapsed_s', 0.0):.0f}s / tokens {state.get('llm_tokens', 0)} / "
+            f"容器 {state.get('container_seconds', 0.0):.0f}s")
@@ -0,0 +1,452 @@
+import atexit
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+import uuid
+
+try:
+    import docker
+    from docker.errors import DockerException
+except ImportError:  # 未安装 Docker SDK 时容器池不可用，run_in_sandbox 退回 docker run --rm 模式
+    docker = None
+
+    class DockerException(Exception):
+        """未安装 Docker SDK 时代替 docker.errors.DockerException"""
+
+from src.tools.file_utils import WORKSPACE_DIR
+from src.tools.telemetry import span
+from src.tools.budget import charge_container
+from src.tools.solc_resolver import SOLC_STORE, SOLC_STORE_MOUNT
+
+SANDBOX_IMAGE = os.getenv("SANDBOX_IMAGE", "foundry-box")
+# pool: 复用常驻容器 (docker exec); run: 旧模式，每次 docker run --rm
+SANDBOX_MODE = os.getenv("SANDBOX_MODE", "pool")
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+# 单个容器最多执行多少条命令后回收，防止容器内状态无限累积
+SANDBOX_MAX_USES = int(os.getenv("SANDBOX_MAX_USES", "100"))
+
+# 常驻容器把整个 WORKSPACE_DIR 挂载到 /app，具体命令通过 workdir 切换目录
+CONTAINER_MOUNT = "/app"
+# forge 通过 svm 安装的 solc 放在命名卷里，--rm 容器之间也能复用，不必每次重新下载
+SVM_VOLUME = os.getenv("SANDBOX_SVM_VOLUME", "foundry-svm")
+SVM_MOUNT = "/root/.svm"
+# 流式读取命令输出时每次读取的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+POOL_LABEL = "solidity-recon.pool"
+OWNER_LABEL = "solidity-recon.owner"
+
+
+class SandboxTimeout(TimeoutError):
+    """沙盒命令超过截止时间，容器已被杀掉"""
+
+    def __init__(self, command: str, timeout: float):
+        super().__init__(f"沙盒命令超过 {timeout:.0f}s 未结束，已终止容器: {command[:80]}")
+        self.command = command
+        self.timeout = timeout
+
+
+class SandboxCancelled(RuntimeError):
+    """沙盒命令被调用方取消 (例如分片 fuzz 中其他分片已经找到反例)，容器已被杀掉"""
+
+
+class _Deadline:
+    """
+    [超时] 到期或 cancel 事件被设置后，在后台线程调用 on_expire (杀掉容器)，被阻塞的读取随之结束
+    timeout 和 cancel 都为 None 时不做任何事
+    """
+
+    CANCEL_POLL_INTERVAL = 0.1
+
+    def __init__(self, timeout, on_expire, cancel: threading.Event = None):
+        self.expired = False
+        self.cancelled = False
+        self._timeout = timeout
+        self._cancel = cancel
+        self._on_expire = on_expire
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True) if timeout or cancel else None
+
+    def _watch(self):
+        end = time.monotonic() + self._timeout if self._timeout else None
+        while True:
+            wait = self.CANCEL_POLL_INTERVAL if self._cancel is not None else None
+            if end is not None:
+                remaining = max(end - time.monotonic(), 0)
+                wait = remaining if wait is None else min(wait, remaining)
+            if self._finished.wait(wait):
+                return
+            if self._cancel is not None and self._cancel.is_set():
+                self.cancelled = True
+                break
+            if end is not None and time.monotonic() >= end:
+                self.expired = True
+                break
+        try:
+            self._on_expire()
+        except Exception:
+            pass  # 容器可能恰好已经退出
+
+    @property
+    def triggered(self) -> bool:
+        return self.expired or self.cancelled
+
+    def check(self, command: str, cause: BaseException = None):
+        """已超时 / 已取消时抛出对应的异常"""
+        if self.expired:
+            raise SandboxTimeout(command, self._timeout) from cause
+        if self.cancelled:
+            raise SandboxCancelled(f"沙盒命令已取消: {command[:80]}") from cause
+
+    def __enter__(self):
+        if self._thread:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._finished.set()
+
+
+def _volumes() -> dict:
+    """常驻容器的挂载：workspace (读写)、svm 命名卷、本地 solc 仓库 (只读，存在时)"""
+    volumes = {
+        WORKSPACE_DIR: {"bind": CONTAINER_MOUNT, "mode": "rw"},
+        SVM_VOLUME: {"bind": SVM_MOUNT, "mode": "rw"},
+    }
+    if os.path.isdir(SOLC_STORE):
+        volumes[os.path.abspath(SOLC_STORE)] = {"bind": SOLC_STORE_MOUNT, "mode": "ro"}
+    return volumes
+
+
+def to_container_path(host_dir: str) -> str:
+    """[路径映射] 将宿主机 workspace 下的目录映射为常驻容器内的路径"""
+    rel = os.path.relpath(os.path.abspath(host_dir), WORKSPACE_DIR)
+    if rel == ".":
+        return CONTAINER_MOUNT
+    if rel.startswith(".."):
+        raise ValueError(f"❌ 目录不在 workspace 内，常驻容器无法访问: {host_dir}")
+    return f"{CONTAINER_MOUNT}/{rel.replace(os.sep, '/')}"
+
+
+class ContainerPool:
+    """
+    [容器池] 维护一组常驻的 foundry-box 容器
+    - acquire 时做健康检查，容器挂掉则丢弃重建
+    - 容器执行次数达到上限或执行出错后回收
+    - 进程退出时统一清理
+    """
+
+    def __init__(self, image: str = SANDBOX_IMAGE, size: int = SANDBOX_POOL_SIZE,
+                 max_uses: int = SANDBOX_MAX_USES):
+        self.image = image
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._client = None
+        self._idle = queue.LifoQueue()  # 后进先出：优先复用刚用过的热容器
+        self._uses = {}
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            if docker is None:
+                raise DockerException("未安装 Docker SDK (pip install docker)")
+            self._client = docker.from_env()
+            self._remove_orphans()
+        return self._client
+
+    def _remove_orphans(self):
+        """清理本机上已退出进程遗留的池容器"""
+        host = socket.gethostname()
+        for container in self._client.containers.list(all=True, filters={"label": POOL_LABEL}):
+            owner = container.labels.get(OWNER_LABEL, "")
+            owner_host, _, pid = owner.rpartition(":")
+            if owner_host != host or not pid.isdigit() or _pid_alive(int(pid)):
+                continue
+            try:
+                container.remove(force=True)
+            except DockerException:
+                pass
+
+    def _create(self):
+        with span("sandbox.container_start", image=self.image):
+            container = self.client.containers.run(
+                self.image,
+                entrypoint=["sleep", "infinity"],
+                detach=True,
+                volumes=_volumes(),
+                working_dir=CONTAINER_MOUNT,
+                labels={POOL_LABEL: "1", OWNER_LABEL: self.owner},
+            )
+        with self._lock:
+            self._uses[container.id] = 0
+        print(f"🐳 [Pool] 启动常驻容器 {container.short_id} ({self._created}/{self.size})")
+        return container
+
+    def _destroy(self, container):
+        with self._lock:
+            self._uses.pop(container.id, None)
+            self._created -= 1
+        try:
+            container.remove(force=True)
+        except DockerException:
+            pass
+
+    def _is_healthy(self, container) -> bool:
+        try:
+            container.reload()
+        except DockerException:
+            return False
+        return container.status == "running"
+
+    def acquire(self):
+        """获取一个健康的容器；池满时阻塞等待其他调用归还"""
+        while True:
+            try:
+                container = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1  # 先占位，避免并发时超额创建
+                if can_create:
+                    try:
+                        return self._create()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                try:
+                    # 带超时等待：其他线程回收容器后这里可以重新尝试创建
+                    container = self._idle.get(timeout=1)
+                except queue.Empty:
+                    continue
+
+            if self._is_healthy(container):
+                return container
+            print(f"♻️ [Pool] 容器 {container.short_id} 健康检查失败，重建中...")
+            self._destroy(container)
+
+    def ensure_capacity(self, size: int):
+        """批量模式下按并发度扩容 (只增不减)"""
+        with self._lock:
+            self.size = max(self.size, size)
+
+    def release(self, container, healthy: bool = True):
+        """归还容器；不健康或达到使用上限的容器直接回收"""
+        with self._lock:
+            uses = self._uses.get(container.id, 0) + 1
+            self._uses[container.id] = uses
+        if self._closed or not healthy or uses >= self.max_uses:
+            self._destroy(container)
+        else:
+            self._idle.put(container)
+
+    def exec(self, command: str, workdir: str = CONTAINER_MOUNT, timeout: float = None) -> subprocess.CompletedProcess:
+        """在热容器中执行命令，返回与 subprocess.run 相同结构的结果；超时杀掉容器并抛出 SandboxTimeout"""
+        with span("sandbox.startup", mode="pool"):
+            container = self.acquire()
+        healthy = True
+        deadline = _Deadline(timeout, container.kill)
+        try:
+            with deadline:
+                exit_code, (stdout, stderr) = container.exec_run(
+                    ["/bin/sh", "-c", command], workdir=workdir, demux=True
+                )
+        except Exception as e:
+            healthy = not isinstance(e, DockerException)
+            deadline.check(command, e)
+            raise
+        finally:
+            # 超时被杀掉的容器不再归还，由池重新创建
+            self.release(container, healthy and not deadline.triggered)
+
+        deadline.check(command)
+        return subprocess.CompletedProcess(
+            args=command,
+            returncode=exit_code,
+            stdout=(stdout or b"").decode("utf-8", errors="replace"),
+            stderr=(stderr or b"").decode("utf-8", errors="replace"),
+        )
+
+    def exec_stream(self, command: str, on_stdout, on_stderr, workdir: str = CONTAINER_MOUNT,
+                    timeout: float = None, cancel: threading.Event = None) -> int:
+        """
+        在热容器中执行命令，输出按块交给回调而不在内存中累积，返回退出码
+        超时处理同 exec；cancel 事件被设置时同样杀掉容器，抛出 SandboxCancelled
+        """
+        with span("sandbox.startup", mode="pool"):
+            container = self.acquire()
+        healthy = True
+        deadline = _Deadline(timeout, container.kill, cancel)
+        try:
+            with deadline:
+                api = self.client.api
+                exec_id = api.exec_create(container.id, ["/bin/sh", "-c", command], workdir=workdir)["Id"]
+                for stdout, stderr in api.exec_start(exec_id, stream=True, demux=True):
+                    if stdout:
+                        on_stdout(stdout)
+                    if stderr:
+                        on_stderr(stderr)
+                exit_code = api.exec_inspect(exec_id)["ExitCode"]
+        except Exception as e:
+            healthy = not isinstance(e, DockerException)
+            deadline.check(command, e)
+            raise
+        finally:
+            self.release(container, healthy and not deadline.triggered)
+
+        deadline.check(command)
+        return exit_code
+
+    def shutdown(self):
+        """销毁池中所有容器"""
+        self._closed = True
+        while True:
+            try:
+                self._destroy(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_container_pool() -> ContainerPool:
+    """获取进程内共享的容器池 (惰性创建)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ContainerPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def _docker_cli_command(command: str, workspace_dir: str, name: str) -> list:
+    mounts = ["-v", f"{workspace_dir}:{CONTAINER_MOUNT}", "-v", f"{SVM_VOLUME}:{SVM_MOUNT}"]
+    if os.path.isdir(SOLC_STORE):
+        mounts += ["-v", f"{os.path.abspath(SOLC_STORE)}:{SOLC_STORE_MOUNT}:ro"]
+    return ["docker", "run", "--rm", "--name", name, *mounts, SANDBOX_IMAGE, command]
+
+
+def _cli_container_name() -> str:
+    return f"recon-sandbox-{uuid.uuid4().hex[:12]}"
+
+
+def _kill_cli_container(name: str):
+    """杀掉 docker run 的 client 进程并不会停止容器，需要按名字强制删除"""
+    subprocess.run(["docker", "rm", "-f", name], capture_output=True)
+
+
+def _run_with_docker_cli(command: str, workspace_dir: str, timeout: float = None) -> subprocess.CompletedProcess:
+    """[兼容模式] 每次 docker run --rm 一个新容器"""
+    name = _cli_container_name()
+    cmd = _docker_cli_command(command, workspace_dir, name)
+    try:
+        return subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            timeout=timeout
+        )
+    except subprocess.TimeoutExpired as e:
+        _kill_cli_container(name)
+        raise SandboxTimeout(command, timeout) from e
+
+
+def run_in_sandbox(command: str, workspace_dir: str = WORKSPACE_DIR, timeout: float = None) -> subprocess.CompletedProcess:
+    """
+    [Sandbox] 在 foundry-box 中执行 shell 命令，工作目录为 workspace_dir 对应的容器路径
+    默认走常驻容器池；Docker SDK 不可用时自动退回 docker run --rm 模式
+    timeout 秒内未结束时杀掉容器并抛出 SandboxTimeout
+    """
+    started = time.perf_counter()
+    try:
+        if SANDBOX_MODE == "pool":
+            try:
+                pool = get_container_pool()
+                return pool.exec(command, workdir=to_container_path(workspace_dir), timeout=timeout)
+            except DockerException as e:
+                print(f"⚠️ [Pool] 常驻容器不可用，退回 docker run 模式: {e}")
+
+        return _run_with_docker_cli(command, workspace_dir, timeout)
+    finally:
+        charge_container(time.perf_counter() - started)
+
+
+def _pump(pipe, callback):
+    for chunk in iter(lambda: pipe.read1(STREAM_CHUNK_SIZE), b""):
+        callback(chunk)
+    pipe.close()
+
+
+def _stream_with_docker_cli(command: str, workspace_dir: str, on_stdout, on_stderr, timeout: float = None,
+                            cancel: threading.Event = None) -> int:
+    """[兼容模式] docker run --rm，从管道中边读边回调"""
+    name = _cli_container_name()
+    proc = subprocess.Popen(_docker_cli_command(command, workspace_dir, name), stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+
+    def kill():
+        _kill_cli_container(name)
+        proc.kill()
+
+    with _Deadline(timeout, kill, cancel) as deadline:
+        # stderr 在单独的线程中读取，避免任一管道写满导致死锁
+        stderr_thread = threading.Thread(target=_pump, args=(proc.stderr, on_stderr), daemon=True)
+        stderr_thread.start()
+        _pump(proc.stdout, on_stdout)
+        stderr_thread.join()
+        returncode = proc.wait()
+    deadline.check(command)
+    return returncode
+
+
+def stream_in_sandbox(command: str, workspace_dir: str = WORKSPACE_DIR, on_stdout=None, on_stderr=None,
+                      timeout: float = None, cancel: threading.Event = None) -> int:
+    """
+    [Sandbox] 与 run_in_sandbox 相同，但 stdout/stderr 以字节块的形式交给回调，返回退出码
+    用于输出很大的命令 (forge test -vvvv / forge build --json)，调用方自行决定保留哪些内容
+    cancel 事件被设置时杀掉容器并抛出 SandboxCancelled
+    """
+    on_stdout = on_stdout or (lambda chunk: None)
+    on_stderr = on_stderr or (lambda chunk: None)
+    started = time.perf_counter()
+    try:
+        if SANDBOX_MODE == "pool":
+            received = []
+
+            def on_pool_stdout(chunk):
+                received.append(True)
+                on_stdout(chunk)
+
+            try:
+                pool = get_container_pool()
+                return pool.exec_stream(command, on_pool_stdout, on_stderr, workdir=to_container_path(workspace_dir),
+                                        timeout=timeout, cancel=cancel)
+            except DockerException as e:
+                if received:
+                    raise  # 输出已部分交给调用方，不能再重跑一遍
+                print(f"⚠️ [Pool] 常驻容器不可用，退回 docker run 模式: {e}")
+
+        return _stream_with_docker_cli(command, workspace_dir, on_stdout, on_stderr, timeout, cancel)
+    finally:
+        charge_container(time.perf_counter() - started)
@@ -1,30 +1,119 @@
-import subprocess
 import os
+import re
 import json
-from src.tools.file_utils import WORKSPACE_DIR
-
-
-def create_foundry_config():
-    """
-    [配置] 创建 foundry.toml
-    告诉 Foundry 将当前目录 (.) 既作为源码目录也作为测试目录。
-    """
-    config_content = """
+import hashlib
+import threading
+from src.tools.file_utils import WORKSPACE_DIR, CACHE_DIR, save_to_workspace, remove_from_workspace
+from src.tools.forge_stream import run_forge_streaming
+from src.tools.container_pool import SandboxTimeout
+from src.tools.disk_cache import DiskCache
+from src.tools.trace_summary import summarize_test_result
+from src.tools.telemetry import span
+from src.tools.budget import stage_timeout
+from src.tools.solc_resolver import resolve_version, container_solc_path
+from src.tools.project_loader import get_project_index
+
+FORGE_REMAPPINGS = "forge-std/=/opt/foundry/lib/forge-std/src/"
+# -vvvv 让 JSON 结果中带上成功用例的调用 trace，用于生成调用链摘要
+FORGE_TEST_VERBOSITY = os.getenv("FORGE_TEST_VERBOSITY", "-vvvv")
+# 单次 forge build / forge test 的截止时间 (秒)，超时杀掉容器；0 表示只受 run 的墙钟预算限制
+FORGE_BUILD_TIMEOUT = float(os.getenv("FORGE_BUILD_TIMEOUT", "180"))
+FORGE_TEST_TIMEOUT = float(os.getenv("FORGE_TEST_TIMEOUT", "300"))
+
+# out/ 和 cache/ 都位于每个 run 独立的 workspace 中 (宿主机目录)，跨轮次保留，
+# 配合按 pragma 选定的 solc 版本，forge 只会重新编译内容发生变化的文件
+# sparse_mode: forge test 只编译 --match-path 选中的测试文件及其依赖，多文件工程中不相关的合约不参与编译
+# lib / node_modules 是多文件工程 (见 project_loader.py) 中被链接进来的依赖库
+FOUNDRY_CONFIG_TEMPLATE = """
 [profile.default]
 src = "."
 test = "."
 out = "out"
-libs = ["/opt/foundry/lib"]
+cache_path = "cache"
+libs = ["/opt/foundry/lib", "lib", "node_modules"]
+sparse_mode = true
+{solc}
+auto_detect_solc = false
 """
-    config_path = os.path.join(WORKSPACE_DIR, "foundry.toml")
-    with open(config_path, "w", encoding="utf-8") as f:
-        f.write(config_content)
 
+# 编译产物/缓存目录，计算源码指纹时跳过
+_IGNORED_DIRS = {"out", "cache", "lib", ".cache", "runs"}
 
-def extract_json_from_stdout(stdout: str):
+_compile_cache = None
+_compile_cache_lock = threading.Lock()
+
+
+def get_compile_cache() -> DiskCache:
+    """[缓存] 编译结果缓存：源码指纹 -> (is_valid, error)"""
+    global _compile_cache
+    with _compile_cache_lock:
+        if _compile_cache is None:
+            _compile_cache = DiskCache(
+                os.path.join(CACHE_DIR, "compile_cache.sqlite"),
+                max_entries=int(os.getenv("COMPILE_CACHE_MAX_ENTRIES", "2000"))
+            )
+        return _compile_cache
+
+
+def _read_sources(workspace_dir: str, filenames: list = None) -> list:
     """
-    [解析] 滑动窗口提取 JSON
-    解决 stdout 中混杂非 JSON 日志的问题
+    参与编译的 .sol 源码 [(相对路径, 内容 bytes)]，按路径排序
+    多文件工程只读取 filenames 的编译单元 (import 闭包)；单文件模式读取 workspace 内的所有源码
+    """
+    index = get_project_index(workspace_dir)
+    if index is not None and filenames:
+        return [(rel, index.source(rel)) for rel in index.dependencies(filenames)]
+
+    sources = []
+    for root, dirs, files in os.walk(workspace_dir):
+        dirs[:] = [d for d in dirs if d not in _IGNORED_DIRS]
+        for name in files:
+            if name.endswith(".sol"):
+                path = os.path.join(root, name)
+                with open(path, "rb") as f:
+                    sources.append((os.path.relpath(path, workspace_dir).replace(os.sep, "/"), f.read()))
+    return sorted(sources)
+
+
+def foundry_config(sources: list) -> str:
+    """按所有源码的 pragma 选出 solc：本地仓库中的版本直接指定编译器路径，否则使用镜像自带的版本"""
+    version = resolve_version([data.decode("utf-8", "replace") for _, data in sources])
+    path = container_solc_path(version)
+    return FOUNDRY_CONFIG_TEMPLATE.format(solc=f'solc = "{path}"' if path else f'solc_version = "{version}"')
+
+
+def compute_compile_key(filename: str, workspace_dir: str = WORKSPACE_DIR) -> str:
+    """
+    [指纹] key 覆盖 filename 的编译单元 (单文件模式下 forge build 是全量编译，即 workspace 内所有 .sol 源码)，
+    再加上 remappings、foundry 配置 (含选定的 solc) 以及被检查的文件名
+    """
+    sources = _read_sources(workspace_dir, [filename])
+    h = hashlib.sha256()
+    for part in (filename, FORGE_REMAPPINGS, foundry_config(sources)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+
+    for rel, data in sources:
+        h.update(rel.encode("utf-8"))
+        h.update(b"\0")
+        h.update(hashlib.sha256(data).digest())
+
+    return h.hexdigest()
+
+
+def create_foundry_config(workspace_dir: str = WORKSPACE_DIR, filenames: list = None):
+    """
+    [配置] 创建 foundry.toml
+    告诉 Foundry 将当前目录 (.) 既作为源码目录也作为测试目录；solc 版本按本次编译的源码的 pragma 选择
+    """
+    # 配置不变时不重写，避免 mtime 变化
+    save_to_workspace("foundry.toml", foundry_config(_read_sources(workspace_dir, filenames)), workspace_dir)
+
+
+def iter_json_objects(stdout: str):
+    """
+    [解析] 依次产出 stdout 中所有完整的 JSON 对象
+    解析成功后直接跳到该对象末尾继续，日志中零散的 '{' 只会被跳过
     """
     decoder = json.JSONDecoder()
     pos = 0
@@ -32,17 +121,27 @@ def extract_json_from_stdout(stdout: str):
     while True:
         pos = stdout.find('{', pos)
         if pos == -1:
-            return None
+            return
 
         try:
-            obj, _ = decoder.raw_decode(stdout[pos:])
-            return obj
+            obj, end = decoder.raw_decode(stdout, pos)
+            yield obj
+            pos = end
+            continue
         except json.JSONDecodeError:
             pass
 
         pos += 1
 
 
+def extract_json_from_stdout(stdout: str):
+    """
+    [解析] 滑动窗口提取 JSON
+    解决 stdout 中混杂非 JSON 日志的问题
+    """
+    return next(iter_json_objects(stdout), None)
+
+
 def find_recursive(data, target_key):
     """
     [递归查找] 在任意深度的字典中查找指定的 Key
@@ -60,122 +159,327 @@ def find_recursive(data, target_key):
     return None
 
 
-def check_compilation(filename: str):
+def same_file(file_path: str, filename: str) -> bool:
+    """Foundry 返回的路径可能是 "Target.sol" 或 "/app/Target.sol"，按路径后缀匹配"""
+    file_path = file_path.replace("\\", "/")
+    return file_path == filename or file_path.endswith("/" + filename)
+
+
+def check_compilation(filename: str, workspace_dir: str = WORKSPACE_DIR):
     """
     [Checker] 专门负责检查代码是否可编译 (Syntax Check)
     逻辑：执行全量编译 -> 解析 JSON 错误 -> 过滤出与 filename 相关的错误
     """
-    print(f"🔍 [Checker] 正在通过编译器检查语法: {filename}...")
-    create_foundry_config()
+    return check_compilation_batch([filename], workspace_dir)[filename]
+
 
+def check_compilation_batch(filenames: list, workspace_dir: str = WORKSPACE_DIR) -> dict:
+    """
+    [Checker] 一次 forge build 检查多个文件，返回 {filename: (is_valid, error)}
+    已命中缓存的文件不再参与判断；全部命中时不启动容器
+    """
+    # 0. 查缓存：源码完全相同则直接复用上次的结论，不启动容器
+    cache = get_compile_cache()
+    keys = {name: compute_compile_key(name, workspace_dir) for name in filenames}
+    verdicts = {}
+    for name, key in keys.items():
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"⚡ [Checker] 编译缓存命中: {name}")
+            verdicts[name] = (cached[0], cached[1])
+
+    pending = [name for name in filenames if name not in verdicts]
+    if not pending:
+        return verdicts
+
+    print(f"🔍 [Checker] 正在通过编译器检查语法: {', '.join(pending)}...")
+    create_foundry_config(workspace_dir, pending)
+
+    results, cacheable = run_compilation(pending, workspace_dir)
+    for name, verdict in results.items():
+        if cacheable:
+            cache.put(keys[name], list(verdict))
+        verdicts[name] = verdict
+    return verdicts
+
+
+def run_compilation(filenames: list, workspace_dir: str):
+    """执行 forge build 并按文件过滤错误，返回 ({filename: (is_valid, error)}, 结果是否可缓存)"""
     # 1. 运行编译命令 (去掉不支持的 --files，使用 --json 获取结构化错误)
-    # --skip test/script 没什么用，因为我们的目录结构很扁平，直接全量编译
-    cmd = [
-        "docker", "run", "--rm",
-        "-v", f"{WORKSPACE_DIR}:/app",
-        "foundry-box",
-        "forge build --json --remappings forge-std/=/opt/foundry/lib/forge-std/src/"
-    ]
-
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        encoding="utf-8"
-    )
+    # 单文件模式目录结构很扁平，直接全量编译；多文件工程只编译 filenames 的编译单元
+    cmd = f"forge build --json --remappings {FORGE_REMAPPINGS}"
+    if get_project_index(workspace_dir) is not None:
+        cmd += " " + " ".join(filenames)
 
-    # 2. 解析编译结果
-    data = extract_json_from_stdout(result.stdout)
+    # 2. 边读边解析编译结果 (只保留 errors，跳过庞大的 contracts / sources)
+    timeout = stage_timeout(FORGE_BUILD_TIMEOUT)
+    try:
+        with span("sandbox.compile", files=len(filenames)) as s:
+            result, data = run_forge_streaming(cmd, workspace_dir, timeout=timeout)
+            s.set(returncode=result.returncode)
+    except SandboxTimeout as e:
+        # 超时不是源码本身的结论，不写入缓存
+        timed_out = (False, f"COMPILATION TIMED OUT: {e}")
+        return {name: timed_out for name in filenames}, False
 
     # 如果没拿到 JSON，且返回码非0，说明是严重的环境错误（如 Docker 挂了）
+    # 这类环境错误不写入缓存
     if not data and result.returncode != 0:
-        return False, f"COMPILATION CRASHED (No JSON output):\n{result.stderr}\n{result.stdout}"
+        crashed = (False, f"COMPILATION CRASHED (No JSON output):\n{result.stderr}\n{result.stdout}")
+        return {name: crashed for name in filenames}, False
 
     # 3. 错误过滤 (Error Filtering)
     # Foundry build 的 JSON 输出顶层通常包含 "errors" 列表
-    if data and "errors" in data:
-        # 筛选出 severity 为 error 的项 (忽略 warnings)
-        errors = [e for e in data["errors"] if e.get("severity") == "error"]
+    file_errors = filter_file_errors((data or {}).get("errors", []), filenames)
 
+    verdicts = {}
+    for filename in filenames:
+        if filename in file_errors:
+            verdicts[filename] = (False, file_errors[filename])
+        else:
+            # 如果没有找到针对当前文件的 Error，即使 returncode != 0 (可能是别的文件错了)，我们也认为当前文件是 Valid 的
+            verdicts[filename] = (True, "Compilation Passed")
+
+    return verdicts, True
+
+
+def filter_file_errors(errors: list, filenames: list) -> dict:
+    """
+    [过滤] 从编译器错误列表中挑出属于 filenames 的 error (忽略 warnings)
+    返回 {filename: "COMPILATION FAILED in ..."}，只包含有错误的文件
+    """
+    # 筛选出 severity 为 error 的项 (忽略 warnings)
+    errors = [e for e in errors if e.get("severity") == "error"]
+
+    messages = {}
+    for filename in filenames:
         # 进一步筛选：只关心 sourceLocation.file 匹配当前 filename 的错误
-        # Foundry 返回的路径可能是 "Target.sol" 或 "/app/Target.sol"
-        target_errors = []
-        for e in errors:
-            file_path = e.get("sourceLocation", {}).get("file", "")
-            # 使用 endswith 匹配文件名，处理绝对/相对路径差异
-            if file_path and file_path.endswith(filename):
-                target_errors.append(e)
+        target_errors = [
+            e for e in errors
+            if same_file(e.get("sourceLocation", {}).get("file", ""), filename)
+        ]
+        if not target_errors:
+            continue
 
-        if target_errors:
-            # 格式化错误信息
-            error_msg_list = []
-            for e in target_errors:
-                line = e.get('sourceLocation', {}).get('start', '?')
-                msg = e.get('formattedMessage', e.get('message', 'Unknown Error'))
-                error_msg_list.append(f"Line {line}: {msg}")
+        # 格式化错误信息
+        error_msg_list = []
+        for e in target_errors:
+            location = e.get('sourceLocation', {})
+            line = location.get('line', location.get('start', '?'))
+            msg = e.get('formattedMessage', e.get('message', 'Unknown Error'))
+            error_msg_list.append(f"Line {line}: {msg}")
 
-            return False, f"COMPILATION FAILED in {filename}:\n" + "\n".join(error_msg_list)
+        messages[filename] = f"COMPILATION FAILED in {filename}:\n" + "\n".join(error_msg_list)
+    return messages
 
-    # 如果没有找到针对当前文件的 Error，即使 returncode != 0 (可能是别的文件错了)，我们也认为当前文件是 Valid 的
-    return True, "Compilation Passed"
 
+# forge test 编译失败时输出的是 solc 的文本格式:
+#   Error (7576): Undeclared identifier.
+#     --> Exploit.t.sol:15:9:
+_ERROR_HEADER = re.compile(r"^\s*(?:Error: )?(\w*Error|Warning)(?: \((\d+)\))?: (.+)$")
+_ERROR_LOCATION = re.compile(r"-->\s*(\S+?):(\d+):(\d+)")
 
-def run_forge_test(test_file_name: str = "Exploit.t.sol"):
+
+def parse_compiler_text(output: str) -> list:
     """
-    [Executor] 执行器，只负责跑逻辑
+    [解析] 把 solc 文本格式的报错转换为与 forge build --json 相同结构的错误列表
     """
-    print(f"🐳 [Executor] 正在启动容器运行测试: {test_file_name}...")
-    create_foundry_config()
+    errors = []
+    current = None
+    for line in output.splitlines():
+        header = _ERROR_HEADER.match(line)
+        if header:
+            current = {
+                "severity": "warning" if header.group(1) == "Warning" else "error",
+                "type": header.group(1),
+                "errorCode": header.group(2),
+                "message": header.group(3).strip(),
+                "formattedMessage": line.strip(),
+                "sourceLocation": {},
+            }
+            errors.append(current)
+            continue
+        if current is None:
+            continue
+        location = _ERROR_LOCATION.search(line)
+        if location and not current["sourceLocation"]:
+            current["sourceLocation"] = {"file": location.group(1), "line": int(location.group(2))}
+        if line.strip():
+            current["formattedMessage"] += "\n" + line.rstrip()
+    return [e for e in errors if e["sourceLocation"]]
+
+
+def collect_test_results(data) -> dict:
+    """
+    [解析] 汇总 forge test --json 中所有测试套件的结果
+    返回 {"<文件>:<合约>::<测试函数>": result}；多个候选文件会对应多个套件
+    """
+    if isinstance(data, dict) and any(isinstance(v, dict) and "test_results" in v for v in data.values()):
+        merged = {}
+        for suite, suite_data in data.items():
+            for test_name, res in (suite_data.get("test_results") or {}).items():
+                merged[f"{suite}::{test_name}"] = res
+        return merged
+    # 兼容未知的输出结构：退回递归查找
+    return find_recursive(data, "test_results") or {}
 
-    cmd_str = (
-        f"forge test "
-        f"--match-path /app/{test_file_name} "
-        f"--json "
-        f"--remappings forge-std/=/opt/foundry/lib/forge-std/src/"
-    )
 
-    cmd = [
-        "docker", "run", "--rm",
-        "-v", f"{WORKSPACE_DIR}:/app",
-        "foundry-box",
-        cmd_str
-    ]
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)\s*(ms|us|µs|ns|h|m|s)\b")
+_DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 1e-3, "us": 1e-6, "µs": 1e-6, "ns": 1e-9}
 
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding="utf-8"
-        )
 
-        data = extract_json_from_stdout(result.stdout)
+def parse_duration(value) -> float:
+    """forge 的 duration 可能是 {"secs", "nanos"} 或 "1s 234ms 5µs" 这样的字符串，统一换算为秒"""
+    if isinstance(value, dict):
+        return value.get("secs", 0) + value.get("nanos", 0) / 1e9
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return sum(float(n) * _DURATION_UNITS[unit] for n, unit in _DURATION_PART.findall(value))
+    return 0.0
 
-        if data:
-            # 使用递归查找找到 test_results
-            test_results = find_recursive(data, "test_results")
 
-            if test_results:
-                logs_summary = ""
-                is_attack_success = False
+def suite_duration(data) -> float:
+    """所有测试套件的执行耗时之和 (秒)"""
+    if not isinstance(data, dict):
+        return 0.0
+    return sum(parse_duration(v.get("duration")) for v in data.values() if isinstance(v, dict))
 
-                for test_name, res in test_results.items():
-                    status = res.get("status")
-                    reason = res.get("reason", "None")
-                    logs_summary += f"Test: {test_name} | Status: {status} | Reason: {reason}\n"
 
-                    if status == "Success":
-                        is_attack_success = True
+def run_forge_test(test_file_name: str = "Exploit.t.sol", workspace_dir: str = WORKSPACE_DIR):
+    """
+    [Executor] 执行器，只负责跑逻辑
+    """
+    outcome = run_exploit_check([test_file_name], workspace_dir)
+    if outcome["status"] == "compile_error":
+        return "error", outcome["compiler_feedback"]
+    return outcome["status"], outcome["test_logs"]
 
-                if is_attack_success:
-                    return "success", f"ATTACK SUCCESS!\n{logs_summary}"
-                else:
-                    return "failed", f"ATTACK FAILED (Logic).\n{logs_summary}"
 
-        if result.returncode != 0:
-            return "error", f"CRITICAL: Execution Failed (Code {result.returncode}).\nSTDERR:\n{result.stderr}"
+def run_exploit_check(filenames: list, workspace_dir: str = WORKSPACE_DIR) -> dict:
+    """
+    [Checker + Executor] 一次 forge test --json 同时完成编译检查和执行
+    返回结构化结果:
+    - status: compile_error / success / failed / error / timeout
+    - compiler_feedback: 与 check_compilation 相同格式的报错 (compile_error 时)，或超时说明 (timeout 时)
+    - test_logs / test_results: 执行结果 (success / failed 时)
+    - winner: 攻击成功的文件 (多候选时用来确定胜出者)
+    多候选模式下，编译失败的候选会被删除，其余候选再执行一次
+    """
+    create_foundry_config(workspace_dir, filenames)
+    cache = get_compile_cache()
+
+    pending = list(filenames)
+    compile_errors = {}
+    while True:
+        outcome = _forge_test_once(pending, workspace_dir)
+        if outcome["status"] != "compile_error":
+            break
+
+        broken = [name for name in pending if name in outcome["compile_errors"]]
+        compile_errors.update(outcome["compile_errors"])
+        pending = [name for name in pending if name not in broken]
+        if not broken or not pending:
+            break
+
+        print(f"⚠️ [Checker] {len(broken)} 个候选编译失败，剩余 {len(pending)} 个重新执行...")
+        for name in broken:
+            remove_from_workspace(name, workspace_dir)
+
+    # 编译结论顺手写入编译缓存 (被删除的候选不再缓存)
+    if outcome["status"] in ("success", "failed"):
+        for name in pending:
+            cache.put(compute_compile_key(name, workspace_dir), [True, "Compilation Passed"])
+    elif outcome["status"] == "compile_error" and len(filenames) == 1:
+        cache.put(compute_compile_key(filenames[0], workspace_dir), [False, compile_errors[filenames[0]]])
+
+    if outcome["status"] == "compile_error" and not pending:
+        first_broken = next(name for name in filenames if name in compile_errors)
+        outcome["compiler_feedback"] = compile_errors[first_broken]
+    outcome["compile_errors"] = compile_errors
+    return outcome
+
+
+def forge_test_command(filenames: list, extra_args: str = "") -> str:
+    """拼出只运行 filenames 中测试文件的 forge test --json 命令"""
+    # 常驻容器的工作目录不一定是 /app，用 $PWD 拼出测试文件的绝对路径
+    # 多个文件用 glob 的 {a,b} 语法一次匹配
+    if len(filenames) == 1:
+        match_path = f"$PWD/{filenames[0]}"
+    else:
+        match_path = "$PWD/{" + ",".join(filenames) + "}"
+
+    return (
+        f"forge test "
+        f"--match-path \"{match_path}\" "
+        f"--json {FORGE_TEST_VERBOSITY} "
+        f"--remappings {FORGE_REMAPPINGS}"
+        + (f" {extra_args}" if extra_args else "")
+    )
+
 
-        return "error", f"Unknown Error (No JSON found).\nSTDOUT:\n{result.stdout}"
+def _forge_test_once(filenames: list, workspace_dir: str) -> dict:
+    print(f"🐳 [Executor] 正在启动容器编译并运行测试: {', '.join(filenames)}...")
+    cmd_str = forge_test_command(filenames)
 
+    outcome = {"status": "error", "compiler_feedback": "", "compile_errors": {},
+               "test_logs": "", "test_results": {}, "winner": None}
+    timeout = stage_timeout(FORGE_TEST_TIMEOUT)
+
+    try:
+        # 流式解析：只保留每个测试的状态 / 原因 / gas / 日志 / 调用树，结果对象完整后不再解析
+        with span("sandbox.test", files=len(filenames)) as s:
+            result, data = run_forge_streaming(cmd_str, workspace_dir, timeout=timeout)
+            # forge test 编译和执行在同一条命令里完成，执行时间取 forge 报告的套件耗时
+            s.set(returncode=result.returncode, execute_s=suite_duration(data))
+    except SandboxTimeout as e:
+        print(f"⏱️ [Executor] {e}")
+        outcome.update(status="timeout", test_logs=str(e), compiler_feedback=(
+            f"EXECUTION TIMED OUT: forge test did not finish within {timeout:.0f}s and the sandbox was killed. "
+            "The exploit most likely contains an unbounded loop or an extremely expensive call sequence; "
+            "bound every loop and keep the attack to the minimal number of calls."
+        ))
+        return outcome
     except Exception as e:
-        return "error", f"System Exception: {str(e)}"
\ No newline at end of file
+        outcome["test_logs"] = f"System Exception: {str(e)}"
+        return outcome
+
+    test_results = collect_test_results(data) if data else {}
+
+    # 1. 正常执行：汇总每个测试的结果
+    if test_results:
+        logs_summary = ""
+        winner = None
+
+        for test_name, res in test_results.items():
+            status = res.get("status")
+            # 调用链 / 余额变化压缩成摘要，而不是把完整的 trace 塞给 LLM
+            logs_summary += summarize_test_result(test_name, res)
+
+            if status == "Success" and winner is None:
+                # 套件名形如 "Exploit_1.t.sol:ExploitTest"，据此找到对应的文件
+                suite_path = test_name.split(":", 1)[0]
+                winner = next((f for f in filenames if same_file(suite_path, f)), filenames[0])
+
+        outcome["test_results"] = test_results
+        outcome["winner"] = winner
+        if winner:
+            outcome.update(status="success", test_logs=f"ATTACK SUCCESS!\n{logs_summary}")
+        else:
+            outcome.update(status="failed", test_logs=f"ATTACK FAILED (Logic).\n{logs_summary}")
+        return outcome
+
+    # 2. 编译失败：优先使用 JSON 中的 errors，否则解析 solc 的文本报错
+    errors = (data or {}).get("errors") or parse_compiler_text(result.stdout + "\n" + result.stderr)
+    file_errors = filter_file_errors(errors, filenames)
+    if file_errors:
+        outcome.update(status="compile_error", compile_errors=file_errors,
+                       compiler_feedback=next(iter(file_errors.values())))
+        return outcome
+
+    # 3. 其他错误 (环境问题 / 非目标文件编译失败)
+    if result.returncode != 0:
+        outcome["test_logs"] = f"CRITICAL: Execution Failed (Code {result.returncode}).\nSTDERR:\n{result.stderr}"
+    else:
+        outcome["test_logs"] = f"Unknown Error (No JSON found).\nSTDOUT:\n{result.stdout}"
+    return outcome
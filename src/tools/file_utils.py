@@ -1,13 +1,34 @@
 import os
+import re
 
 WORKSPACE_DIR = os.path.join(os.getcwd(), "workspace")
+# 各类持久化缓存 (编译结果等) 的存放目录
+CACHE_DIR = os.getenv("RECON_CACHE_DIR", os.path.join(WORKSPACE_DIR, ".cache"))
+# 每次对抗运行的独立工作目录: workspace/runs/<run_id>
+RUNS_DIR = os.path.join(WORKSPACE_DIR, "runs")
 
 
-def save_to_workspace(filename: str, content: str):
+def create_run_workspace(run_id: str) -> str:
+    """为一次运行创建独立的 workspace 目录，避免多个合约互相覆盖 Target.sol / Exploit.t.sol"""
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", run_id)
+    run_dir = os.path.join(RUNS_DIR, safe_id)
+    os.makedirs(run_dir, exist_ok=True)
+    return run_dir
+
+
+def save_to_workspace(filename: str, content: str, workspace_dir: str = WORKSPACE_DIR):
     """将代码保存到 workspace 目录"""
-    os.makedirs(WORKSPACE_DIR, exist_ok=True)
+    os.makedirs(workspace_dir, exist_ok=True)
+
+    file_path = os.path.join(workspace_dir, filename)
+    # 内容未变化时不重写文件，保持 mtime 稳定，让 forge 的增量编译缓存生效
+    if read_from_workspace(filename, workspace_dir) == content:
+        return file_path
+
+    # 多文件工程的源码是指向原工程的硬链接，先断开链接再写，不能改到原工程
+    if os.path.exists(file_path) and os.stat(file_path).st_nlink > 1:
+        os.remove(file_path)
 
-    file_path = os.path.join(WORKSPACE_DIR, filename)
     # 强制使用 UTF-8 和 Linux 换行符，防止 Docker 里的编译器报错
     with open(file_path, "w", encoding="utf-8", newline="\n") as f:
         f.write(content)
@@ -15,10 +36,17 @@ def save_to_workspace(filename: str, content: str):
     return file_path
 
 
-def read_from_workspace(filename: str) -> str:
+def read_from_workspace(filename: str, workspace_dir: str = WORKSPACE_DIR) -> str:
     """读取 workspace 中的文件"""
-    file_path = os.path.join(WORKSPACE_DIR, filename)
+    file_path = os.path.join(workspace_dir, filename)
     if not os.path.exists(file_path):
         return ""
-    with open(file_path, "r", encoding="utf-8") as f:
-        return f.read()
\ No newline at end of file
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def remove_from_workspace(filename: str, workspace_dir: str = WORKSPACE_DIR):
+    """删除 workspace 中的文件 (不存在时忽略)"""
+    file_path = os.path.join(workspace_dir, filename)
+    if os.path.exists(file_path):
+        os.remove(file_path)
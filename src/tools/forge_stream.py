@@ -0,0 +1,273 @@
+import codecs
+import collections
+import json
+import os
+import re
+import subprocess
+import threading
+
+from src.tools.file_utils import WORKSPACE_DIR
+from src.tools.container_pool import stream_in_sandbox
+
+# 非 JSON 输出 (编译日志 / solc 文本报错) 只保留尾部，用于报错信息
+STREAM_TAIL_CHARS = int(os.getenv("STREAM_TAIL_CHARS", "65536"))
+# 保留下来的单个字符串字段的最大长度
+STREAM_MAX_STRING = int(os.getenv("STREAM_MAX_STRING", "4096"))
+# 每个测试最多保留多少个调用树节点 / 日志行 (摘要只展示其中很少的一部分)
+STREAM_MAX_TRACE_NODES = int(os.getenv("STREAM_MAX_TRACE_NODES", "200"))
+STREAM_MAX_LOGS = int(os.getenv("STREAM_MAX_LOGS", "200"))
+
+# === 提取规则 ===
+# None: 跳过 (不构造对象); True: 完整保留; dict: 只保留列出的 key，"*" 匹配任意 key / 数组元素，
+# "#max" 限制数组最多保留的元素个数
+TRACE_SPEC = {
+    "depth": True, "address": True, "caller": True, "value": True, "success": True, "data": True,
+    "decoded": {"label": True, "call_data": {"signature": True, "args": True}},
+}
+
+TEST_RESULT_SPEC = {
+    "status": True,
+    "reason": True,
+    "kind": True,
+    "counterexample": True,
+    "labeled_addresses": True,
+    "decoded_logs": {"*": True, "#max": STREAM_MAX_LOGS},
+    # traces: [[kind, {"arena": [{"trace": {...}}, ...]}], ...]
+    "traces": {"*": {"*": {"arena": {"*": {"trace": TRACE_SPEC}, "#max": STREAM_MAX_TRACE_NODES}}}},
+}
+
+# forge test --json: {"<文件>:<合约>": {"duration": ..., "test_results": {...}}}
+# forge build --json: {"errors": [...], "sources": ..., "contracts": ...}，只保留 errors
+FORGE_RESULT_SPEC = {
+    "errors": True,
+    "*": {"duration": True, "test_results": {"*": TEST_RESULT_SPEC}},
+}
+
+_TOKEN_RE = re.compile(
+    r'[ \t\r\n]*(?:([{}\[\]:,])|"([^"\\]*(?:\\.[^"\\]*)*)"|(-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?)|(true|false|null))'
+)
+# 被块边界切断的 token: 未闭合的字符串 / 数字 / true false null 的前缀
+_PARTIAL_RE = re.compile(r'[ \t\r\n]*(?:"[^"\\]*(?:\\.[^"\\]*)*\\?|-?[\d.eE+-]*|t(?:r(?:u)?)?|f(?:a(?:l(?:s)?)?)?|n(?:u(?:l)?)?)')
+_LEADING_WS = re.compile(r"[ \t\r]*")
+_LITERALS = {"true": True, "false": False, "null": None}
+_string_decoder = json.JSONDecoder(strict=False)
+
+
+class _Tail:
+    """只保留最后 limit 个字符的文本缓冲区"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._parts = collections.deque()
+        self._size = 0
+
+    def append(self, text: str):
+        if not text:
+            return
+        self._parts.append(text)
+        self._size += len(text)
+        while self._size - len(self._parts[0]) >= self.limit:
+            self._size -= len(self._parts.popleft())
+
+    def text(self) -> str:
+        return "".join(self._parts)[-self.limit:]
+
+
+class _JsonSyntaxError(ValueError):
+    pass
+
+
+class ForgeOutputParser:
+    """
+    [解析] forge 输出的流式解析器
+    - 逐块喂入 stdout，线性时间扫描；只有行首的 '{' 才会被当作 JSON 的开始，日志中零散的 '{' 不会触发解析
+    - 按 spec 只构造需要的字段 (测试状态 / 原因 / gas / 日志 / 调用树 / 编译错误)，其余内容边扫描边丢弃
+    - 结果对象闭合后 done=True，之后的输出不再解析
+    内存占用只与保留的字段、最长的单个 token 和 STREAM_TAIL_CHARS 有关，与输出总长度无关
+    """
+
+    def __init__(self, spec: dict = FORGE_RESULT_SPEC):
+        self.spec = spec
+        self.result = None
+        self.done = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buf = ""
+        self._line_start = True
+        self._stack = None  # 非 None 表示正在解析 JSON
+        self._tail = _Tail(STREAM_TAIL_CHARS)
+
+    @property
+    def text(self) -> str:
+        """JSON 之外的输出 (尾部)"""
+        return self._tail.text()
+
+    def feed(self, chunk: bytes):
+        if self.done:
+            return
+        self._buf += self._decoder.decode(chunk)
+        self._process(final=False)
+
+    def close(self):
+        if not self.done:
+            self._buf += self._decoder.decode(b"", final=True)
+            self._process(final=True)
+        self._buf = ""
+
+    def _process(self, final: bool):
+        buf = self._buf
+        pos = 0
+        while pos < len(buf) and not self.done:
+            if self._stack is not None:
+                pos = self._parse_json(buf, pos, final)
+                if self._stack is not None:
+                    break  # 需要更多输入
+                continue
+
+            if self._line_start:
+                start = _LEADING_WS.match(buf, pos).end()
+                if start == len(buf) and not final:
+                    break
+                if start < len(buf) and buf[start] == "{":
+                    self._stack = []
+                    pos = start
+                    continue
+
+            newline = buf.find("\n", pos)
+            end = len(buf) if newline == -1 else newline + 1
+            self._tail.append(buf[pos:end])
+            self._line_start = newline != -1
+            pos = end
+        self._buf = "" if self.done else buf[pos:]
+
+    # === JSON 事件处理 ===
+    def _parse_json(self, buf: str, pos: int, final: bool) -> int:
+        try:
+            while self._stack is not None:
+                match = _TOKEN_RE.match(buf, pos)
+                if match is None or (match.group(3) is not None and match.end() == len(buf) and not final):
+                    if not final and _PARTIAL_RE.fullmatch(buf, pos):
+                        return pos  # token 被切断在块边界，等待下一块
+                    raise _JsonSyntaxError(buf[pos:pos + 20])
+                pos = match.end()
+                punct, string, number, literal = match.groups()
+                if punct:
+                    self._on_punct(punct)
+                elif string is not None:
+                    self._on_string(string)
+                elif number is not None:
+                    self._on_value(float(number) if any(c in number for c in ".eE") else int(number))
+                else:
+                    self._on_value(_LITERALS[literal])
+        except _JsonSyntaxError:
+            # 不是合法的 JSON (例如日志里恰好以 '{' 开头的一行)，当作普通文本继续扫描
+            self._stack = None
+            self._line_start = False
+        return pos
+
+    def _child_spec(self, frame):
+        spec = frame["spec"]
+        if spec is None or spec is True:
+            return spec
+        if frame["kind"] == "array":
+            if frame["count"] >= spec.get("#max", frame["count"] + 1):
+                return None
+            return spec.get("*")
+        return spec[frame["key"]] if frame["key"] in spec else spec.get("*")
+
+    def _on_punct(self, punct: str):
+        stack = self._stack
+        top = stack[-1] if stack else None
+        if punct in "{[":
+            if top is not None and top["kind"] == "object" and top["key"] is None:
+                raise _JsonSyntaxError(punct)
+            spec = self._child_spec(top) if top else self.spec
+            container = None if spec is None else ({} if punct == "{" else [])
+            stack.append({"kind": "object" if punct == "{" else "array", "spec": spec,
+                          "value": container, "key": None, "count": 0})
+        elif punct in "}]":
+            if top is None or top["kind"] != ("object" if punct == "}" else "array"):
+                raise _JsonSyntaxError(punct)
+            stack.pop()
+            if stack:
+                self._attach(stack[-1], top["value"], top["spec"] is not None)
+            else:
+                self._on_complete(top["value"])
+        elif punct == ",":
+            if top is None:
+                raise _JsonSyntaxError(punct)
+            if top["kind"] == "object":
+                top["key"] = None
+        elif top is None or top["kind"] != "object" or top["key"] is None:
+            raise _JsonSyntaxError(punct)  # ':' 只能出现在 key 之后
+
+    def _on_string(self, raw: str):
+        top = self._stack[-1] if self._stack else None
+        if top is None:
+            raise _JsonSyntaxError(raw[:20])
+        if top["kind"] == "object" and top["key"] is None:
+            top["key"] = _decode_string(raw)
+            return
+        spec = self._child_spec(top)
+        # 不需要保留的字符串不解码
+        value = _decode_string(raw)[:STREAM_MAX_STRING] if spec is not None else None
+        self._attach(top, value, spec is not None)
+
+    def _on_value(self, value):
+        top = self._stack[-1] if self._stack else None
+        if top is None or (top["kind"] == "object" and top["key"] is None):
+            raise _JsonSyntaxError(str(value))
+        self._attach(top, value, self._child_spec(top) is not None)
+
+    def _attach(self, frame: dict, value, keep: bool):
+        if keep and frame["value"] is not None:
+            if frame["kind"] == "object":
+                frame["value"][frame["key"]] = value
+            else:
+                frame["value"].append(value)
+        frame["count"] += 1
+
+    def _on_complete(self, value):
+        self._stack = None
+        self._line_start = False
+        if _is_forge_result(value):
+            self.result = value
+            self.done = True
+
+
+def _decode_string(raw: str) -> str:
+    try:
+        return _string_decoder.decode(f'"{raw}"')
+    except ValueError:
+        raise _JsonSyntaxError(raw[:20])
+
+
+def _is_forge_result(value) -> bool:
+    if not isinstance(value, dict):
+        return False
+    return "errors" in value or any(isinstance(v, dict) and "test_results" in v for v in value.values())
+
+
+def run_forge_streaming(command: str, workspace_dir: str = WORKSPACE_DIR, timeout: float = None,
+                        cancel: threading.Event = None):
+    """
+    [Runner] 在沙盒中执行 forge 命令并边读边解析
+    返回 (CompletedProcess, 结果对象或 None)；CompletedProcess 中的 stdout/stderr 只是 JSON 之外的输出尾部
+    超过 timeout 秒时抛出 SandboxTimeout；cancel 事件被设置时抛出 SandboxCancelled
+    """
+    parser = ForgeOutputParser()
+    stderr = _Tail(STREAM_TAIL_CHARS)
+    stderr_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    returncode = stream_in_sandbox(
+        command, workspace_dir,
+        on_stdout=parser.feed,
+        on_stderr=lambda chunk: stderr.append(stderr_decoder.decode(chunk)),
+        timeout=timeout,
+        cancel=cancel,
+    )
+    parser.close()
+    stderr.append(stderr_decoder.decode(b"", final=True))
+
+    result = subprocess.CompletedProcess(args=command, returncode=returncode, stdout=parser.text,
+                                         stderr=stderr.text())
+    return result, parser.result
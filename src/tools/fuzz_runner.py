@@ -0,0 +1,162 @@
+import contextvars
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.tools.file_utils import WORKSPACE_DIR, remove_from_workspace
+from src.tools.forge_stream import run_forge_streaming
+from src.tools.container_pool import SandboxTimeout, SandboxCancelled, get_container_pool, SANDBOX_MODE
+from src.tools.docker_runner import (run_compilation, create_foundry_config, collect_test_results,
+                                     forge_test_command, suite_duration, same_file)
+from src.tools.trace_summary import summarize_test_result
+from src.tools.telemetry import span
+from src.tools.budget import stage_timeout
+
+# 性质测试 (fuzz / invariant) 模式下一次 campaign 拆成多少个分片，每个分片占用一个容器、使用不同的种子
+FUZZ_SHARDS = int(os.getenv("FUZZ_SHARDS", str(min(os.cpu_count() or 1, 4))))
+# 整个 campaign 的 fuzz / invariant 运行次数，平均分给各分片
+FUZZ_RUNS = int(os.getenv("FUZZ_RUNS", "2048"))
+INVARIANT_RUNS = int(os.getenv("INVARIANT_RUNS", "128"))
+INVARIANT_DEPTH = int(os.getenv("INVARIANT_DEPTH", "32"))
+# 基础种子，分片 i 使用 seed + i；留空时每次 campaign 随机选取 (写入日志，便于复现)
+FUZZ_SEED = os.getenv("FUZZ_SEED", "")
+FUZZ_TIMEOUT = float(os.getenv("FUZZ_TIMEOUT", "600"))
+
+
+def plan_shards(shards: int = FUZZ_SHARDS, fuzz_runs: int = FUZZ_RUNS, invariant_runs: int = INVARIANT_RUNS,
+                seed: str = FUZZ_SEED) -> list:
+    """[分片] 返回每个分片的 {"index", "seed", "fuzz_runs", "invariant_runs"}"""
+    shards = max(1, shards)
+    base = int(seed, 0) if seed else random.randrange(2 ** 32)
+    return [
+        {
+            "index": i,
+            "seed": base + i,
+            # 向上取整，保证总次数不少于配置值
+            "fuzz_runs": max(1, -(-fuzz_runs // shards)),
+            "invariant_runs": max(1, -(-invariant_runs // shards)),
+        }
+        for i in range(shards)
+    ]
+
+
+def shard_command(filenames: list, shard: dict) -> str:
+    """一个分片的 forge test 命令；--fail-fast 让分片内第一个失败的测试结束本分片"""
+    env = (f"FOUNDRY_INVARIANT_RUNS={shard['invariant_runs']} FOUNDRY_INVARIANT_DEPTH={INVARIANT_DEPTH} "
+           f"FOUNDRY_INVARIANT_FAIL_ON_REVERT=false ")
+    extra = f"--fuzz-runs {shard['fuzz_runs']} --fuzz-seed {shard['seed']} --fail-fast"
+    return env + forge_test_command(filenames, extra)
+
+
+def is_violation(test_name: str, result: dict) -> bool:
+    """性质测试失败即为反例；setUp 失败是测试本身的问题，不算"""
+    return result.get("status") == "Failure" and not test_name.rsplit("::", 1)[-1].startswith("setUp")
+
+
+def _run_shard(filenames: list, workspace_dir: str, shard: dict, timeout: float, cancel: threading.Event) -> dict:
+    with span("sandbox.test", files=len(filenames), shard=shard["index"], seed=shard["seed"]) as s:
+        result, data = run_forge_streaming(shard_command(filenames, shard), workspace_dir,
+                                           timeout=timeout, cancel=cancel)
+        s.set(returncode=result.returncode, execute_s=suite_duration(data))
+    test_results = collect_test_results(data) if data else {}
+    if any(is_violation(name, res) for name, res in test_results.items()):
+        cancel.set()  # 第一个找到反例的分片结束整个 campaign
+    return {"shard": shard, "result": result, "test_results": test_results}
+
+
+def run_fuzz_campaign(filenames: list, workspace_dir: str = WORKSPACE_DIR) -> dict:
+    """
+    [Fuzz] 对红队生成的性质测试执行分片 campaign，返回与 run_exploit_check 相同结构的结果
+    - 先统一 forge build 一次，各分片直接复用 out/ 中的产物，不会并发写入；编译失败的文件删除，其余继续
+    - 各分片并发执行，任一分片找到反例后取消其余分片
+    - status: success 表示性质被违反 (攻击成功)，failed 表示所有分片都没有找到反例
+    """
+    outcome = {"status": "error", "compiler_feedback": "", "compile_errors": {},
+               "test_logs": "", "test_results": {}, "winner": None}
+
+    # 不走编译缓存：缓存命中时 out/ 中未必有产物，各分片会同时编译
+    create_foundry_config(workspace_dir, filenames)
+    verdicts, compiled = run_compilation(filenames, workspace_dir)
+    if not compiled:
+        outcome["test_logs"] = verdicts[filenames[0]][1]
+        return outcome
+    outcome["compile_errors"] = {name: error for name, (ok, error) in verdicts.items() if not ok}
+    pending = [name for name in filenames if verdicts[name][0]]
+    if not pending:
+        outcome.update(status="compile_error", compiler_feedback=outcome["compile_errors"][filenames[0]])
+        return outcome
+    for name in outcome["compile_errors"]:
+        remove_from_workspace(name, workspace_dir)
+
+    shards = plan_shards()
+    print(f"🎲 [Fuzz] {len(shards)} 个分片 (种子 {shards[0]['seed']}..{shards[-1]['seed']}, "
+          f"每片 fuzz {shards[0]['fuzz_runs']} 次 / invariant {shards[0]['invariant_runs']} 次): {', '.join(pending)}")
+    if SANDBOX_MODE == "pool":
+        get_container_pool().ensure_capacity(len(shards))
+
+    timeout = stage_timeout(FUZZ_TIMEOUT)
+    cancel = threading.Event()
+    finished, errors = [], []
+    with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="fuzz") as executor:
+        # 每个分片在各自的上下文副本中执行，span 和预算记账归属到当前 run
+        futures = [
+            executor.submit(contextvars.copy_context().run, _run_shard, pending, workspace_dir, shard, timeout, cancel)
+            for shard in shards
+        ]
+        for future in as_completed(futures):
+            try:
+                finished.append(future.result())
+            except SandboxCancelled:
+                pass
+            except Exception as e:
+                errors.append(e)
+
+    return _merge_shards(outcome, pending, finished, errors)
+
+
+def _merge_shards(outcome: dict, filenames: list, finished: list, errors: list) -> dict:
+    """合并各分片的结果：反例全部汇总进 test_logs，同一个测试只保留第一个反例"""
+    violations = {}
+    passed = {}
+    for shard_result in sorted(finished, key=lambda r: r["shard"]["index"]):
+        seed = shard_result["shard"]["seed"]
+        for name, res in shard_result["test_results"].items():
+            if is_violation(name, res):
+                violations.setdefault(name, (seed, res))
+            else:
+                passed.setdefault(name, (seed, res))
+
+    if violations:
+        logs = f"ATTACK SUCCESS! Property violated ({len(violations)} failing properties).\n"
+        for name, (seed, res) in violations.items():
+            logs += f"[seed {seed}] " + summarize_test_result(name, res)
+            if outcome["winner"] is None:
+                suite_path = name.split(":", 1)[0]
+                outcome["winner"] = next((f for f in filenames if same_file(suite_path, f)), filenames[0])
+        outcome.update(status="success", test_logs=logs,
+                       test_results={name: res for name, (_, res) in violations.items()})
+        return outcome
+
+    if passed:
+        logs = f"ATTACK FAILED (Logic). No counterexample found across {len(finished)} shards.\n"
+        for name, (seed, res) in passed.items():
+            logs += summarize_test_result(name, res)
+        outcome.update(status="failed", test_logs=logs,
+                       test_results={name: res for name, (_, res) in passed.items()})
+        return outcome
+
+    timeouts = [e for e in errors if isinstance(e, SandboxTimeout)]
+    if timeouts:
+        outcome.update(status="timeout", test_logs=str(timeouts[0]), compiler_feedback=(
+            f"EXECUTION TIMED OUT: the fuzz campaign did not finish within {timeouts[0].timeout:.0f}s. "
+            "Bound every fuzzed input with bound() and keep handler functions cheap."
+        ))
+        return outcome
+
+    shard_errors = [str(e) for e in errors] + [
+        f"Code {r['result'].returncode}: {r['result'].stderr[-1000:] or r['result'].stdout[-1000:]}"
+        for r in finished
+    ]
+    outcome["test_logs"] = "CRITICAL: Fuzz campaign produced no test results.\n" + "\n".join(shard_errors)
+    return outcome
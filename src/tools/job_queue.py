@@ -0,0 +1,217 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from src.tools.file_utils import WORKSPACE_DIR
+
+# 任务队列数据库；多台机器共享时放在共享目录上 (需要支持文件锁，因此不使用 WAL)
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", os.path.join(WORKSPACE_DIR, "jobs.sqlite"))
+# worker 领取任务后持有的租约 (秒)，运行期间按 JOB_HEARTBEAT 间隔续约；worker 崩溃后租约过期，任务被其他 worker 接手
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# 失败后重新排队前等待的时间 (秒)，按尝试次数指数增长
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL UNIQUE,
+    contract TEXT NOT NULL,
+    source TEXT NOT NULL,
+    project_dir TEXT NOT NULL DEFAULT '',
+    target_file TEXT NOT NULL DEFAULT 'Target.sol',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    rerun INTEGER NOT NULL DEFAULT 0,
+    worker TEXT NOT NULL DEFAULT '',
+    lease_until REAL NOT NULL DEFAULT 0,
+    heartbeat_at REAL NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    wait_s REAL,
+    run_s REAL,
+    result TEXT NOT NULL DEFAULT '{}',
+    error TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, id);
+"""
+
+_COLUMNS = ("id", "run_id", "contract", "project_dir", "target_file", "priority", "status", "attempts",
+            "max_attempts", "rerun", "worker", "lease_until", "submitted_at", "started_at", "finished_at",
+            "wait_s", "run_s", "result", "error")
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    [Queue] 基于 SQLite 的任务表，多个 worker 进程 (同一台或多台机器) 共享
+    - 按 priority 从高到低、提交顺序领取；领取在 BEGIN IMMEDIATE 事务中完成，同一任务只会被一个 worker 拿到
+    - 租约 + 心跳：租约过期的 running 任务视为 worker 已崩溃，重新可被领取 (计入尝试次数)
+    - 失败后按指数退避重新排队，超过 max_attempts 标记为 failed
+    - 记录排队等待时间 (wait_s) 和运行时间 (run_s)，供容量规划使用
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None: 手动控制事务
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA busy_timeout = 30000")
+        self._conn.executescript(_SCHEMA)
+
+    def _transaction(self, fn):
+        """在写事务中执行 fn(conn)；BEGIN IMMEDIATE 立即拿到写锁，避免两个 worker 领取同一个任务"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def submit(self, contract: str, source: str, run_id: str, priority: int = 0, project_dir: str = "",
+               target_file: str = "Target.sol", max_attempts: int = JOB_MAX_ATTEMPTS, resubmit: bool = False) -> bool:
+        """
+        [Submit] 提交一个任务；同一个 run_id 已在队列中时不重复提交，返回是否新增
+        resubmit=True 时把已结束 (done / failed) 的同名任务重新排队，并标记 rerun：
+        worker 会丢弃该 run_id 已完成的 checkpoint 重新运行，而不是直接返回上次的结果
+        """
+        now = time.time()
+
+        def insert(conn):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (run_id, contract, source, project_dir, target_file, priority, status, "
+                "max_attempts, available_at, submitted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, contract, source, project_dir, target_file, priority, QUEUED, max_attempts, now, now))
+            if cursor.rowcount or not resubmit:
+                return cursor.rowcount > 0
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, priority = ?, attempts = 0, max_attempts = ?, rerun = 1, worker = '', "
+                "available_at = ?, submitted_at = ?, started_at = NULL, finished_at = NULL, wait_s = NULL, "
+                "run_s = NULL, result = '{}', error = '' WHERE run_id = ? AND status IN (?, ?)",
+                (QUEUED, priority, max_attempts, now, now, run_id, DONE, FAILED))
+            return cursor.rowcount > 0
+
+        return self._transaction(insert)
+
+    def claim(self, worker: str, lease_seconds: float = JOB_LEASE_SECONDS):
+        """[Lease] 领取优先级最高的可运行任务 (排队中且已到重试时间，或租约已过期)；没有返回 None"""
+        now = time.time()
+
+        def take(conn):
+            # 租约过期且已用完尝试次数的任务直接判定失败
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = 'lease expired (worker lost)' "
+                "WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+                (FAILED, now, RUNNING, now))
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (QUEUED, now, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == RUNNING:
+                print(f"♻️ [Queue] 任务 {row['id']} 的租约已过期 (worker {row['worker']})，重新领取")
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, lease_until = ?, heartbeat_at = ?, "
+                "started_at = ?, wait_s = COALESCE(wait_s, ? - submitted_at) WHERE id = ?",
+                (RUNNING, worker, now + lease_seconds, now, now, now, row["id"]))
+            job = dict(row)
+            job.update(status=RUNNING, worker=worker, attempts=row["attempts"] + 1, started_at=now)
+            return job
+
+        return self._transaction(take)
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+        """[Lease] 续约；返回 False 表示租约已经不属于该 worker (过期后被其他 worker 接手)"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, heartbeat_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (now + lease_seconds, now, job_id, worker, RUNNING))
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: int, worker: str, result: dict) -> bool:
+        """[Result] 写回结果和计时；租约已不属于该 worker 时忽略，返回 False"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, run_s = ? - started_at, result = ?, error = '' "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, now, now, json.dumps(result, ensure_ascii=False), job_id, worker, RUNNING))
+        return cursor.rowcount > 0
+
+    def fail(self, job_id: int, worker: str, error: str, retry_delay: float = JOB_RETRY_DELAY) -> str:
+        """[Retry] 任务失败：还有尝试次数时按指数退避重新排队，否则标记为 failed；返回新的状态"""
+        now = time.time()
+
+        def update(conn):
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = ?",
+                               (job_id, worker, RUNNING)).fetchone()
+            if row is None:
+                return ""
+            if row["attempts"] < row["max_attempts"]:
+                delay = retry_delay * 2 ** (row["attempts"] - 1)
+                conn.execute("UPDATE jobs SET status = ?, available_at = ?, lease_until = 0, error = ? WHERE id = ?",
+                             (QUEUED, now + delay, error, job_id))
+                return QUEUED
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ?, run_s = ? - started_at, error = ? WHERE id = ?",
+                         (FAILED, now, now, error, job_id))
+            return FAILED
+
+        return self._transaction(update)
+
+    def pending(self) -> int:
+        """还没有结束的任务数 (排队中 + 运行中)"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)",
+                                      (QUEUED, RUNNING)).fetchone()[0]
+
+    def jobs(self, status: str = None) -> list:
+        """任务列表 (不含源码)，result 解析为 dict"""
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY id"
+        with self._lock:
+            rows = self._conn.execute(query, (status,) if status else ()).fetchall()
+        return [dict(row, result=json.loads(row["result"])) for row in rows]
+
+    def stats(self) -> dict:
+        """
+        [Capacity] 各状态的任务数、平均排队 / 运行时间、各 worker 完成数，以及最近一小时的吞吐量 (任务/小时)
+        """
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            avg_wait, avg_run = self._conn.execute(
+                "SELECT AVG(wait_s), AVG(run_s) FROM jobs WHERE status = ?", (DONE,)).fetchone()
+            per_worker = dict(self._conn.execute(
+                "SELECT worker, COUNT(*) FROM jobs WHERE status = ? GROUP BY worker", (DONE,)).fetchall())
+            last_hour = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND finished_at >= ?", (DONE, now - 3600)).fetchone()[0]
+        return {
+            "counts": {s: counts.get(s, 0) for s in (QUEUED, RUNNING, DONE, FAILED)},
+            "avg_wait_s": avg_wait or 0.0,
+            "avg_run_s": avg_run or 0.0,
+            "per_worker": per_worker,
+            "throughput_per_hour": last_hour,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,78 @@
+import re
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+
+class PatchApplyError(ValueError):
+    """补丁无法干净地应用到源码上"""
+
+
+def parse_unified_diff(diff_text: str) -> list:
+    """
+    [解析] 解析 unified diff，返回 hunk 列表
+    每个 hunk: {"old_start": 行号提示, "old": [旧行], "new": [新行]}
+    """
+    hunks = []
+    current = None
+    for line in diff_text.splitlines():
+        if line.startswith(("--- ", "+++ ", "diff ", "index ")):
+            continue
+        header = _HUNK_HEADER.match(line)
+        if header or line.startswith("@@"):
+            current = {"old_start": int(header.group(1)) if header else 0, "old": [], "new": []}
+            hunks.append(current)
+            continue
+        if current is None:
+            continue
+        if line.startswith("-"):
+            current["old"].append(line[1:])
+        elif line.startswith("+"):
+            current["new"].append(line[1:])
+        elif line.startswith(" ") or line == "":
+            current["old"].append(line[1:])
+            current["new"].append(line[1:])
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+    return [h for h in hunks if h["old"] or h["new"]]
+
+
+def _find_block(lines: list, block: list, hint: int) -> int:
+    """在 lines 中查找 block，先精确匹配再忽略行首尾空白；多处命中时取离 hint 最近的"""
+    if not block:
+        return min(max(hint, 0), len(lines))
+
+    for normalize in (lambda s: s, lambda s: s.strip()):
+        target = [normalize(b) for b in block]
+        matches = [
+            i for i in range(len(lines) - len(block) + 1)
+            if [normalize(x) for x in lines[i:i + len(block)]] == target
+        ]
+        if matches:
+            return min(matches, key=lambda i: abs(i - hint))
+    return -1
+
+
+def apply_unified_diff(source: str, diff_text: str) -> str:
+    """
+    [Patch] 把 LLM 生成的 unified diff 应用到源码上
+    LLM 给出的行号经常不准 (尤其是基于切片上下文生成的 diff)，因此按上下文内容定位，行号只作为提示
+    任一 hunk 无法定位时抛出 PatchApplyError
+    """
+    hunks = parse_unified_diff(diff_text)
+    if not hunks:
+        raise PatchApplyError("diff 中没有任何 hunk")
+
+    lines = source.splitlines()
+    offset = 0
+    for n, hunk in enumerate(hunks, start=1):
+        hint = hunk["old_start"] - 1 + offset
+        pos = _find_block(lines, hunk["old"], hint)
+        if pos == -1:
+            raise PatchApplyError(f"第 {n} 个 hunk 的上下文在源码中找不到:\n" + "\n".join(hunk["old"][:5]))
+        lines[pos:pos + len(hunk["old"])] = hunk["new"]
+        offset += len(hunk["new"]) - len(hunk["old"])
+
+    patched = "\n".join(lines) + ("\n" if source.endswith("\n") else "")
+    if patched == source:
+        raise PatchApplyError("补丁没有产生任何修改")
+    return patched
@@ -0,0 +1,296 @@
+"""
+[Project] 多文件 Foundry / Hardhat 工程
+- 一次性建立 import / 继承关系索引：只保存路径、大小、mtime 和依赖关系，源码留在磁盘上按需读取
+- 工程文件以硬链接放进 run workspace (跨文件系统时退回复制)，只链接工程源码和被 import 到的库文件
+- 编译时只构建受影响的编译单元：某个文件的依赖闭包 / 修改某个文件后依赖它的所有工程文件
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+from src.tools.file_utils import CACHE_DIR, save_to_workspace
+from src.tools.solc_resolver import source_pragmas
+
+# run workspace 中的索引文件；单文件模式的 run 没有这个文件
+PROJECT_INDEX = "project_index.json"
+# 不属于工程源码的目录 (依赖库按 import 按需索引)
+SKIP_DIRS = {"out", "cache", "artifacts", "broadcast", "cache_forge", "typechain-types", ".git", ".cache",
+             "runs", "lib", "node_modules"}
+
+_IMPORT_RE = re.compile(r"^\s*import\s+(?:[^\"';]*?\bfrom\s+)?[\"']([^\"']+)[\"']", re.MULTILINE)
+_CONTRACT_RE = re.compile(r"\b(?:contract|interface|library)\s+(\w+)\s*(?:\bis\s+([^{]+))?\{")
+_COMMENT_RE = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+_REMAPPING_RE = re.compile(r"[\"']([^\"'=]+=[^\"']+)[\"']")
+
+_lock = threading.Lock()
+# workspace 目录 -> ProjectIndex (单文件模式为 None)
+_indexes = {}
+
+
+def _parse(source: str) -> tuple:
+    """返回 (import 的原始路径列表, {合约名: [父合约]})"""
+    code = _COMMENT_RE.sub("", source)
+    contracts = {}
+    for name, bases in _CONTRACT_RE.findall(code):
+        contracts[name] = [re.match(r"\s*([\w.]+)", b).group(1) for b in bases.split(",") if b.strip()]
+    return _IMPORT_RE.findall(code), contracts
+
+
+def read_remappings(project_dir: str) -> list:
+    """工程自带的 remappings：remappings.txt 以及 foundry.toml 中的 remappings = [...]"""
+    remappings = []
+    path = os.path.join(project_dir, "remappings.txt")
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            remappings += [line.strip() for line in f if "=" in line and not line.lstrip().startswith("#")]
+    path = os.path.join(project_dir, "foundry.toml")
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            match = re.search(r"^\s*remappings\s*=\s*\[(.*?)\]", f.read(), re.MULTILINE | re.DOTALL)
+        if match:
+            remappings += _REMAPPING_RE.findall(match.group(1))
+    # 去掉 context 前缀 (ctx:prefix=target)，保持顺序去重
+    return list(dict.fromkeys(r.split(":", 1)[-1] if ":" in r.split("=", 1)[0] else r for r in remappings))
+
+
+class ProjectIndex:
+    """
+    [索引] 工程内 .sol 文件的 import / 继承关系图
+    files: {相对路径: {"size", "mtime_ns", "imports": [相对路径], "contracts": {合约: [父合约]}, "origin"}}
+    origin: project (工程源码) / lib (被 import 到的依赖库) / run (运行过程中新增的文件，如攻击脚本)
+    文件的 size / mtime 变化后，下次访问时才重新解析
+    """
+
+    def __init__(self, root: str, files: dict = None, remappings: list = None):
+        self.root = root
+        self.files = files or {}
+        self.remappings = remappings or []
+        self.parsed = 0
+        self._lock = threading.Lock()
+
+    # === 构建 / 持久化 ===
+    @classmethod
+    def build(cls, root: str, cached: "ProjectIndex" = None) -> "ProjectIndex":
+        """扫描工程源码并沿 import 索引依赖库；cached 中 size / mtime 未变的文件不重新解析"""
+        index = cls(root, remappings=read_remappings(root))
+        previous = cached.files if cached else {}
+        for dirpath, dirs, names in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+            for name in sorted(names):
+                if name.endswith(".sol"):
+                    rel = os.path.relpath(os.path.join(dirpath, name), root).replace(os.sep, "/")
+                    index._refresh(rel, previous.get(rel), "project")
+        # 依赖库只索引被 import 到的文件
+        pending = [rel for rel in index.files]
+        while pending:
+            for dep in index.files[pending.pop()]["imports"]:
+                if dep not in index.files and index._refresh(dep, previous.get(dep), "lib"):
+                    pending.append(dep)
+        return index
+
+    @classmethod
+    def load(cls, path: str):
+        if not os.path.isfile(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["root"], data["files"], data["remappings"])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            data = {"root": self.root, "remappings": self.remappings, "files": self.files}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    # === 解析 ===
+    def _resolve_import(self, importer: str, path: str):
+        """按 solc / forge 的规则把 import 路径解析为工程内的相对路径；工程外 (如镜像中的 forge-std) 返回 None"""
+        candidates = []
+        if path.startswith(("./", "../")):
+            candidates.append(os.path.normpath(os.path.join(os.path.dirname(importer), path)))
+        else:
+            for remapping in sorted(self.remappings, key=lambda r: -len(r.split("=", 1)[0])):
+                prefix, target = remapping.split("=", 1)
+                if path.startswith(prefix):
+                    candidates.append(os.path.normpath(target + path[len(prefix):]))
+                    break
+            first, _, rest = path.partition("/")
+            # 根目录相对路径 / Hardhat 的 node_modules / forge 对 lib/<名称> 的自动 remapping
+            candidates += [os.path.normpath(path), f"node_modules/{path}", f"lib/{first}/src/{rest}",
+                           f"lib/{first}/{rest}"]
+        for candidate in candidates:
+            candidate = candidate.replace(os.sep, "/")
+            if not candidate.startswith("../") and os.path.isfile(os.path.join(self.root, candidate)):
+                return candidate
+        return None
+
+    def _refresh(self, rel: str, entry: dict = None, origin: str = "run"):
+        """size / mtime 变化 (或从未索引) 时重新解析 rel；文件不存在时移出索引并返回 None"""
+        try:
+            st = os.stat(os.path.join(self.root, rel))
+        except OSError:
+            with self._lock:
+                self.files.pop(rel, None)
+            return None
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            with self._lock:
+                self.files[rel] = entry
+            return entry
+
+        with open(os.path.join(self.root, rel), "r", encoding="utf-8", errors="replace") as f:
+            imports, contracts = _parse(f.read())
+        resolved = [self._resolve_import(rel, p) for p in imports]
+        entry = {
+            "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "imports": list(dict.fromkeys(r for r in resolved if r)),
+            "contracts": contracts,
+            "origin": entry["origin"] if entry else origin,
+        }
+        with self._lock:
+            self.files[rel] = entry
+            self.parsed += 1
+        return entry
+
+    def entry(self, rel: str):
+        with self._lock:
+            cached = self.files.get(rel)
+        return self._refresh(rel, cached)
+
+    def source(self, rel: str) -> bytes:
+        """[懒加载] 按需从磁盘读取源码，不在内存中保留"""
+        with open(os.path.join(self.root, rel), "rb") as f:
+            return f.read()
+
+    # === 查询 ===
+    def dependencies(self, rels: list) -> list:
+        """rels 的编译单元：rels 本身加上它们 import 的所有文件 (传递闭包)，按路径排序"""
+        seen = set()
+        pending = list(rels)
+        while pending:
+            rel = pending.pop()
+            if rel in seen:
+                continue
+            entry = self.entry(rel)
+            if entry is None:
+                continue
+            seen.add(rel)
+            pending.extend(entry["imports"])
+        return sorted(seen)
+
+    def dependents(self, rels: list, origins: tuple = ("project",)) -> list:
+        """修改 rels 后受影响的文件：直接或间接 import 了 rels 的文件 (只返回 origins 中的文件，不含 rels 本身)"""
+        with self._lock:
+            snapshot = dict(self.files)
+        reverse = {}
+        for rel, entry in snapshot.items():
+            for dep in entry["imports"]:
+                reverse.setdefault(dep, []).append(rel)
+        seen = set(rels)
+        pending = list(rels)
+        while pending:
+            for parent in reverse.get(pending.pop(), []):
+                if parent not in seen:
+                    seen.add(parent)
+                    pending.append(parent)
+        return sorted(rel for rel in seen - set(rels) if snapshot[rel]["origin"] in origins)
+
+    def contract_file(self, name: str):
+        """定义了合约 name 的工程文件 (优先工程源码)"""
+        with self._lock:
+            owners = [(entry["origin"] != "project", rel) for rel, entry in self.files.items()
+                      if name in entry["contracts"]]
+        return min(owners)[1] if owners else None
+
+
+def _cache_path(project_dir: str) -> str:
+    digest = hashlib.sha256(os.path.abspath(project_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, "projects", f"{digest}.json")
+
+
+def load_project(project_dir: str) -> ProjectIndex:
+    """[Loader] 建立 (或增量刷新) 工程索引；索引按工程路径缓存，未修改的文件不再解析"""
+    project_dir = os.path.abspath(project_dir)
+    cache_path = _cache_path(project_dir)
+    index = ProjectIndex.build(project_dir, ProjectIndex.load(cache_path))
+    index.save(cache_path)
+    origins = [entry["origin"] for entry in index.files.values()]
+    print(f"📦 [Project] 索引 {origins.count('project')} 个工程文件 + {origins.count('lib')} 个依赖库文件 "
+          f"(重新解析 {index.parsed} 个)")
+    return index
+
+
+def resolve_target(project_dir: str, target: str):
+    """目标合约可以是工程内的相对路径，也可以是合约名 (按索引找到定义它的文件)；找不到返回 None"""
+    if os.path.isfile(os.path.join(project_dir, target)):
+        return os.path.relpath(os.path.join(project_dir, target), project_dir).replace(os.sep, "/")
+    return load_project(project_dir).contract_file(target)
+
+
+def _link(src: str, dst: str):
+    """硬链接 src -> dst；已经是同一个文件时跳过，跨文件系统时退回复制"""
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def target_shim(target_source: str, target_file: str) -> str:
+    """只 import 目标文件的 Target.sol；带上目标文件的 pragma，编译器选择对入口文件同样有约束"""
+    pragmas = "".join(f"pragma solidity {p};\n" for p in source_pragmas(target_source))
+    return f'// SPDX-License-Identifier: UNLICENSED\n{pragmas}import "./{target_file}";\n'
+
+
+def link_project(project_dir: str, workspace_dir: str, target_file: str) -> ProjectIndex:
+    """
+    [Loader] 把工程链接进 run workspace，并在 workspace 中保存索引
+    target_file 不是 Target.sol 时生成一个只 import 目标文件的 Target.sol (沿用目标文件的 pragma)，
+    攻击脚本照常 import "./Target.sol"
+    """
+    project = load_project(project_dir)
+    for rel in project.files:
+        _link(os.path.join(project.root, rel), os.path.join(workspace_dir, rel))
+
+    # Hardhat 工程的 npm 包 (如 @openzeppelin/contracts) 补上 remapping
+    packages = set()
+    for rel in project.files:
+        parts = rel.split("/")
+        if parts[0] == "node_modules" and len(parts) > 2:
+            packages.add("/".join(parts[1:3] if parts[1].startswith("@") else parts[1:2]))
+    remappings = project.remappings + [f"{p}/=node_modules/{p}/" for p in sorted(packages)
+                                       if not any(r.startswith(f"{p}/=") for r in project.remappings)]
+    if remappings:
+        save_to_workspace("remappings.txt", "\n".join(remappings) + "\n", workspace_dir)
+    if target_file != "Target.sol":
+        save_to_workspace("Target.sol", target_shim(project.source(target_file).decode("utf-8"), target_file),
+                          workspace_dir)
+
+    index = ProjectIndex(workspace_dir, dict(project.files), project.remappings)
+    index.save(os.path.join(workspace_dir, PROJECT_INDEX))
+    with _lock:
+        _indexes[workspace_dir] = index
+    return index
+
+
+def get_project_index(workspace_dir: str):
+    """run workspace 的工程索引 (进程内只加载一次)；单文件模式返回 None"""
+    with _lock:
+        if workspace_dir not in _indexes:
+            _indexes[workspace_dir] = ProjectIndex.load(os.path.join(workspace_dir, PROJECT_INDEX))
+        return _indexes[workspace_dir]
+
+
+def affected_files(workspace_dir: str, changed: list) -> list:
+    """修改 changed 后需要重新检查的文件：changed 本身加上依赖它们的工程文件；单文件模式只返回 changed"""
+    index = get_project_index(workspace_dir)
+    if index is None:
+        return list(changed)
+    return list(changed) + index.dependents(changed)
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import re
+import shutil
+
+from src.tools.file_utils import WORKSPACE_DIR, save_to_workspace, read_from_workspace, remove_from_workspace
+from src.tools.docker_runner import run_exploit_check, same_file
+from src.tools.fuzz_runner import is_violation
+from src.agent.context_builder import parse_contracts
+
+# 本次 run 中所有攻击成功的脚本都归档为测试文件；每次补丁编译通过后，归档 + 基本功能测试一次性重跑
+REGRESSION_ENABLED = os.getenv("REGRESSION_SUITE", "1") == "1"
+# 归档目录与各 run 的 forge 工程隔离，平时不参与编译，重跑时才复制进工程
+REGRESSION_DIR = os.path.join(WORKSPACE_DIR, "regressions")
+
+FUNCTIONALITY_TEST = "Functionality.t.sol"
+# exploit: testExploit() 成功即攻击复现; property: 性质测试失败 (反例) 即攻击复现
+ARCHIVE_PREFIXES = {"exploit": "exploit_r", "property": "property_r"}
+# 复制进 forge 工程时使用的文件名前缀
+SUITE_PREFIX = "Regression_"
+
+FUNCTIONALITY_TEMPLATE = """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "forge-std/Test.sol";
+import "./Target.sol";
+
+// 基本功能测试：补丁必须保留存款 / 取款功能
+contract FunctionalityTest is Test {{
+    {contract} target;
+    address depositor = makeAddr("depositor");
+
+    function setUp() public {{
+        target = new {contract}();
+    }}
+
+    function testDepositWithdraw() public {{
+        vm.deal(depositor, 1 ether);
+        vm.startPrank(depositor);
+        target.deposit{{value: 1 ether}}();
+        target.withdraw({withdraw_args});
+        vm.stopPrank();
+        assertEq(depositor.balance, 1 ether, "deposit/withdraw must return the funds");
+    }}
+}}
+"""
+
+_DEPOSIT_RE = re.compile(r"function\s+deposit\s*\(\s*\)[^{;]*\bpayable\b")
+_WITHDRAW_RE = re.compile(r"function\s+withdraw\s*\(\s*(uint\d*\s+\w+)?\s*\)")
+_CONSTRUCTOR_RE = re.compile(r"constructor\s*\(\s*\)")
+
+
+def archive_dir(run_id: str) -> str:
+    return os.path.join(REGRESSION_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", run_id) or "default")
+
+
+def reset_archive(run_id: str):
+    """重新开始一次 run 时清空旧的归档"""
+    shutil.rmtree(archive_dir(run_id), ignore_errors=True)
+
+
+def _archive_kind(name: str):
+    return next((kind for kind, prefix in ARCHIVE_PREFIXES.items() if name.startswith(prefix)), None)
+
+
+def archive_exploit(run_id: str, exploit_source: str, round_count: int, kind: str = "exploit") -> str:
+    """[归档] 保存一次成功的攻击脚本 (或找到反例的性质测试)；内容相同的脚本只保存一份，返回文件名"""
+    directory = archive_dir(run_id)
+    digest = hashlib.sha256(exploit_source.encode("utf-8")).hexdigest()[:8]
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if _archive_kind(name) and name.endswith(f"_{digest}.t.sol"):
+            return name
+    name = f"{ARCHIVE_PREFIXES[kind]}{round_count}_{digest}.t.sol"
+    save_to_workspace(name, exploit_source, directory)
+    print(f"🗃️ [Regression] 攻击脚本已归档: {name}")
+    return name
+
+
+def build_functionality_test(target_source: str) -> str:
+    """
+    [模板] 为带有 deposit() payable / withdraw() (或 withdraw(uint)) 且无参构造的合约生成存取款测试
+    不符合模板的合约返回空字符串
+    """
+    try:
+        contracts = parse_contracts(target_source)
+    except ValueError:
+        return ""
+    for contract in reversed(contracts):
+        if contract["kind"] != "contract":
+            continue
+        functions = [m["text"] for m in contract["members"] if m["kind"] == "function"]
+        constructors = [m["text"] for m in contract["members"] if m["kind"] == "constructor"]
+        withdraw = next((m for m in map(_WITHDRAW_RE.match, functions) if m), None)
+        if (not any(_DEPOSIT_RE.match(text) for text in functions) or withdraw is None
+                or any(not _CONSTRUCTOR_RE.match(text) for text in constructors)):
+            continue
+        return FUNCTIONALITY_TEMPLATE.format(contract=contract["name"],
+                                             withdraw_args="1 ether" if withdraw.group(1) else "")
+    return ""
+
+
+def prepare_archive(run_id: str, target_source: str):
+    """[归档] 新 run 开始时清空归档，并按原始合约生成基本功能测试 (如果适用)"""
+    reset_archive(run_id)
+    test = build_functionality_test(target_source)
+    if test:
+        save_to_workspace(FUNCTIONALITY_TEST, test, archive_dir(run_id))
+        print("🗃️ [Regression] 已生成存取款功能测试")
+
+
+def run_regression_suite(run_id: str, workspace_dir: str) -> dict:
+    """
+    [Regression] 把归档的攻击脚本和功能测试复制进 forge 工程，用一次 forge test 并行执行
+    返回 {"status": pass / regression / broken / skipped, "file", "source", "test_logs"}
+    - regression: 某个历史攻击在新补丁上再次成功
+    - broken: 补丁破坏了存取款功能 (功能测试失败或不再能编译)
+    编译不过的历史攻击视为不再适用；forge 出错 / 超时时不阻塞流程
+    """
+    directory = archive_dir(run_id)
+    if not REGRESSION_ENABLED or not os.path.isdir(directory):
+        return {"status": "skipped"}
+
+    sources = {}
+    for i, name in enumerate(sorted(n for n in os.listdir(directory) if _archive_kind(n))):
+        sources[f"{SUITE_PREFIX}{i}.t.sol"] = (name, read_from_workspace(name, directory))
+    functionality = read_from_workspace(FUNCTIONALITY_TEST, directory)
+    if functionality:
+        sources[FUNCTIONALITY_TEST] = (FUNCTIONALITY_TEST, functionality)
+    if not sources:
+        return {"status": "skipped"}
+
+    print(f"🧪 [Regression] 重跑 {len(sources)} 个回归测试...")
+    # 上一轮的 Exploit.t.sol 已经归档；它可能不再能与补丁后的合约一起编译
+    remove_from_workspace("Exploit.t.sol", workspace_dir)
+    for suite_name, (_, source) in sources.items():
+        save_to_workspace(suite_name, source, workspace_dir)
+    try:
+        outcome = run_exploit_check(list(sources), workspace_dir)
+    finally:
+        for suite_name in sources:
+            remove_from_workspace(suite_name, workspace_dir)
+
+    if FUNCTIONALITY_TEST in outcome["compile_errors"]:
+        return {"status": "broken", "file": FUNCTIONALITY_TEST, "source": functionality,
+                "test_logs": outcome["compile_errors"][FUNCTIONALITY_TEST]}
+    if outcome["status"] == "compile_error":
+        # 功能测试没问题，所有历史攻击都已无法针对补丁后的合约编译
+        print("✅ [Regression] 历史攻击均已不再适用于补丁后的合约")
+        return {"status": "pass"}
+    if outcome["status"] not in ("success", "failed"):
+        print(f"⚠️ [Regression] 回归测试未能完成 ({outcome['status']})，跳过")
+        return {"status": "skipped"}
+
+    statuses = {}
+    reproduced = {}
+    for test_name, result in outcome["test_results"].items():
+        suite_path = test_name.split(":", 1)[0]
+        suite_name = next((s for s in sources if same_file(suite_path, s)), None)
+        if suite_name is None:
+            continue
+        statuses.setdefault(suite_name, []).append(result.get("status") == "Success")
+        if _archive_kind(sources[suite_name][0]) == "property":
+            hit = is_violation(test_name, result)
+        else:
+            hit = result.get("status") == "Success"
+        reproduced[suite_name] = reproduced.get(suite_name, False) or hit
+
+    # 功能测试要求全部通过；攻击脚本中任一测试成功 (性质测试中任一性质被违反) 即视为攻击复现
+    if FUNCTIONALITY_TEST in sources and not all(statuses.get(FUNCTIONALITY_TEST) or [False]):
+        return {"status": "broken", "file": FUNCTIONALITY_TEST, "source": functionality,
+                "test_logs": f"FUNCTIONALITY TEST FAILED: the patch broke deposit/withdraw.\n{outcome['test_logs']}"}
+
+    for suite_name, (archived, source) in sources.items():
+        if suite_name != FUNCTIONALITY_TEST and reproduced.get(suite_name):
+            return {"status": "regression", "file": archived, "source": source,
+                    "test_logs": f"ATTACK SUCCESS! (archived exploit {archived} still works)\n{outcome['test_logs']}"}
+    print("✅ [Regression] 所有历史攻击均已失效，功能测试通过")
+    return {"status": "pass"}
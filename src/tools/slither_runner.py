@@ -1,7 +1,81 @@
-import subprocess
-import json
+import asyncio
+import contextvars
+import hashlib
 import os
-from .file_utils import WORKSPACE_DIR
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .file_utils import WORKSPACE_DIR, CACHE_DIR, save_to_workspace, read_from_workspace
+from .container_pool import run_in_sandbox
+from .disk_cache import DiskCache
+from .docker_runner import iter_json_objects
+from .solc_resolver import resolve_version, container_solc_path
+from .telemetry import span
+from .budget import charge_container, metering
+
+# 后台扫描的并发数，以及红/蓝 Agent 构造 prompt 前最多等待报告的秒数 (0 表示不等待)
+SLITHER_ENABLED = os.getenv("SLITHER_ENABLED", "1") == "1"
+SLITHER_WORKERS = int(os.getenv("SLITHER_WORKERS", "2"))
+SLITHER_WAIT = float(os.getenv("SLITHER_WAIT", "0"))
+# 单次扫描的截止时间 (秒)，超时杀掉容器，本次扫描视为失败 (不缓存)
+SLITHER_TIMEOUT = float(os.getenv("SLITHER_TIMEOUT", "300"))
+# 最多保留多少个已结束但尚未被读取的后台扫描 (成功的结果另有磁盘缓存)
+SLITHER_MAX_UNREAD = int(os.getenv("SLITHER_MAX_UNREAD", "64"))
+
+# 扫描快照目录：与各 run 的 forge 工程隔离，避免快照文件被 forge build 编译
+SNAPSHOT_DIR = os.path.join(WORKSPACE_DIR, ".slither")
+
+_cache = None
+_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_executor = None
+# 进行中 / 尚未被读取的后台扫描: source_key -> Future[(结果, 容器秒数)]
+_futures = {}
+
+
+def _get_cache() -> DiskCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(
+                os.path.join(CACHE_DIR, "slither_cache.sqlite"),
+                max_entries=int(os.getenv("SLITHER_CACHE_MAX_ENTRIES", "500"))
+            )
+        return _cache
+
+
+def source_key(source: str) -> str:
+    """[指纹] Slither 报告按 源码 + solc 版本 (按 pragma 选定) 缓存"""
+    return hashlib.sha256(f"{resolve_version([source])}\0{source}".encode("utf-8")).hexdigest()
+
+
+def extract_slither_findings(json_data) -> list:
+    """
+    [清洗] 从 Slither JSON 中提取结构化的检测结果
+    每项包含 check / impact / confidence / description / lines / functions
+    """
+    if not json_data or "results" not in json_data or "detectors" not in json_data["results"]:
+        return []
+
+    findings = []
+    for item in json_data["results"]["detectors"] or []:
+        # 提取受影响的代码行位置 (Source Mapping) 以及涉及的函数
+        lines = []
+        functions = []
+        for elem in item.get("elements", []):
+            if "source_mapping" in elem:
+                lines.extend(elem["source_mapping"].get("lines", []))
+            if elem.get("type") == "function" and elem.get("name"):
+                functions.append(elem["name"])
+
+        findings.append({
+            "check": item.get("check", "Unknown"),
+            "impact": item.get("impact", "Informational"),
+            "confidence": item.get("confidence", "Unknown"),
+            "description": item.get("description", "No description"),
+            "lines": sorted(set(lines)),
+            "functions": sorted(set(functions)),
+        })
+    return findings
 
 
 def format_slither_report(json_data):
@@ -11,82 +85,187 @@ def format_slither_report(json_data):
     if not json_data or "results" not in json_data or "detectors" not in json_data["results"]:
         return "Slither Scan: No vulnerabilities detected or scan failed."
 
-    detectors = json_data["results"]["detectors"]
-    if not detectors:
+    findings = extract_slither_findings(json_data)
+    if not findings:
         return "Slither Scan: No obvious vulnerabilities found."
 
     report = "=== Slither Static Analysis Report ===\n"
-    count = 1
-
-    for item in detectors:
-        # 提取关键信息
-        check = item.get("check", "Unknown")
-        description = item.get("description", "No description")
-        impact = item.get("impact", "Informational")
-
-        # 提取受影响的代码行位置 (Source Mapping)
-        lines = []
-        if "elements" in item:
-            for elem in item["elements"]:
-                if "source_mapping" in elem:
-                    start_line = elem["source_mapping"].get("lines", [])
-                    if start_line:
-                        lines.extend(start_line)
 
-        lines_str = f"Lines: {list(set(lines))}" if lines else "Lines: Unknown"
+    for count, item in enumerate(findings, start=1):
+        lines_str = f"Lines: {item['lines']}" if item["lines"] else "Lines: Unknown"
 
-        report += f"{count}. [Type: {check}] [Impact: {impact}]\n"
-        report += f"   Description: {description}\n"
+        report += f"{count}. [Type: {item['check']}] [Impact: {item['impact']}]\n"
+        report += f"   Description: {item['description']}\n"
         report += f"   Location: {lines_str}\n\n"
-        count += 1
 
     return report
 
 
-def run_slither_scan(filename: str = "Target.sol") -> str:
+def extract_slither_json(stdout: str):
     """
-    [Runner] 在 Docker 中运行 Slither 并返回清洗后的报告
+    [解析] 从混杂日志的 stdout 中找出 Slither 的结果对象
+    只接受带有 success / results 字段的 JSON 对象，跳过日志里的其他 JSON 片段
     """
-    print(f"👁️ [Recon] 正在启动 Slither 进行静态分析: {filename}...")
+    for obj in iter_json_objects(stdout):
+        if isinstance(obj, dict) and "success" in obj and ("results" in obj or "error" in obj):
+            return obj
+    return None
+
+
+def _scan(source: str) -> dict:
+    """在容器中对源码快照运行 Slither，返回 {"report": 文本摘要, "findings": 结构化结果, "ok": 是否成功}"""
+    key = source_key(source)
+    snapshot = f"{key[:16]}.sol"
+    save_to_workspace(snapshot, source, SNAPSHOT_DIR)
 
-    # 1. 组装命令
-    # 这里的 solc-select use 是为了确保版本匹配，虽然 Dockerfile 里装了，但防一手
+    # 本地仓库中的编译器直接用 --solc 指定路径；镜像自带的版本通过环境变量指定，都不执行 solc-select use
     # slither . --json - 表示输出 json 到 stdout
-    cmd = [
-        "docker", "run", "--rm",
-        "-v", f"{WORKSPACE_DIR}:/app",
-        "foundry-box",
-        f"/bin/sh -c 'solc-select use 0.8.20 && slither /app/{filename} --json -'"
-    ]
+    version = resolve_version([source])
+    solc_path = container_solc_path(version)
+    if solc_path:
+        cmd = f"slither {snapshot} --solc {solc_path} --json -"
+    else:
+        cmd = f"SOLC_VERSION={version} slither {snapshot} --json -"
 
     try:
-        # 2. 执行命令
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding="utf-8"
-        )
-
-        # Slither 即使发现漏洞，返回码通常也是 0 或 1，所以主要看 stdout
-        stdout = result.stdout
-
-        # 3. 提取 JSON
-        # Slither 的 stdout 可能会混杂 "Compiling..." 等日志
-        # 我们寻找第一个 '{' 和最后一个 '}'
-        start = stdout.find('{')
-        end = stdout.rfind('}')
-
-        if start != -1 and end != -1:
-            json_str = stdout[start:end + 1]
-            try:
-                data = json.loads(json_str)
-                return format_slither_report(data)
-            except json.JSONDecodeError:
-                return f"Slither Execution Error: JSON parse failed.\nRaw output: {stdout[:200]}..."
-        else:
-            # 如果没找到 JSON，可能是 Slither 报错了（比如编译失败）
-            return f"Slither Failed to Run. Stdout: {stdout}\nStderr: {result.stderr}"
-
+        with span("sandbox.slither"):
+            result = run_in_sandbox(cmd, SNAPSHOT_DIR, timeout=SLITHER_TIMEOUT or None)
     except Exception as e:
-        return f"System Exception during Slither: {str(e)}"
\ No newline at end of file
+        return {"report": f"System Exception during Slither: {str(e)}", "findings": [], "ok": False}
+    finally:
+        # 结果已存入磁盘缓存；每个补丁版本都会重新扫描，快照不删的话目录会无限增长
+        try:
+            os.remove(os.path.join(SNAPSHOT_DIR, snapshot))
+        except OSError:
+            pass
+
+    # Slither 即使发现漏洞，返回码通常也是 0 或 1，所以主要看 stdout
+    data = extract_slither_json(result.stdout)
+    if data is None:
+        # 如果没找到 JSON，可能是 Slither 报错了（比如编译失败）
+        return {"report": f"Slither Failed to Run. Stdout: {result.stdout[-1000:]}\nStderr: {result.stderr[-1000:]}",
+                "findings": [], "ok": False}
+
+    return {"report": format_slither_report(data), "findings": extract_slither_findings(data),
+            "ok": bool(data.get("success"))}
+
+
+def scan_source(source: str) -> dict:
+    """[Runner] 扫描一份源码 (带缓存)"""
+    cache = _get_cache()
+    key = source_key(source)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    print("👁️ [Recon] 正在启动 Slither 进行静态分析...")
+    result = _scan(source)
+    if result["ok"]:
+        cache.put(key, result)
+    return result
+
+
+def run_slither_scan(filename: str = "Target.sol", workspace_dir: str = WORKSPACE_DIR) -> str:
+    """
+    [Runner] 在 Docker 中运行 Slither 并返回清洗后的报告
+    """
+    return scan_source(read_from_workspace(filename, workspace_dir))["report"]
+
+
+def _background_scan(source: str):
+    """后台线程中扫描：容器时间单独记账，等结果被读取时再记到读取方 run 的预算上"""
+    with metering() as usage:
+        result = scan_source(source)
+    return result, usage.container_seconds
+
+
+def _failed(future) -> bool:
+    return future.done() and (future.exception() is not None or not future.result()[0].get("ok"))
+
+
+def start_slither_scan(source: str):
+    """
+    [后台] 提交一次后台 Slither 扫描，立即返回
+    同一份源码只会提交一次 (上次扫描失败时重新提交)；已有缓存的源码在后台直接命中缓存
+    """
+    global _executor
+    if not SLITHER_ENABLED:
+        return
+    key = source_key(source)
+    with _lock:
+        future = _futures.get(key)
+        if future is not None and not _failed(future):
+            return
+        _futures.pop(key, None)
+        # 超过上限时丢弃最早结束、一直没有被读取的扫描
+        done = [k for k, f in _futures.items() if f.done()]
+        for stale in done[:max(0, len(_futures) + 1 - SLITHER_MAX_UNREAD)]:
+            del _futures[stale]
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SLITHER_WORKERS, thread_name_prefix="slither")
+        # 带上当前上下文，后台扫描的 span 归属到发起扫描的 run
+        _futures[key] = _executor.submit(contextvars.copy_context().run, _background_scan, source)
+
+
+def _take(key: str, future):
+    """
+    已完成的扫描被读取：从 _futures 中移除，容器时间记到读取方 (当前节点) 的预算上
+    同一个扫描只记一次账；抛出异常的扫描返回 None，之后可以重新提交
+    """
+    with _lock:
+        taken = _futures.get(key) is future
+        if taken:
+            del _futures[key]
+    if future.exception() is not None:
+        print(f"⚠️ [Recon] Slither 扫描失败: {future.exception()}")
+        return None
+    result, container_seconds = future.result()
+    if taken:
+        charge_container(container_seconds)
+    return result
+
+
+async def await_slither_result(source: str, timeout: float = SLITHER_WAIT):
+    """
+    [后台] 获取源码对应的 Slither 结果；最多等待 timeout 秒，未完成返回 None
+    """
+    if not SLITHER_ENABLED:
+        return None
+    key = source_key(source)
+    with _lock:
+        future = _futures.get(key)
+    if future is None:
+        # 没有提交过后台扫描 (例如恢复运行)，只查缓存
+        return _get_cache().get(key)
+
+    if not future.done():
+        try:
+            # shield: 超时只是不再等待，不取消后台扫描
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        except Exception:
+            pass  # 由 _take 报告失败
+    return _take(key, future)
+
+
+def peek_slither_result(source: str):
+    """[后台] 不等待：扫描已完成或有缓存时返回结果，否则返回 None"""
+    if not SLITHER_ENABLED:
+        return None
+    key = source_key(source)
+    with _lock:
+        future = _futures.get(key)
+    if future is None:
+        return _get_cache().get(key)
+    if not future.done():
+        return None
+    return _take(key, future)
+
+
+async def await_slither_report(source: str, timeout: float = SLITHER_WAIT) -> str:
+    """返回可以直接放入 prompt 的 Slither 报告文本；尚未就绪或扫描失败时返回空字符串"""
+    result = await await_slither_result(source, timeout)
+    if not result or not result.get("ok"):
+        return ""
+    return result["report"]
@@ -0,0 +1,174 @@
+"""
+[solc] 按 pragma 从本地编译器仓库中选择 solc 版本
+仓库布局与 svm 相同: <SOLC_STORE>/<版本>/solc-<版本>，以只读方式挂载进沙盒容器，离线可用
+预先下载编译器 (需要网络，只做一次):
+    python -m src.tools.solc_resolver install 0.7.6 0.8.19 0.8.24
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import stat
+import threading
+import urllib.request
+
+# 镜像中自带的 solc 版本 (见 Dockerfile)：仓库中没有任何匹配的版本时使用
+SOLC_VERSION = os.getenv("SOLC_VERSION", "0.8.20")
+SOLC_STORE = os.getenv("SOLC_STORE", os.path.join(os.getcwd(), "solc-store"))
+# 仓库在容器内的挂载点
+SOLC_STORE_MOUNT = "/opt/solc-store"
+SOLC_BINARIES_URL = os.getenv("SOLC_BINARIES_URL", "https://binaries.soliditylang.org/linux-amd64")
+
+_PRAGMA_RE = re.compile(r"^\s*pragma\s+solidity\s+([^;]+);", re.MULTILINE)
+_COMPARATOR_RE = re.compile(r"(\^|~|>=|<=|>|<|=)?\s*v?(\d+(?:\.\d+){0,2})")
+_HYPHEN_RE = re.compile(r"(\d+(?:\.\d+){0,2})\s+-\s+(\d+(?:\.\d+){0,2})")
+_VERSION_DIR_RE = re.compile(r"^\d+\.\d+\.\d+$")
+
+_lock = threading.Lock()
+# 源码 sha256 -> 该文件的 pragma 约束
+_pragmas = {}
+
+
+def parse_version(text: str) -> tuple:
+    parts = [int(p) for p in text.split(".")]
+    return tuple(parts + [0] * (3 - len(parts)))
+
+
+def _comparators(op: str, text: str) -> list:
+    """把一个约束展开成 [(运算符, 版本)]"""
+    version = parse_version(text)
+    major, minor, patch = version
+    if op == "^":
+        # ^0.8.x 锁定 minor，^1.x 锁定 major，^0.0.x 只匹配该版本
+        upper = (major + 1, 0, 0) if major else (0, minor + 1, 0) if minor else (0, 0, patch + 1)
+        return [(">=", version), ("<", upper)]
+    if op == "~":
+        return [(">=", version), ("<", (major, minor + 1, 0))]
+    if not op and text.count(".") < 2:
+        # 不完整的版本号 "0.8" 表示该系列中的任意版本
+        return [(">=", version), ("<", (major, minor + 1, 0) if text.count(".") else (major + 1, 0, 0))]
+    return [(op or "=", version)]
+
+
+def parse_constraint(expression: str) -> list:
+    """[解析] pragma 表达式 -> 备选组 [[(运算符, 版本), ...], ...]，组内为 AND，组之间为 OR"""
+    groups = []
+    for alternative in expression.split("||"):
+        alternative = _HYPHEN_RE.sub(r">=\1 <=\2", alternative)
+        group = []
+        for op, text in _COMPARATOR_RE.findall(alternative):
+            group.extend(_comparators(op, text))
+        groups.append(group)
+    return groups
+
+
+def satisfies(version: tuple, groups: list) -> bool:
+    checks = {"=": version.__eq__, ">=": version.__ge__, "<=": version.__le__, ">": version.__gt__, "<": version.__lt__}
+    return any(all(checks[op](bound) for op, bound in group) for group in groups)
+
+
+def source_pragmas(source: str) -> tuple:
+    """[缓存] 一份源码中的所有 pragma solidity 表达式 (按源码哈希缓存)"""
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    with _lock:
+        cached = _pragmas.get(digest)
+    if cached is None:
+        cached = tuple(m.strip() for m in _PRAGMA_RE.findall(source))
+        with _lock:
+            _pragmas[digest] = cached
+    return cached
+
+
+@functools.lru_cache(maxsize=1)
+def available_versions() -> tuple:
+    """仓库中已有的 solc 版本 (从高到低)；仓库在进程运行期间只读，只扫描一次"""
+    if not os.path.isdir(SOLC_STORE):
+        return ()
+    versions = [
+        name for name in os.listdir(SOLC_STORE)
+        if _VERSION_DIR_RE.match(name) and os.path.isfile(os.path.join(SOLC_STORE, name, f"solc-{name}"))
+    ]
+    return tuple(sorted(versions, key=parse_version, reverse=True))
+
+
+@functools.lru_cache(maxsize=4096)
+def _resolve(pragmas: tuple) -> str:
+    groups = [parse_constraint(p) for p in pragmas]
+    for candidate in available_versions() + (SOLC_VERSION,):
+        version = parse_version(candidate)
+        if all(satisfies(version, g) for g in groups):
+            return candidate
+    # 没有满足全部约束的版本：使用镜像自带版本，由编译器报告 pragma 不匹配
+    return SOLC_VERSION
+
+
+def resolve_version(sources: list) -> str:
+    """[Resolver] 同时满足所有源码 pragma 的最高版本；仓库中的版本优先于镜像自带的版本"""
+    pragmas = set()
+    for source in sources:
+        pragmas.update(source_pragmas(source))
+    return _resolve(tuple(sorted(pragmas)))
+
+
+def in_store(version: str) -> bool:
+    return version in available_versions()
+
+
+def container_solc_path(version: str):
+    """仓库中的编译器在容器内的路径；不在仓库中 (镜像自带版本) 返回 None"""
+    if not in_store(version):
+        return None
+    return f"{SOLC_STORE_MOUNT}/{version}/solc-{version}"
+
+
+def install(versions: list, store: str = SOLC_STORE):
+    """[仓库] 从 soliditylang.org 下载 linux-amd64 编译器到仓库，校验 sha256"""
+    with urllib.request.urlopen(f"{SOLC_BINARIES_URL}/list.json") as response:
+        builds = {b["version"]: b for b in json.load(response)["builds"]}
+    for version in versions:
+        build = builds.get(version)
+        if build is None:
+            print(f"❌ [solc] 没有 {version} 的发布版本")
+            continue
+        target = os.path.join(store, version, f"solc-{version}")
+        if os.path.isfile(target):
+            print(f"⚡ [solc] {version} 已存在")
+            continue
+        with urllib.request.urlopen(f"{SOLC_BINARIES_URL}/{build['path']}") as response:
+            data = response.read()
+        if "0x" + hashlib.sha256(data).hexdigest() != build["sha256"]:
+            print(f"❌ [solc] {version} 校验失败")
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+        os.chmod(target, os.stat(target).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        print(f"✅ [solc] 已安装 {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 solc 编译器仓库")
+    sub = parser.add_subparsers(dest="command", required=True)
+    install_parser = sub.add_parser("install", help="下载指定版本到仓库")
+    install_parser.add_argument("versions", nargs="+")
+    sub.add_parser("list", help="列出仓库中的版本")
+    resolve_parser = sub.add_parser("resolve", help="按源码中的 pragma 选择版本")
+    resolve_parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "install":
+        install(args.versions)
+    elif args.command == "list":
+        print("\n".join(available_versions()) or f"(空) {SOLC_STORE}")
+    else:
+        sources = []
+        for path in args.files:
+            with open(path, "r", encoding="utf-8") as f:
+                sources.append(f.read())
+        print(resolve_version(sources))
+
+
+if __name__ == "__main__":
+    main()
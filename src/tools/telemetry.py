@@ -0,0 +1,260 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+
+from src.tools.file_utils import WORKSPACE_DIR
+
+# 每个 span 结束时追加一行到 trace.jsonl；metrics.prom 是 Prometheus 文本格式的累计快照
+TELEMETRY_ENABLED = os.getenv("TELEMETRY", "1") == "1"
+TELEMETRY_DIR = os.getenv("TELEMETRY_DIR", os.path.join(WORKSPACE_DIR, ".telemetry"))
+TRACE_FILE = os.path.join(TELEMETRY_DIR, "trace.jsonl")
+METRICS_FILE = os.path.join(TELEMETRY_DIR, "metrics.prom")
+# 进程内最多保留多少个 span 用于生成运行结束时的耗时分解
+TELEMETRY_MAX_SPANS = int(os.getenv("TELEMETRY_MAX_SPANS", "100000"))
+
+METRIC_PREFIX = "recon"
+
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+# run_id / round / retry，由 run_context 和图节点设置，同一 run 内的所有 span 都会带上
+_run_context = contextvars.ContextVar("telemetry_run", default={})
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_spans = collections.deque(maxlen=TELEMETRY_MAX_SPANS)
+_attempts = collections.Counter()
+_metrics = collections.defaultdict(float)
+
+
+class Span:
+    """一次计时区间；attrs 可以在区间内通过 set() 补充"""
+
+    def __init__(self, name: str, attrs: dict, parent):
+        self.id = next(_ids)
+        self.parent_id = parent.id if parent else None
+        self.name = name
+        self.attrs = dict(attrs)
+        self.context = dict(_run_context.get())
+        self.start = time.time()
+        self.duration = 0.0
+        self.status = "ok"
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration": round(self.duration, 6),
+            "status": self.status,
+            **self.context,
+            "attrs": self.attrs,
+        }
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """
+    [Telemetry] 记录一个 span:
+        with span("sandbox.compile", files=2) as s:
+            ...
+            s.set(cache_hit=False)
+    嵌套的 span 通过 contextvars 自动关联父子关系 (在协程和 asyncio.to_thread 中同样有效)
+    """
+    current = Span(name, attrs, _current_span.get())
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _current_span.reset(token)
+        _finish(current)
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def run_context(**fields):
+    """在当前上下文中附加 run 级别的字段 (run_id / round / retry)"""
+    token = _run_context.set({**_run_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _run_context.reset(token)
+
+
+def _node_context(name: str, state: dict) -> dict:
+    run_id = state.get("run_id", "")
+    round_count = state.get("round_count", 0)
+    # 同一轮内同一节点第几次执行 (编译失败打回重写时递增)
+    with _lock:
+        key = (run_id, name, round_count)
+        retry = _attempts[key]
+        _attempts[key] += 1
+    return {"run_id": run_id, "round": round_count, "retry": retry}
+
+
+def traced_node(name: str):
+    """[Telemetry] 图节点装饰器：每次执行记录一个 node.<name> span，附带轮次和重试次数"""
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(state):
+                with run_context(**_node_context(name, state)), span(f"node.{name}") as s:
+                    update = await fn(state)
+                    s.set(status=(update or {}).get("execution_status", ""))
+                    return update
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(state):
+            with run_context(**_node_context(name, state)), span(f"node.{name}") as s:
+                update = fn(state)
+                s.set(status=(update or {}).get("execution_status", ""))
+                return update
+
+        return wrapper
+
+    return decorator
+
+
+def _finish(finished: Span):
+    if not TELEMETRY_ENABLED:
+        return
+    record = finished.to_dict()
+    with _lock:
+        _spans.append(finished)
+        _update_metrics(finished)
+        try:
+            os.makedirs(TELEMETRY_DIR, exist_ok=True)
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            pass  # 写 trace 失败不影响主流程
+
+
+def _update_metrics(finished: Span):
+    label = ("span", finished.name)
+    _metrics[("span_duration_seconds_sum", label)] += finished.duration
+    _metrics[("span_duration_seconds_count", label)] += 1
+    if finished.status == "error":
+        _metrics[("span_errors_total", label)] += 1
+
+    if finished.name == "llm.call":
+        tag = ("tag", finished.attrs.get("tag", ""))
+        for direction in ("input", "output"):
+            tokens = finished.attrs.get(f"{direction}_tokens")
+            if tokens:
+                _metrics[("llm_tokens_total", tag, ("direction", direction))] += tokens
+        if finished.attrs.get("ttft") is not None:
+            _metrics[("llm_ttft_seconds_sum", tag)] += finished.attrs["ttft"]
+            _metrics[("llm_ttft_seconds_count", tag)] += 1
+        if finished.attrs.get("cached"):
+            _metrics[("llm_cache_hits_total", tag)] += 1
+    elif finished.name == "sandbox.container_start":
+        _metrics[("container_starts_total",)] += 1
+
+
+def write_metrics_snapshot(path: str = METRICS_FILE):
+    """[Telemetry] 以 Prometheus 文本格式写出当前的累计指标"""
+    if not TELEMETRY_ENABLED:
+        return
+    with _lock:
+        items = sorted(_metrics.items())
+    lines = []
+    seen = set()
+    for (metric, *labels), value in items:
+        name = f"{METRIC_PREFIX}_{metric}"
+        family = name.rsplit("_sum", 1)[0].rsplit("_count", 1)[0]
+        if family not in seen:
+            seen.add(family)
+            kind = "counter" if metric.endswith("_total") else "summary"
+            lines.append(f"# TYPE {family} {kind}")
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def get_run_spans(run_id: str) -> list:
+    """返回某次 run 的所有已结束 span (字典形式，按结束顺序)"""
+    with _lock:
+        return [s.to_dict() for s in _spans if s.context.get("run_id") == run_id]
+
+
+def summarize_run(run_id: str) -> dict:
+    """
+    [Telemetry] 汇总一次 run 的耗时分解
+    - llm / startup / compile / execute / slither 按各自 span 的自身耗时统计 (扣除嵌套的子 span)
+    - forge test 一次完成编译和执行：执行时间取 forge 报告的测试套件耗时，其余计入编译
+    """
+    with _lock:
+        spans = [s for s in _spans if s.context.get("run_id") == run_id]
+
+    child_time = collections.defaultdict(float)
+    for s in spans:
+        if s.parent_id is not None:
+            child_time[s.parent_id] += s.duration
+
+    summary = {"llm": 0.0, "startup": 0.0, "compile": 0.0, "execute": 0.0, "slither": 0.0,
+               "input_tokens": 0, "output_tokens": 0, "llm_calls": 0, "nodes": {}}
+    for s in spans:
+        own = max(s.duration - child_time[s.id], 0.0)
+        if s.name == "llm.call":
+            summary["llm"] += s.duration
+            summary["llm_calls"] += 1
+            summary["input_tokens"] += s.attrs.get("input_tokens") or 0
+            summary["output_tokens"] += s.attrs.get("output_tokens") or 0
+        elif s.name == "sandbox.startup":
+            summary["startup"] += s.duration
+        elif s.name == "sandbox.compile":
+            summary["compile"] += own
+        elif s.name == "sandbox.test":
+            execute = min(s.attrs.get("execute_s") or 0.0, own)
+            summary["execute"] += execute
+            summary["compile"] += own - execute
+        elif s.name == "sandbox.slither":
+            summary["slither"] += own
+        elif s.name.startswith("node."):
+            node = summary["nodes"].setdefault(s.name[5:], {"count": 0, "seconds": 0.0})
+            node["count"] += 1
+            node["seconds"] += s.duration
+    return summary
+
+
+def format_breakdown(summary: dict, total: float = None) -> str:
+    """把 summarize_run 的结果格式化为终端输出的耗时分解"""
+    lines = ["📊 === 耗时分解 ==="]
+    if total:
+        lines.append(f"总耗时: {total:.1f}s")
+    lines.append(f"  LLM:      {summary['llm']:.1f}s ({summary['llm_calls']} 次调用, "
+                 f"tokens 输入 {summary['input_tokens']} / 输出 {summary['output_tokens']})")
+    lines.append(f"  容器启动: {summary['startup']:.1f}s")
+    lines.append(f"  编译:     {summary['compile']:.1f}s")
+    lines.append(f"  执行测试: {summary['execute']:.1f}s")
+    lines.append(f"  Slither:  {summary['slither']:.1f}s (后台，与其他阶段重叠)")
+    if summary["nodes"]:
+        lines.append("  各节点:")
+        for name, node in sorted(summary["nodes"].items(), key=lambda kv: -kv[1]["seconds"]):
+            lines.append(f"    {name:<14} {node['seconds']:.1f}s ({node['count']} 次)")
+    return "\n".join(lines)
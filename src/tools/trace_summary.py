@@ -0,0 +1,143 @@
+import os
+import re
+
+# 每个测试最多保留多少条调用记录 / 日志行
+TRACE_MAX_CALLS = int(os.getenv("TRACE_MAX_CALLS", "20"))
+TRACE_MAX_DEPTH = int(os.getenv("TRACE_MAX_DEPTH", "3"))
+TRACE_MAX_LOGS = int(os.getenv("TRACE_MAX_LOGS", "10"))
+
+_BALANCE_RE = re.compile(r"balance", re.IGNORECASE)
+
+
+def _gas_of(res: dict):
+    kind = res.get("kind") or {}
+    for value in kind.values():
+        if isinstance(value, dict):
+            return value.get("gas") or value.get("mean_gas") or value.get("median_gas")
+    return None
+
+
+def _format_value(value) -> str:
+    """wei 数值 (十进制或 0x 十六进制) 转换为易读的 ether 表示"""
+    try:
+        wei = int(value, 16) if isinstance(value, str) and value.startswith("0x") else int(value)
+    except (TypeError, ValueError):
+        return str(value)
+    if wei == 0:
+        return "0"
+    if wei % 10 ** 18 == 0 or wei >= 10 ** 15:
+        return f"{wei / 10 ** 18:g} ether"
+    return f"{wei} wei"
+
+
+def _iter_trace_nodes(traces):
+    """遍历 forge JSON 中的调用树节点 (traces: [[kind, {"arena": [...]}], ...])"""
+    for entry in traces or []:
+        arena = entry[1].get("arena", []) if isinstance(entry, list) and len(entry) == 2 else []
+        for node in arena:
+            trace = node.get("trace")
+            if isinstance(trace, dict):
+                yield trace
+
+
+def _format_call(trace: dict, labels: dict) -> str:
+    decoded = trace.get("decoded") or {}
+    callee = decoded.get("label") or labels.get(trace.get("address"), trace.get("address", "?"))
+    caller = labels.get(trace.get("caller"), trace.get("caller", "?"))
+    call_data = decoded.get("call_data") or {}
+    signature = call_data.get("signature") or (trace.get("data") or "")[:10] or "()"
+    args = call_data.get("args") or []
+    if args:
+        signature = signature.split("(", 1)[0] + "(" + ", ".join(str(a) for a in args) + ")"
+
+    line = f"{caller} -> {callee}::{signature}"
+    value = trace.get("value")
+    if value and _format_value(value) != "0":
+        line += f" {{value: {_format_value(value)}}}"
+    return line + (" ✓" if trace.get("success", True) else " ✗ REVERT")
+
+
+def summarize_test_result(test_name: str, res: dict) -> str:
+    """
+    [摘要] 把单个测试的 forge JSON 结果压缩为: 状态 / 原因 / gas + 关键调用链 + 余额相关日志
+    """
+    status = res.get("status")
+    reason = res.get("reason", "None")
+    gas = _gas_of(res)
+    summary = f"Test: {test_name} | Status: {status} | Reason: {reason}"
+    if gas:
+        summary += f" | Gas: {gas}"
+    summary += "\n"
+
+    labels = res.get("labeled_addresses") or {}
+    calls = [
+        _format_call(trace, labels)
+        for trace in _iter_trace_nodes(res.get("traces"))
+        if 0 < trace.get("depth", 0) <= TRACE_MAX_DEPTH
+    ]
+    if calls:
+        summary += "  Calls:\n"
+        for line in calls[:TRACE_MAX_CALLS]:
+            summary += f"    {line}\n"
+        if len(calls) > TRACE_MAX_CALLS:
+            summary += f"    ... 另有 {len(calls) - TRACE_MAX_CALLS} 次调用\n"
+
+    logs = [str(log) for log in res.get("decoded_logs") or []]
+    balance_logs = [log for log in logs if _BALANCE_RE.search(log)]
+    other_logs = [log for log in logs if not _BALANCE_RE.search(log)]
+    if balance_logs:
+        summary += "  Balance changes:\n"
+        for log in balance_logs[:TRACE_MAX_LOGS]:
+            summary += f"    {log}\n"
+    if other_logs:
+        summary += "  Logs:\n"
+        for log in other_logs[:TRACE_MAX_LOGS]:
+            summary += f"    {log}\n"
+
+    if res.get("counterexample"):
+        summary += format_counterexample(res["counterexample"], labels)
+    return summary
+
+
+def _format_step(step: dict, labels: dict) -> str:
+    signature = step.get("signature") or (step.get("calldata") or "")[:10] or "?"
+    args = step.get("args")
+    if args is not None:
+        signature = signature.split("(", 1)[0] + f"({args})"
+    target = step.get("contract_name") or labels.get(step.get("address"), step.get("address"))
+    line = f"{target}::{signature}" if target else signature
+    sender = step.get("sender")
+    return f"{labels.get(sender, sender)} -> {line}" if sender else line
+
+
+def format_counterexample(counterexample, labels: dict = None) -> str:
+    """
+    [摘要] fuzz / invariant 反例
+    forge 的格式: {"Single": {...}} (fuzz 测试的一组输入) 或 {"Sequence": [{...}, ...]} (invariant 的调用序列)
+    """
+    labels = labels or {}
+    if isinstance(counterexample, dict) and isinstance(counterexample.get("Single"), dict):
+        return f"  Counterexample: {_format_step(counterexample['Single'], labels)}\n"
+    if isinstance(counterexample, dict) and isinstance(counterexample.get("Sequence"), list):
+        steps = [s for s in counterexample["Sequence"] if isinstance(s, dict)]
+        text = f"  Counterexample ({len(steps)} calls):\n"
+        for n, step in enumerate(steps[:TRACE_MAX_CALLS], start=1):
+            text += f"    {n}. {_format_step(step, labels)}\n"
+        if len(steps) > TRACE_MAX_CALLS:
+            text += f"    ... 另有 {len(steps) - TRACE_MAX_CALLS} 次调用\n"
+        return text
+    return f"  Counterexample: {counterexample}\n"
+
+
+def truncate_logs(logs: str, limit: int = 3000) -> str:
+    """按整行截断日志，保留开头 (状态/原因) 而不是粗暴地取最后 N 个字符"""
+    if len(logs) <= limit:
+        return logs
+    kept = []
+    size = 0
+    for line in logs.splitlines():
+        if size + len(line) + 1 > limit:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(kept) + f"\n... (省略 {len(logs) - size} 个字符)"
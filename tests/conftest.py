@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# 模块在导入时读取环境变量：测试中的缓存 / 历史 / 遥测都写到临时目录，不碰仓库的 workspace/
+_TMP = tempfile.mkdtemp(prefix="recon-tests-")
+os.environ.setdefault("RECON_CACHE_DIR", os.path.join(_TMP, "cache"))
+os.environ.setdefault("CHECKPOINT_DIR", os.path.join(_TMP, "checkpoints"))
+os.environ.setdefault("TELEMETRY_DIR", os.path.join(_TMP, "telemetry"))
+os.environ.setdefault("JOB_QUEUE_DB", os.path.join(_TMP, "jobs.sqlite"))
+os.environ.setdefault("EXPLOIT_KB", "0")
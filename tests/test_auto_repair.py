@@ -0,0 +1,76 @@
+from src.tools import auto_repair
+from src.tools.auto_repair import error_fingerprint, parse_compile_errors, repair_source
+
+TARGET = """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.19;
+
+contract EtherBank {
+    function withdraw() public {}
+}
+"""
+
+
+def _error(kind: str, message: str, line: int, column: int, snippet: str, file: str = "Exploit.t.sol") -> str:
+    return (f"Line {line}: {kind}: {message}\n"
+            f"  --> {file}:{line}:{column}:\n"
+            f"   |\n"
+            f"{line} | {snippet}\n")
+
+
+def test_parse_compile_errors():
+    feedback = _error("DeclarationError", "Undeclared identifier.", 9, 9, "bank.withdrawAll();")
+    assert parse_compile_errors(feedback) == [{
+        "type": "DeclarationError", "code": None, "message": "Undeclared identifier.",
+        "file": "Exploit.t.sol", "line": 9, "column": 9, "snippet": "bank.withdrawAll();",
+    }]
+
+
+def test_fingerprint_ignores_line_numbers():
+    first = _error("TypeError", "Member \"x\" not found.", 9, 5, "bank.x();")
+    moved = _error("TypeError", "Member \"x\" not found.", 27, 13, "bank.x();")
+    other = _error("TypeError", "Member \"y\" not found.", 9, 5, "bank.y();")
+    assert error_fingerprint(first) == error_fingerprint(moved)
+    assert error_fingerprint(first) != error_fingerprint(other)
+
+
+def test_missing_forge_std_import():
+    exploit = 'pragma solidity ^0.8.19;\nimport "./Target.sol";\n\ncontract ExploitTest is Test {\n}\n'
+    feedback = _error("DeclarationError", "Identifier not found or not unique.", 4, 25,
+                      "contract ExploitTest is Test {")
+    fixed, rules = repair_source(exploit, feedback, "Exploit.t.sol", TARGET)
+    assert rules == ["forge_std_import"]
+    assert 'import "forge-std/Test.sol";' in fixed
+
+
+def test_misspelled_target_contract_is_renamed():
+    exploit = ('pragma solidity ^0.8.19;\nimport "forge-std/Test.sol";\n\ncontract ExploitTest is Test {\n'
+               '    EtherBnak bank;\n}\n')
+    feedback = _error("DeclarationError", "Identifier not found or not unique.", 5, 5, "EtherBnak bank;")
+    fixed, rules = repair_source(exploit, feedback, "Exploit.t.sol", TARGET)
+    assert "rename:EtherBnak->EtherBank" in rules
+    assert "target_import" in rules
+    assert "EtherBank bank;" in fixed and 'import "./Target.sol";' in fixed
+
+
+def test_prose_around_code_is_stripped():
+    exploit = "Here is the exploit:\n```solidity\npragma solidity ^0.8.19;\ncontract ExploitTest {}\n```\nGood luck!"
+    feedback = "Line 1: ParserError: Expected pragma, import directive or contract/interface/library definition."
+    fixed, rules = repair_source(exploit, feedback, "Exploit.t.sol", TARGET)
+    assert rules == ["strip_prose"]
+    assert fixed == "pragma solidity ^0.8.19;\ncontract ExploitTest {}\n"
+
+
+def test_pragma_follows_the_target(monkeypatch):
+    monkeypatch.setattr(auto_repair, "resolve_version", lambda sources: "0.8.19")
+    exploit = "pragma solidity 0.7.6;\ncontract ExploitTest {}\n"
+    feedback = "Line 1: ParserError: Source file requires different compiler version (current compiler is 0.8.19)"
+    fixed, rules = repair_source(exploit, feedback, "Exploit.t.sol", TARGET)
+    assert rules == ["pragma"]
+    assert fixed.startswith("pragma solidity ^0.8.19;")
+
+
+def test_errors_in_other_files_are_ignored():
+    exploit = 'pragma solidity ^0.8.19;\ncontract ExploitTest is Test {}\n'
+    feedback = _error("DeclarationError", "Identifier not found or not unique.", 2, 25,
+                      "contract ExploitTest is Test {}", file="Target.sol")
+    assert repair_source(exploit, feedback, "Exploit.t.sol", TARGET) == (exploit, [])
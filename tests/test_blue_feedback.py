@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("langgraph")
+
+from src.agent import blue_agent
+from src.graph import history, workflow
+
+PATCH = "pragma solidity ^0.8.0;\ncontract Bank { function withdraw() public {} }\n"
+COMPILE_ERROR = "Line 2: TypeError: Member \"call\" not found or not visible.\n  --> Target.sol:2:34:"
+
+
+@pytest.fixture
+def prompts(monkeypatch, tmp_path):
+    """把蓝队的 LLM 调用换成固定回复，记录每次渲染后的 prompt"""
+    monkeypatch.setattr(history, "_store", history.HistoryStore(str(tmp_path / "history.sqlite")))
+    monkeypatch.setattr(blue_agent, "BLUE_PATCH_FORMAT", "full")
+
+    async def no_report(source):
+        return ""
+
+    monkeypatch.setattr(workflow, "await_slither_report", no_report)
+    monkeypatch.setattr(workflow, "retrieve_patch_examples", lambda source, findings: "")
+    rendered = []
+
+    async def fake_completion(prompt, input_vars, tag="llm", **kwargs):
+        rendered.append(prompt.format(**input_vars))
+        return f"```solidity\n{PATCH}```"
+
+    monkeypatch.setattr(blue_agent, "astream_completion", fake_completion)
+    return rendered
+
+
+def _state(**overrides):
+    state = {
+        "target_ref": history.store_text("contract Bank { function withdraw() public { msg.sender.call(\"\"); } }\n"),
+        "exploit_ref": history.store_text("contract ExploitTest {}\n"),
+        "logs_ref": history.store_text("[FAIL] testExploit()\n"),
+        "patched_from_ref": "", "compiler_feedback": "", "slither_report": "", "round_count": 1,
+        "run_id": "test", "elapsed_s": 0.0, "llm_tokens": 0, "container_seconds": 0.0,
+    }
+    state.update(overrides)
+    return state
+
+
+def test_patch_retry_prompt_contains_compiler_error(prompts):
+    first = asyncio.run(workflow.node_blue_agent(_state()))
+    assert COMPILE_ERROR not in prompts[0]
+
+    # check_patch 编译失败打回：target_ref 是上一次的补丁，compiler_feedback 是它的报错
+    retry = _state(target_ref=first["target_ref"], patched_from_ref=first["patched_from_ref"],
+                   round_count=first["round_count"], compiler_feedback=COMPILE_ERROR,
+                   execution_status="patch_error")
+    second = asyncio.run(workflow.node_blue_agent(retry))
+
+    assert COMPILE_ERROR in prompts[1]
+    assert PATCH.strip() in prompts[1]
+    # 重写补丁不算新的一轮
+    assert second["round_count"] == first["round_count"]
+    assert second["compiler_feedback"] == ""
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from src.tools.disk_cache import DiskCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache" / "entries.sqlite")
+
+
+def test_values_roundtrip_as_json_and_persist(path):
+    cache = DiskCache(path)
+    cache.put("verdict", [True, "ok"])
+    cache.put("report", {"findings": [{"check": "reentrancy-eth"}]})
+    assert cache.get("verdict") == [True, "ok"]
+    assert DiskCache(path).get("report") == {"findings": [{"check": "reentrancy-eth"}]}
+    assert cache.get("missing") is None
+
+
+def test_evicts_least_recently_used(path):
+    cache = DiskCache(path, max_entries=2)
+    cache.put("a", 1)
+    time.sleep(0.01)
+    cache.put("b", 2)
+    time.sleep(0.01)
+    assert cache.get("a") == 1  # a 变成最近访问
+    time.sleep(0.01)
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_ttl_expires_entries(path):
+    cache = DiskCache(path, ttl=0.05)
+    cache.put("k", "v")
+    assert cache.get("k") == "v"
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_access_does_not_extend_ttl(path):
+    cache = DiskCache(path, ttl=0.1)
+    cache.put("k", "v")
+    time.sleep(0.06)
+    assert cache.get("k") == "v"
+    time.sleep(0.06)
+    assert cache.get("k") is None
+
+
+def test_stats_and_clear(path):
+    cache = DiskCache(path)
+    cache.put("k", 1)
+    cache.get("k")
+    cache.get("k")
+    cache.get("other")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (2, 1, 0.667)
+    cache.clear()
+    assert cache.get("k") is None
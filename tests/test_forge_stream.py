@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from src.tools.forge_stream import ForgeOutputParser
+
+TEST_OUTPUT = {
+    "test/Exploit.t.sol:ExploitTest": {
+        "duration": "12ms",
+        "test_results": {
+            "testExploit()": {
+                "status": "Failure",
+                "reason": "attack failed",
+                "kind": {"Unit": {"gas": 51234}},
+                "counterexample": None,
+                "decoded_logs": ["balance: 10", "drained"],
+                "labeled_addresses": {},
+                "traces": [["Execution", {"arena": [{"trace": {"depth": 0, "address": "0xabc", "success": False,
+                                                               "data": "0x", "output": "0xdeadbeef" * 8}}]}]],
+                "gas_report_traces": {"huge": "x" * 1000},
+            }
+        },
+    }
+}
+
+
+def _parse(chunks) -> ForgeOutputParser:
+    parser = ForgeOutputParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return parser
+
+
+def _split(data: bytes, size: int) -> list:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64, 100000])
+def test_result_is_independent_of_chunk_boundaries(size):
+    data = ("Compiling 2 files...\n" + json.dumps(TEST_OUTPUT) + "\n").encode("utf-8")
+    parser = _parse(_split(data, size))
+
+    assert parser.done
+    result = parser.result["test/Exploit.t.sol:ExploitTest"]["test_results"]["testExploit()"]
+    assert result["status"] == "Failure"
+    assert result["reason"] == "attack failed"
+    assert result["decoded_logs"] == ["balance: 10", "drained"]
+    # 不在 spec 中的字段边扫描边丢弃
+    assert "gas_report_traces" not in result
+    assert "output" not in result["traces"][0][1]["arena"][0]["trace"]
+    assert "Compiling 2 files" in parser.text
+
+
+def test_braces_inside_log_lines_are_not_json():
+    data = b"warning: mapping {x} unused\n{not json at all\n" + json.dumps({"errors": []}).encode() + b"\n"
+    parser = _parse(_split(data, 5))
+    assert parser.result == {"errors": []}
+    assert "not json at all" in parser.text
+
+
+def test_multibyte_characters_split_across_chunks():
+    payload = {"errors": [{"message": "变量未声明 ✗"}]}
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    parser = _parse(_split(data, 1))
+    assert parser.result == payload
+
+
+def test_output_after_the_result_is_ignored():
+    data = json.dumps({"errors": []}).encode() + b"\n{\"errors\": [\"late\"]}\n"
+    parser = _parse([data])
+    assert parser.result == {"errors": []}
+
+
+def test_truncated_json_yields_no_result():
+    data = json.dumps(TEST_OUTPUT).encode()[:-10]
+    parser = _parse(_split(data, 16))
+    assert parser.result is None
+    assert not parser.done
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from src.graph import history
+from src.graph.history import HistoryStore, _apply, _delta
+
+BASE = "".join(f"    uint256 public v{i} = {i};\n" for i in range(300))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.sqlite"))
+
+
+def _edit(text: str, rng: random.Random, n: int) -> str:
+    lines = text.splitlines(keepends=True)
+    lines[rng.randrange(len(lines))] = f"    // patch {n}\n"
+    lines.insert(rng.randrange(len(lines)), f"    require(msg.sender == owner); // {n}\n")
+    return "".join(lines)
+
+
+@pytest.mark.parametrize("base, text", [
+    ("", "a\nb\n"),
+    ("a\nb\n", ""),
+    ("a\nb\nc\n", "a\nc\nd\n"),
+    ("no trailing newline", "no trailing newline\nadded"),
+    (BASE, BASE.replace("v150 = 150", "v150 = 0")),
+])
+def test_delta_roundtrip(base, text):
+    assert _apply(base, _delta(base, text)) == text
+
+
+def test_versions_roundtrip_through_a_fresh_store(store, tmp_path):
+    rng = random.Random(7)
+    texts, refs = [BASE], [store.put(BASE)]
+    for n in range(40):
+        texts.append(_edit(texts[-1], rng, n))
+        refs.append(store.put(texts[-1], refs[-1]))
+
+    reopened = HistoryStore(str(tmp_path / "history.sqlite"))  # 没有内存缓存，沿增量链回放
+    assert [reopened.get(ref) for ref in refs] == texts
+
+
+def test_chain_depth_is_capped(store, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_MAX_CHAIN", 4)
+    rng = random.Random(1)
+    text, ref = BASE, store.put(BASE)
+    for n in range(12):
+        text = _edit(text, rng, n)
+        ref = store.put(text, ref)
+    depths = [row[0] for row in store._conn.execute("SELECT depth FROM objects ORDER BY rowid")]
+    assert max(depths) == 4
+    # 达到上限后存一份完整内容，重新开始一条链
+    assert depths[:6] == [0, 1, 2, 3, 4, 0]
+
+
+def test_small_edits_are_stored_as_small_deltas(store):
+    first = store.put(BASE)
+    store.put(BASE.replace("v7 = 7", "v7 = 8"), first)
+    full, delta = [row[0] for row in store._conn.execute("SELECT LENGTH(data) FROM objects ORDER BY rowid")]
+    assert delta < full / 5
+
+
+def test_identical_content_is_stored_once(store):
+    assert store.put("log line\n") == store.put("log line\n")
+    assert store._conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0] == 1
+    assert store.put("") == "" and store.get("") == ""
+    with pytest.raises(KeyError):
+        store.get("0" * 64)
+
+
+def test_events_and_stats(store):
+    target = store.put(BASE)
+    exploit = store.put("contract ExploitTest {}\n")
+    store.record("run-1", 1, "target", target, "original")
+    store.record("run-1", 1, "exploit", exploit, "success")
+    store.record("run-2", 1, "target", target, "original")
+
+    assert store.events("run-1") == [
+        {"round": 1, "kind": "target", "hash": target, "status": "original"},
+        {"round": 1, "kind": "exploit", "hash": exploit, "status": "success"},
+    ]
+    assert [e["hash"] for e in store.events("run-1", "exploit")] == [exploit]
+    stats = store.stats("run-1")
+    assert stats["objects"] == 2
+    assert stats["size"] == len(BASE) + len("contract ExploitTest {}\n")
+    assert stats["stored"] < stats["size"]
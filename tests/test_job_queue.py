@@ -0,0 +1,139 @@
+import multiprocessing
+import time
+
+import pytest
+
+from src.tools.job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite"))
+
+
+def _status(queue: JobQueue, job_id: int) -> dict:
+    return next(job for job in queue.jobs() if job["id"] == job_id)
+
+
+def test_claims_by_priority_then_submission_order(queue):
+    queue.submit("A.sol", "a", "run-a")
+    queue.submit("B.sol", "b", "run-b", priority=5)
+    queue.submit("C.sol", "c", "run-c")
+    assert not queue.submit("A.sol", "a", "run-a")  # 同一个 run_id 不重复提交
+
+    claimed = [queue.claim("w")["run_id"] for _ in range(3)]
+    assert claimed == ["run-b", "run-a", "run-c"]
+    assert queue.claim("w") is None
+
+
+def test_claim_returns_the_job_with_source(queue):
+    queue.submit("A.sol", "contract A {}", "run-a", project_dir="/p", target_file="src/A.sol")
+    job = queue.claim("w1")
+    assert (job["source"], job["project_dir"], job["target_file"]) == ("contract A {}", "/p", "src/A.sol")
+    assert (job["status"], job["worker"], job["attempts"], job["rerun"]) == (RUNNING, "w1", 1, 0)
+
+
+def test_expired_lease_is_reclaimed_and_old_worker_is_fenced(queue):
+    queue.submit("A.sol", "a", "run-a")
+    job = queue.claim("w1", lease_seconds=0.05)
+    assert queue.claim("w2") is None  # 租约有效期内不会被其他 worker 领取
+    time.sleep(0.1)
+
+    again = queue.claim("w2")
+    assert (again["id"], again["attempts"]) == (job["id"], 2)
+    # 旧 worker 的续约和结果都不再生效
+    assert not queue.heartbeat(job["id"], "w1")
+    assert not queue.complete(job["id"], "w1", {"status": "failed"})
+    assert queue.complete(job["id"], "w2", {"status": "success"})
+    assert _status(queue, job["id"])["result"] == {"status": "success"}
+
+
+def test_heartbeat_extends_the_lease(queue):
+    queue.submit("A.sol", "a", "run-a")
+    job = queue.claim("w1", lease_seconds=0.05)
+    assert queue.heartbeat(job["id"], "w1", lease_seconds=60)
+    time.sleep(0.1)
+    assert queue.claim("w2") is None
+
+
+def test_failures_back_off_exponentially_then_fail(queue):
+    queue.submit("A.sol", "a", "run-a", max_attempts=3)
+    job = queue.claim("w")
+    assert queue.fail(job["id"], "w", "boom", retry_delay=0.05) == QUEUED
+    assert queue.claim("w") is None  # 退避期间不可领取
+    time.sleep(0.07)
+
+    job = queue.claim("w")
+    assert job["attempts"] == 2
+    started = time.time()
+    assert queue.fail(job["id"], "w", "boom", retry_delay=0.05) == QUEUED
+    available_at = queue._conn.execute("SELECT available_at FROM jobs WHERE id = ?", (job["id"],)).fetchone()[0]
+    assert available_at - started == pytest.approx(0.1, abs=0.02)  # 第二次失败等待 2 倍
+    time.sleep(0.12)
+
+    job = queue.claim("w")
+    assert queue.fail(job["id"], "w", "boom again", retry_delay=0.05) == FAILED
+    assert _status(queue, job["id"])["error"] == "boom again"
+    assert queue.pending() == 0
+
+
+def test_expired_lease_on_last_attempt_fails_the_job(queue):
+    queue.submit("A.sol", "a", "run-a", max_attempts=1)
+    job = queue.claim("w1", lease_seconds=0.01)
+    time.sleep(0.05)
+    assert queue.claim("w2") is None
+    assert _status(queue, job["id"])["status"] == FAILED
+
+
+def test_resubmit_requeues_finished_jobs_for_a_rerun(queue):
+    queue.submit("A.sol", "a", "run-a")
+    job = queue.claim("w")
+    queue.complete(job["id"], "w", {"status": "failed"})
+
+    assert not queue.submit("A.sol", "a", "run-a")
+    assert queue.submit("A.sol", "a", "run-a", priority=3, resubmit=True)
+    again = queue.claim("w")
+    assert (again["id"], again["attempts"], again["priority"], again["rerun"]) == (job["id"], 1, 3, 1)
+    # 运行中的任务不会被 resubmit 重置
+    assert not queue.submit("A.sol", "a", "run-a", resubmit=True)
+
+
+def test_stats(queue):
+    for name in ("a", "b", "c"):
+        queue.submit(f"{name}.sol", name, f"run-{name}")
+    job = queue.claim("w1")
+    queue.complete(job["id"], "w1", {"status": "success"})
+    queue.claim("w2")
+
+    stats = queue.stats()
+    assert stats["counts"] == {QUEUED: 1, RUNNING: 1, DONE: 1, FAILED: 0}
+    assert stats["per_worker"] == {"w1": 1}
+    assert stats["throughput_per_hour"] == 1
+
+
+def _drain(path: str, worker: str, claimed):
+    queue = JobQueue(path)
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            return
+        claimed.put(job["id"])
+        queue.complete(job["id"], worker, {"status": "success"})
+
+
+def test_concurrent_workers_never_claim_the_same_job(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(path)
+    for i in range(60):
+        queue.submit(f"{i}.sol", str(i), f"run-{i}")
+
+    claimed = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_drain, args=(path, f"w{i}", claimed)) for i in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(timeout=60)
+    ids = [claimed.get(timeout=5) for _ in range(60)]
+
+    assert sorted(ids) == sorted(set(ids)) and len(ids) == 60
+    assert queue.stats()["counts"][DONE] == 60
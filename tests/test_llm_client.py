@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.llm import cache as llm_cache
+from src.llm import client
+from src.llm import router as router_module
+from src.llm.router import configure_router
+from src.tools import telemetry
+from src.tools.budget import metering
+
+REPLY = "分析如下。\n```solidity\ncontract Exploit {}\n```\n后面是不需要付费的解释文字。" + "x" * 400
+
+
+class UsageLastLLM:
+    """和真实的流一样：usage 只在最后一块里"""
+
+    def __init__(self, reply: str = REPLY):
+        self.reply = reply
+        self.chunks_sent = 0
+
+    async def astream(self, messages):
+        prompt_text = "\n".join(str(m.content) for m in messages)
+        for i in range(0, len(self.reply), 16):
+            self.chunks_sent += 1
+            yield SimpleNamespace(content=self.reply[i:i + 16], usage_metadata=None)
+        yield SimpleNamespace(content="", usage_metadata={"input_tokens": len(prompt_text) // 4,
+                                                          "output_tokens": len(self.reply) // 4})
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    monkeypatch.setattr(router_module, "_router", None)  # 测试结束后恢复进程内的路由器
+    configure_router([{"name": "stub", "model": "stub-model"}])
+    monkeypatch.setattr(llm_cache, "cache_enabled", lambda: False)
+    llm = UsageLastLLM()
+    monkeypatch.setattr(client, "get_llm", lambda temperature=0.1, endpoint=None: llm)
+    return llm
+
+
+def _call(**kwargs):
+    prompt = ChatPromptTemplate.from_messages([("system", "你是智能合约黑客。"), ("user", "{source}")])
+
+    async def run():
+        with metering() as usage:
+            text = await client.astream_completion(prompt, {"source": "contract Bank {}" * 50}, tag="test", **kwargs)
+        return text, usage, client.get_llm_call_log()[-1]
+
+    return asyncio.run(run())
+
+
+def test_call_stopped_at_code_fence_still_charges_tokens(stub_llm):
+    text, usage, record = _call()
+    assert text.endswith("```") and "解释文字" not in text
+    assert record["early_stopped"] and record["tokens_estimated"]
+    assert usage.tokens > 0
+
+
+def test_full_stream_charges_reported_usage(stub_llm):
+    text, usage, record = _call(stop_at_code_fence=False)
+    assert text == REPLY
+    assert not record["tokens_estimated"]
+    assert usage.tokens == record["input_tokens"] + record["output_tokens"]
+
+
+def test_early_stopped_call_records_estimated_tokens_in_telemetry(stub_llm):
+    with telemetry.run_context(run_id="test-estimated-tokens"):
+        text, usage, record = _call()
+    summary = telemetry.summarize_run("test-estimated-tokens")
+    assert record["input_tokens"] > 0 and record["output_tokens"] == len(text) // 4
+    assert summary["input_tokens"] == record["input_tokens"]
+    assert summary["output_tokens"] == record["output_tokens"]
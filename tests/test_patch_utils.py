@@ -0,0 +1,84 @@
+import pytest
+
+from src.tools.patch_utils import PatchApplyError, apply_unified_diff, parse_unified_diff
+
+SOURCE = """contract Bank {
+    mapping(address => uint256) public balances;
+
+    function withdraw() public {
+        uint256 amount = balances[msg.sender];
+        (bool ok, ) = msg.sender.call{value: amount}("");
+        require(ok);
+        balances[msg.sender] = 0;
+    }
+}
+"""
+
+CEI_DIFF = """--- a/Target.sol
++++ b/Target.sol
+@@ -5,4 +5,4 @@
+         uint256 amount = balances[msg.sender];
++        balances[msg.sender] = 0;
+         (bool ok, ) = msg.sender.call{value: amount}("");
+         require(ok);
+-        balances[msg.sender] = 0;
+     }
+"""
+
+
+def test_parse_hunks():
+    hunks = parse_unified_diff(CEI_DIFF)
+    assert len(hunks) == 1
+    assert hunks[0]["old_start"] == 5
+    assert hunks[0]["old"][-1] == "    }"
+    assert "        balances[msg.sender] = 0;" in hunks[0]["new"]
+
+
+def test_apply_moves_state_update_before_call():
+    patched = apply_unified_diff(SOURCE, CEI_DIFF)
+    lines = patched.splitlines()
+    assert lines.index("        balances[msg.sender] = 0;") < lines.index(
+        '        (bool ok, ) = msg.sender.call{value: amount}("");')
+    assert patched.endswith("}\n")
+
+
+def test_wrong_line_numbers_are_only_a_hint():
+    assert apply_unified_diff(SOURCE, CEI_DIFF.replace("@@ -5,4 +5,4 @@", "@@ -40,4 +40,4 @@")) == \
+        apply_unified_diff(SOURCE, CEI_DIFF)
+
+
+def test_whitespace_fallback():
+    # LLM 改写了缩进：精确匹配失败后忽略行首尾空白定位
+    diff = """@@ -7,1 +7,1 @@
+-  require(ok);
++  require(ok, "transfer failed");
+"""
+    patched = apply_unified_diff(SOURCE, diff)
+    assert 'require(ok, "transfer failed");' in patched
+    assert "require(ok);" not in patched
+
+
+def test_line_hint_picks_the_nearest_duplicate():
+    source = "a\nx = 1;\nb\nc\nd\nx = 1;\ne\n"
+    near_second = apply_unified_diff(source, "@@ -6,1 +6,1 @@\n-x = 1;\n+x = 2;\n")
+    near_first = apply_unified_diff(source, "@@ -2,1 +2,1 @@\n-x = 1;\n+x = 2;\n")
+    assert near_second == "a\nx = 1;\nb\nc\nd\nx = 2;\ne\n"
+    assert near_first == "a\nx = 2;\nb\nc\nd\nx = 1;\ne\n"
+
+
+def test_offset_from_earlier_hunks_shifts_later_hints():
+    source = "".join(f"line{i}\n" for i in range(1, 11)) + "line3\n"
+    diff = "@@ -1,1 +1,3 @@\n line1\n+added1\n+added2\n@@ -11,1 +13,1 @@\n-line3\n+changed\n"
+    patched = apply_unified_diff(source, diff).splitlines()
+    assert patched[4] == "line3"
+    assert patched[-1] == "changed"
+
+
+@pytest.mark.parametrize("diff", [
+    "no hunks here",
+    "@@ -1,1 +1,1 @@\n-function missing() {}\n+function missing() external {}\n",
+    "@@ -1,1 +1,1 @@\n-contract Bank {\n+contract Bank {\n",
+])
+def test_unusable_diffs_raise(diff):
+    with pytest.raises(PatchApplyError):
+        apply_unified_diff(SOURCE, diff)
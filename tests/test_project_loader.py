@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from src.tools import project_loader
+from src.tools.file_utils import read_from_workspace, save_to_workspace
+from src.tools.project_loader import ProjectIndex, affected_files, link_project, resolve_target, target_shim
+
+FILES = {
+    "foundry.toml": '[profile.default]\nremappings = ["@oz/=lib/openzeppelin/contracts/"]\n',
+    "src/Vault.sol": 'pragma solidity ^0.8.19;\nimport "./Base.sol";\nimport "@oz/token/IERC20.sol";\n'
+                     "contract Vault is Base, Ownable { }\n",
+    "src/Base.sol": 'pragma solidity ^0.8.0;\nimport {Ownable} from "@oz/access/Ownable.sol";\n'
+                    "abstract contract Base {}\n",
+    "src/Unrelated.sol": "pragma solidity ^0.8.0;\nlibrary Math {}\n",
+    "src/Router.sol": 'pragma solidity ^0.8.0;\nimport "./Vault.sol";\ncontract Router {}\n',
+    "lib/openzeppelin/contracts/token/IERC20.sol": "pragma solidity ^0.8.0;\ninterface IERC20 {}\n",
+    "lib/openzeppelin/contracts/access/Ownable.sol": "pragma solidity ^0.8.0;\ncontract Ownable {}\n",
+    "lib/openzeppelin/contracts/utils/NeverImported.sol": "pragma solidity ^0.8.0;\ncontract NeverImported {}\n",
+}
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    for rel, text in FILES.items():
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_text(text)
+    return str(root)
+
+
+def test_index_resolves_relative_remapped_and_named_imports(project):
+    index = ProjectIndex.build(project)
+    assert index.entry("src/Vault.sol")["imports"] == ["src/Base.sol", "lib/openzeppelin/contracts/token/IERC20.sol"]
+    assert index.entry("src/Base.sol")["imports"] == ["lib/openzeppelin/contracts/access/Ownable.sol"]
+    assert index.entry("src/Vault.sol")["contracts"] == {"Vault": ["Base", "Ownable"]}
+    assert index.entry("src/Unrelated.sol")["contracts"] == {"Math": []}
+    # 依赖库只索引被 import 到的文件
+    assert index.entry("lib/openzeppelin/contracts/access/Ownable.sol")["origin"] == "lib"
+    assert "lib/openzeppelin/contracts/utils/NeverImported.sol" not in index.files
+
+
+def test_dependencies_and_dependents(project):
+    index = ProjectIndex.build(project)
+    assert index.dependencies(["src/Vault.sol"]) == [
+        "lib/openzeppelin/contracts/access/Ownable.sol", "lib/openzeppelin/contracts/token/IERC20.sol",
+        "src/Base.sol", "src/Vault.sol",
+    ]
+    assert index.dependents(["src/Base.sol"]) == ["src/Router.sol", "src/Vault.sol"]
+    assert index.dependents(["src/Unrelated.sol"]) == []
+
+
+def test_resolve_target_by_path_or_contract_name(project):
+    assert resolve_target(project, "src/Vault.sol") == "src/Vault.sol"
+    assert resolve_target(project, "Vault") == "src/Vault.sol"
+    assert resolve_target(project, "Ownable") == "lib/openzeppelin/contracts/access/Ownable.sol"
+    assert resolve_target(project, "Missing") is None
+
+
+def test_target_shim_keeps_the_target_pragma():
+    shim = target_shim('pragma solidity >=0.8.0 <0.9.0;\ncontract A {}\n', "src/A.sol")
+    assert shim == '// SPDX-License-Identifier: UNLICENSED\npragma solidity >=0.8.0 <0.9.0;\nimport "./src/A.sol";\n'
+
+
+def test_link_project_into_workspace(project, tmp_path):
+    workspace = str(tmp_path / "run")
+    link_project(project, workspace, "src/Vault.sol")
+
+    assert os.path.samefile(os.path.join(project, "src/Vault.sol"), os.path.join(workspace, "src/Vault.sol"))
+    assert read_from_workspace("Target.sol", workspace) == target_shim(FILES["src/Vault.sol"], "src/Vault.sol")
+    assert "pragma solidity ^0.8.19;" in read_from_workspace("Target.sol", workspace)
+    assert read_from_workspace("remappings.txt", workspace) == "@oz/=lib/openzeppelin/contracts/\n"
+    assert affected_files(workspace, ["src/Base.sol"]) == ["src/Base.sol", "src/Router.sol", "src/Vault.sol"]
+
+    # 蓝队的补丁只写进 workspace，不能改到原工程
+    save_to_workspace("src/Vault.sol", "pragma solidity ^0.8.19;\ncontract Vault {}\n", workspace)
+    assert read_from_workspace("src/Vault.sol", project) == FILES["src/Vault.sol"]
+
+
+def test_index_cache_only_reparses_changed_files(project, monkeypatch, tmp_path):
+    monkeypatch.setattr(project_loader, "CACHE_DIR", str(tmp_path / "cache"))
+    assert project_loader.load_project(project).parsed == 6
+
+    path = os.path.join(project, "src/Base.sol")
+    with open(path, "a") as f:
+        f.write("// touched\n")
+    assert project_loader.load_project(project).parsed == 1
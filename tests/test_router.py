@@ -0,0 +1,217 @@
+import asyncio
+import time
+
+import pytest
+
+from src.llm import router as router_module
+from src.llm.router import Endpoint, LLMRouter, TokenBucket
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests")
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def _endpoint(name: str, **kwargs) -> Endpoint:
+    return Endpoint(name, "http://localhost", f"model-{name}", **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(router_module, "LLM_MAX_RETRIES", 3)
+    monkeypatch.setattr(router_module, "LLM_OUTPUT_TOKENS_ESTIMATE", 0)
+
+
+# === 令牌桶 ===
+def test_token_bucket_takes_then_reports_wait():
+    bucket = TokenBucket(60)  # 每秒 1 个
+    assert bucket.try_take(60) == 0.0
+    assert bucket.try_take(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(6000)  # 每秒 100 个
+    bucket.try_take(6000)
+    time.sleep(0.05)
+    assert bucket.try_take(3) == 0.0
+
+
+def test_token_bucket_lets_oversized_requests_through_when_full():
+    bucket = TokenBucket(60)
+    assert bucket.try_take(500) == 0.0
+    # 欠账: 还清之前阻塞
+    assert bucket.try_take(1) > 400
+
+
+def test_token_bucket_settle_refunds_overestimates():
+    bucket = TokenBucket(60)
+    bucket.try_take(60)
+    bucket.settle(-30)  # 实际用量比预扣少 30
+    assert bucket.try_take(30) == 0.0
+
+
+# === 路由 / 重试 ===
+def test_picks_least_loaded_endpoint_in_config_order():
+    a, b = _endpoint("a"), _endpoint("b")
+    router = LLMRouter([a, b])
+    assert router.pick() is a
+    a.in_flight = 1
+    assert router.pick() is b
+    b.cool_down(60)
+    assert router.pick() is a
+
+
+def test_concurrent_calls_spread_across_endpoints():
+    router = LLMRouter([_endpoint("a"), _endpoint("b")])
+
+    async def attempt(endpoint):
+        await asyncio.sleep(0.02)
+        return endpoint.name
+
+    async def main():
+        return await asyncio.gather(*(router.call(attempt) for _ in range(4)))
+
+    served = [endpoint.name for _, endpoint, _ in asyncio.run(main())]
+    assert sorted(served) == ["a", "a", "b", "b"]
+
+
+def test_cancel_before_the_request_starts_releases_the_endpoint():
+    a = _endpoint("a")
+    router = LLMRouter([a])
+
+    async def attempt(endpoint):
+        raise AssertionError("请求不应开始")
+
+    async def main():
+        # 例如对冲的落败者或外层 wait_for(LLM_DEADLINE) 超时：任务还没执行第一步就被取消
+        task = router._start(a, attempt, 0, None)
+        assert a.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert a.in_flight == 0
+
+
+def test_retryable_errors_move_to_another_endpoint():
+    a, b = _endpoint("a"), _endpoint("b")
+    router = LLMRouter([a, b])
+    calls = []
+
+    async def attempt(endpoint):
+        calls.append(endpoint.name)
+        if endpoint is a:
+            raise RateLimited(retry_after="30")
+        return "ok"
+
+    result, endpoint, routing = asyncio.run(router.call(attempt))
+    assert (result, endpoint, routing) == ("ok", b, {"retries": 1, "hedged": False})
+    assert calls == ["a", "b"]
+    assert a.stats["errors"] == 1
+    assert a.cooldown_until > time.monotonic() + 20  # 按 Retry-After 冷却
+
+
+def test_non_retryable_errors_raise_immediately():
+    router = LLMRouter([_endpoint("a"), _endpoint("b")])
+    calls = []
+
+    async def attempt(endpoint):
+        calls.append(endpoint.name)
+        raise BadRequest("bad prompt")
+
+    with pytest.raises(BadRequest):
+        asyncio.run(router.call(attempt))
+    assert calls == ["a"]
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_MAX_RETRIES", 2)
+    router = LLMRouter([_endpoint("a")])
+    calls = []
+
+    async def attempt(endpoint):
+        calls.append(endpoint.name)
+        raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        asyncio.run(router.call(attempt))
+    assert len(calls) == 3
+
+
+def test_token_usage_is_settled_against_the_estimate():
+    endpoint = _endpoint("a", tpm=6000)
+    router = LLMRouter([endpoint])
+
+    async def attempt(endpoint):
+        return "ok"
+
+    asyncio.run(router.call(attempt, estimated_tokens=1000, count_tokens=lambda result: 100))
+    assert endpoint.tokens.tokens == pytest.approx(5900, abs=5)
+
+
+# === 对冲 ===
+def _slow_primary_router(monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_HEDGE", True)
+    monkeypatch.setattr(router_module, "LLM_HEDGE_MIN_SAMPLES", 3)
+    monkeypatch.setattr(router_module, "LLM_HEDGE_MIN_DELAY", 0.01)
+    primary, backup = _endpoint("primary"), _endpoint("backup")
+    for _ in range(3):
+        primary.record(0.02)
+    return LLMRouter([primary, backup]), primary, backup
+
+
+def test_hedges_to_another_endpoint_after_p95(monkeypatch):
+    router, primary, backup = _slow_primary_router(monkeypatch)
+    cancelled = []
+
+    async def attempt(endpoint):
+        try:
+            await asyncio.sleep(5 if endpoint is primary else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(endpoint.name)
+            raise
+        return endpoint.name
+
+    async def main():
+        result = await router.call(attempt)
+        await asyncio.sleep(0)  # 让被取消的请求处理 CancelledError
+        return result
+
+    result, endpoint, routing = asyncio.run(main())
+    assert (result, endpoint, routing["hedged"]) == ("backup", backup, True)
+    assert backup.stats["hedges"] == 1 and backup.stats["hedge_wins"] == 1
+    assert cancelled == ["primary"]
+    assert primary.in_flight == 0 and backup.in_flight == 0
+
+
+def test_no_hedge_when_primary_answers_in_time(monkeypatch):
+    router, primary, backup = _slow_primary_router(monkeypatch)
+
+    async def attempt(endpoint):
+        return endpoint.name
+
+    result, endpoint, routing = asyncio.run(router.call(attempt))
+    assert (endpoint, routing["hedged"]) == (primary, False)
+    assert backup.stats["hedges"] == 0
+
+
+def test_no_hedge_without_latency_samples(monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_HEDGE", True)
+    primary, backup = _endpoint("primary"), _endpoint("backup")
+    router = LLMRouter([primary, backup])
+
+    async def attempt(endpoint):
+        await asyncio.sleep(0.05)
+        return endpoint.name
+
+    _, endpoint, routing = asyncio.run(router.call(attempt))
+    assert (endpoint, routing["hedged"]) == (primary, False)
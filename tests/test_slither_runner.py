@@ -0,0 +1,43 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from src.tools import slither_runner
+
+SOURCE = "pragma solidity ^0.8.0;\ncontract Bank {}\n"
+
+
+@pytest.fixture
+def sandbox(monkeypatch, tmp_path):
+    """把容器换成记录命令的桩，快照目录放到临时目录"""
+    monkeypatch.setattr(slither_runner, "SNAPSHOT_DIR", str(tmp_path / ".slither"))
+    monkeypatch.setattr(slither_runner, "resolve_version", lambda sources: "0.8.19")
+    monkeypatch.setattr(slither_runner, "container_solc_path", lambda version: None)
+    seen = []
+
+    def run(cmd, workdir, timeout=None):
+        seen.append(sorted(os.listdir(workdir)))
+        if run.error:
+            raise run.error
+        return SimpleNamespace(stdout='{"success": true, "results": {}}', stderr="", exit_code=0)
+
+    run.error = None
+    monkeypatch.setattr(slither_runner, "run_in_sandbox", run)
+    return run, seen
+
+
+def test_snapshot_is_removed_after_scan(sandbox):
+    run, seen = sandbox
+    result = slither_runner._scan(SOURCE)
+    assert result["ok"]
+    assert seen == [[f"{slither_runner.source_key(SOURCE)[:16]}.sol"]]
+    assert os.listdir(slither_runner.SNAPSHOT_DIR) == []
+
+
+def test_snapshot_is_removed_when_the_scan_fails(sandbox):
+    run, seen = sandbox
+    run.error = RuntimeError("container died")
+    result = slither_runner._scan(SOURCE)
+    assert not result["ok"] and "container died" in result["report"]
+    assert os.listdir(slither_runner.SNAPSHOT_DIR) == []
@@ -0,0 +1,65 @@
+import pytest
+
+from src.tools import solc_resolver
+from src.tools.solc_resolver import parse_constraint, parse_version, resolve_version, satisfies
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """本地编译器仓库: 只需要 <版本>/solc-<版本> 文件存在"""
+    for version in ("0.6.12", "0.7.6", "0.8.19", "0.8.24"):
+        (tmp_path / version).mkdir()
+        (tmp_path / version / f"solc-{version}").write_text("")
+    (tmp_path / "0.8.30").mkdir()  # 没有二进制文件的目录不算
+    monkeypatch.setattr(solc_resolver, "SOLC_STORE", str(tmp_path))
+    monkeypatch.setattr(solc_resolver, "SOLC_VERSION", "0.8.20")
+    solc_resolver.available_versions.cache_clear()
+    solc_resolver._resolve.cache_clear()
+    yield tmp_path
+    solc_resolver.available_versions.cache_clear()
+    solc_resolver._resolve.cache_clear()
+
+
+@pytest.mark.parametrize("expression, version, expected", [
+    ("^0.8.0", "0.8.24", True),
+    ("^0.8.0", "0.9.0", False),
+    ("^0.8.0", "0.7.6", False),
+    ("^0.0.5", "0.0.6", False),
+    ("~0.7.2", "0.7.6", True),
+    ("~0.7.2", "0.8.0", False),
+    (">=0.6.0 <0.8.0", "0.7.6", True),
+    (">=0.6.0 <0.8.0", "0.8.0", False),
+    ("0.8.19", "0.8.19", True),
+    ("=0.8.19", "0.8.20", False),
+    ("0.8", "0.8.24", True),
+    ("0.7.0 - 0.7.6", "0.7.6", True),
+    ("0.7.0 - 0.7.6", "0.8.0", False),
+    ("^0.6.0 || ^0.8.0", "0.8.1", True),
+    ("^0.6.0 || ^0.8.0", "0.7.6", False),
+])
+def test_constraint_matching(expression, version, expected):
+    assert satisfies(parse_version(version), parse_constraint(expression)) is expected
+
+
+def test_highest_version_in_store_wins(store):
+    assert solc_resolver.available_versions() == ("0.8.24", "0.8.19", "0.7.6", "0.6.12")
+    assert resolve_version(["pragma solidity ^0.8.0;"]) == "0.8.24"
+    assert resolve_version(["pragma solidity >=0.6.0 <0.8.0;"]) == "0.7.6"
+
+
+def test_all_sources_constrain_the_choice(store):
+    sources = ["pragma solidity ^0.8.0;\ncontract A {}", "pragma solidity >=0.8.10 <0.8.20;\ncontract B {}"]
+    assert resolve_version(sources) == "0.8.19"
+
+
+def test_falls_back_to_image_version(store):
+    # 仓库中没有匹配的版本时使用镜像自带的版本
+    assert resolve_version(["pragma solidity 0.8.20;"]) == "0.8.20"
+    # 没有任何版本满足时同样退回镜像版本，由编译器报告不匹配
+    assert resolve_version(["pragma solidity ^0.5.0;"]) == "0.8.20"
+    assert resolve_version(["contract NoPragma {}"]) == "0.8.24"
+
+
+def test_container_path_only_for_store_versions(store):
+    assert solc_resolver.container_solc_path("0.8.19") == "/opt/solc-store/0.8.19/solc-0.8.19"
+    assert solc_resolver.container_solc_path("0.8.20") is None